@@ -0,0 +1,65 @@
+"""benchmark of the hybrid level to pressure/altitude kernel against the legacy tile/roll-based implementation
+
+Run from the repository root with: python -m benchmarks.bench_hybrid_levels
+"""
+
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from mwr_l12l2.model.ecmwf import hybrid_levels
+from tests.test_hybrid_levels import legacy_hybrid_to_z, synthetic_inputs
+
+N_TIME = 27  # forecast steps
+N_STATIONS = 8  # stations stacked in one call of the vectorised kernel
+N_GRID = 3  # grid points in latitude and longitude around each station
+N_REPEAT = 5
+
+
+def run_legacy(stations):
+    """legacy implementation can only be run station by station"""
+    return [legacy_hybrid_to_z(*inputs)[2] for inputs in stations]
+
+
+def run_kernel(a, b, p_surf, t, q, zg_surf, dtype):
+    p_half, _ = hybrid_levels.hybrid_to_p(a, b, p_surf, dtype=dtype)
+    return hybrid_levels.p_to_z(p_half, t, q, zg_surf, dtype=dtype)
+
+
+def run_kernel_per_station(stations, dtype):
+    """same loop over stations as for legacy for comparing peak memory"""
+    return [run_kernel(a, b, np.exp(lnsp), t, q, zg_surf, dtype) for a, b, lnsp, t, q, zg_surf in stations]
+
+
+def measure(func, *args):
+    """return best run time in s and peak memory allocated during one run in MB"""
+    run_time = min(timeit.repeat(lambda: func(*args), number=1, repeat=N_REPEAT))
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return run_time, peak / 1e6
+
+
+def main():
+    stations = [synthetic_inputs(n_time=N_TIME, n_lat=N_GRID, n_lon=N_GRID, seed=seed) for seed in range(N_STATIONS)]
+    a, b = stations[0][:2]
+    lnsp, t, q = [np.stack([inputs[ind] for inputs in stations], axis=2) for ind in range(2, 5)]
+    zg_surf = np.stack([inputs[5] for inputs in stations])
+    p_surf = np.exp(lnsp)
+
+    print('{} levels, {} steps, {} stations with {}x{} grid points'.format(
+        len(a) - 1, N_TIME, N_STATIONS, N_GRID, N_GRID))
+    print('{:<22}{:>12}{:>18}'.format('implementation', 'time (ms)', 'peak memory (MB)'))
+    results = {'legacy per station': measure(run_legacy, stations),
+               'float64 per station': measure(run_kernel_per_station, stations, np.float64),
+               'float32 per station': measure(run_kernel_per_station, stations, np.float32),
+               'float64 stacked': measure(run_kernel, a, b, p_surf, t, q, zg_surf, np.float64),
+               'float32 stacked': measure(run_kernel, a, b, p_surf, t, q, zg_surf, np.float32)}
+    for name, (run_time, peak) in results.items():
+        print('{:<22}{:>12.1f}{:>18.1f}'.format(name, run_time * 1e3, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""benchmark of writing the MWR input file for TROPoe and reading it back like TROPoe does, per on-disk format
+
+The legacy variant writes the complete L1 dataset with default settings of :meth:`xarray.Dataset.to_netcdf`. Reading
+is done with :mod:`netCDF4` for the fields used by TROPoe, which is how TROPoe reads its inputs.
+
+Run from the repository root with: python -m benchmarks.bench_tropoe_input
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import timeit
+
+import netCDF4
+
+from mwr_l12l2.retrieval.tropoe_input import MWR_VARS, TROPOE_INPUT_FORMATS, write_tropoe_input
+from mwr_l12l2.utils.data_utils import get_from_nc_files
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+MWR_FILES = sorted(glob.glob(os.path.join(abs_file_path('tests/data/mwr/'), 'MWR_1C01_0-20000-0-10393_A*.nc')))
+TROPOE_FIELDS = ['time', 'frequency', 'tb', 'ele', 'azi', 'air_temperature', 'air_pressure', 'station_altitude']
+N_REPEAT = 10
+
+
+def read_like_tropoe(file):
+    """read the fields used by TROPoe completely to memory"""
+    with netCDF4.Dataset(file) as nc:
+        return {var: nc[var][:] for var in TROPOE_FIELDS if var in nc.variables}
+
+
+def measure(write, file):
+    """return best write and read time in ms and file size in kB"""
+    write_time = min(timeit.repeat(write, number=1, repeat=N_REPEAT))
+    read_time = min(timeit.repeat(lambda: read_like_tropoe(file), number=1, repeat=N_REPEAT))
+    return write_time * 1e3, read_time * 1e3, os.path.getsize(file) / 1e3
+
+
+def main():
+    data = get_from_nc_files(MWR_FILES)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        file = os.path.join(tmp_dir, 'mwr.nc')
+        results = {'legacy to_netcdf': measure(lambda: data.to_netcdf(file), file)}
+        for key, nc_format in TROPOE_INPUT_FORMATS.items():
+            results[key] = measure(lambda: write_tropoe_input(data, file, MWR_VARS, nc_format), file)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print('{} L1 files, {} samples'.format(len(MWR_FILES), data.time.size))
+    print('{:<18}{:>12}{:>12}{:>12}{:>12}'.format('format', 'write (ms)', 'read (ms)', 'total (ms)', 'size (kB)'))
+    for name, (write_time, read_time, size) in results.items():
+        print('{:<18}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.0f}'.format(name, write_time, read_time, write_time + read_time,
+                                                                  size))
+
+
+if __name__ == '__main__':
+    main()
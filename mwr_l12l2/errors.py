@@ -19,6 +19,10 @@ class MWRRetrievalError(MWRError):
     """Raised if something with the TROPoe retrieval failed"""
 
 
+class TropoeContainerError(MWRRetrievalError):
+    """Raised if a long-lived TROPoe container is missing or not running"""
+
+
 class MWROutputError(MWRError):
     """Raised when something with the output file goes wrong"""
 
@@ -41,11 +45,28 @@ class MissingDataError(MWRDataError):
     """Raised if some expected data is not present"""
 
 
+class AdmissionError(MissingDataError):
+    """Raised if a retrieval is rejected before loading any data as it cannot succeed
+
+    Args:
+        msg: error message
+        reason (optional): short reason of the rejection for aggregating the rejections of several retrievals
+    """
+
+    def __init__(self, msg, reason=None):
+        super().__init__(msg)
+        self.reason = reason
+
+
 ###############################
 class FilenameError(MWRFileError):
     """Raised if the filename does not correspond to the expected pattern"""
 
 
+class LeaseError(MWRFileError):
+    """Raised if a lease on a shared resource (e.g. an instrument) is held by another host"""
+
+
 ##############################
 class OutputDimensionError(MWROutputError):
     """Raised if requested output dimensions do not match data"""
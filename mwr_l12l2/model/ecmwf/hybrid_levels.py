@@ -0,0 +1,137 @@
+import numpy as np
+
+from mwr_l12l2.errors import MWRInputError
+
+GAS_CONST = 287.06  # gas constant for dry air (Rd)
+G = 9.80665  # gravitational acceleration of Earth
+VIRT_TEMP_FACTOR = 0.609133  # Rv/Rd - 1 for the computation of the virtual temperature
+P_TOP = 0.1  # pressure (in Pa) assumed as upper boundary of the uppermost level
+
+
+def hybrid_to_p(a, b, p_surf, axis=1, dtype=np.float64, p_half=None, p=None):
+    """compute pressure (in Pa) of half and full levels from the coefficients of hybrid model levels
+
+    The coefficients are broadcast along all other axes instead of being tiled to the full size of the outputs. Any
+    number of leading or trailing dimensions is supported, hence several stations can be computed in one call by
+    stacking them along an extra dimension, e.g. (time, level, station, lat, lon).
+
+    Args:
+        a: coefficient a of the half levels (1d, length n_levels+1, from top to bottom)
+        b: coefficient b of the half levels (1d, length n_levels+1, from top to bottom)
+        p_surf: surface pressure (in Pa) with size 1 along the level axis, e.g. with dims (time, 1, lat, lon)
+        axis (optional): level axis. Defaults to 1
+        dtype (optional): float type used for computation and outputs. Use :class:`numpy.float32` to halve memory
+            usage at reduced accuracy. Defaults to :class:`numpy.float64`
+        p_half (optional): preallocated output for the pressure of the half levels. Shape of p_surf with n_levels+1
+            along the level axis. Defaults to None, i.e. allocate a new array
+        p (optional): preallocated output for the pressure of the full levels. Shape of p_surf with n_levels along the
+            level axis. Defaults to None, i.e. allocate a new array
+
+    Returns:
+        p_half: pressure of the half levels
+        p: pressure of the full levels, taken as mean of the half levels above and below
+    """
+    p_surf = np.asarray(p_surf, dtype=dtype)
+    axis = axis % p_surf.ndim
+    p_half = _output(p_half, p_surf.shape, axis, len(a), dtype)
+    p = _output(p, p_surf.shape, axis, len(a) - 1, dtype)
+
+    np.multiply(_along(b, p_surf.ndim, axis, dtype), p_surf, out=p_half)
+    p_half += _along(a, p_surf.ndim, axis, dtype)
+
+    np.add(p_half[_levels(axis, 1, None)], p_half[_levels(axis, None, -1)], out=p)
+    p /= 2
+    return p_half, p
+
+
+def p_to_z(p_half, t, q, zg_surf, axis=1, dtype=np.float64, z=None):
+    """transform pressure of half levels to geometrical altitude (in m) of full levels
+
+    according to: https://confluence.ecmwf.int/display/CKB/ERA5%3A+compute+pressure+and+geopotential+on+model+levels%2C+geopotential+height+and+geometric+height
+
+    The virtual temperature is computed once and all intermediate results are kept in three work arrays of the size of
+    the output.
+
+    Args:
+        p_half: pressure of half levels (in Pa) as returned by :func:`hybrid_to_p`
+        t: temperature (in K) of full levels, same shape as p with n_levels along the level axis
+        q: specific humidity (in kg/kg) of full levels, same shape as t
+        zg_surf: geopotential of the surface (in m2/s2). Must be broadcastable to the shape of t without the level
+            axis, e.g. (lat, lon) or (time, lat, lon) for dims (time, level, lat, lon) of t
+        axis (optional): level axis. Defaults to 1
+        dtype (optional): float type used for computation and output. Defaults to :class:`numpy.float64`
+        z (optional): preallocated output. Shape of t. Defaults to None, i.e. allocate a new array
+
+    Returns:
+        geometrical altitude of the full levels
+    """  # noqa: E501
+    # TODO: check whole function with hypsometric equation and possibly re-write from scratch using it (clearer)
+    p_half = np.asarray(p_half, dtype=dtype)
+    axis = axis % p_half.ndim
+    n_levels = p_half.shape[axis] - 1
+    z = _output(z, p_half.shape, axis, n_levels, dtype)
+    full = _levels(axis, None, -1)  # half levels above full levels, i.e. same index as full levels
+    first = _levels(axis, 0, 1)  # uppermost full level
+    below = _levels(axis, 1, None)  # remaining full levels
+
+    tv = virtual_temperature(t, q, dtype=dtype)
+
+    # log of pressure ratio between half levels below and above each full level. Uppermost level bounded by P_TOP
+    dlogp = np.empty_like(tv)
+    np.divide(p_half[_levels(axis, 2, None)], p_half[_levels(axis, 1, -1)], out=dlogp[below])
+    np.divide(p_half[_levels(axis, 1, 2)], P_TOP, out=dlogp[first])
+    np.log(dlogp, out=dlogp)
+
+    # difference of geopotential between half levels with surface geopotential appended, integrated from surface
+    zg_half = np.empty(p_half.shape, dtype=dtype)
+    np.multiply(tv, GAS_CONST, out=zg_half[full])
+    zg_half[full] *= dlogp
+    zg_half[(slice(None),) * axis + (-1,)] = zg_surf
+    zg_half_rev = zg_half[_levels(axis, None, None, -1)]
+    np.cumsum(zg_half_rev, axis=axis, out=zg_half_rev)
+
+    # alpha*Rd*Tv for the offset of full levels from the half levels below, computed in output array
+    np.subtract(p_half[_levels(axis, 2, None)], p_half[_levels(axis, 1, -1)], out=z[below])
+    np.divide(p_half[_levels(axis, 2, None)], z[below], out=z[below])
+    z[below] *= dlogp[below]
+    np.subtract(1, z[below], out=z[below])
+    z[first] = -np.log(2)
+    z *= GAS_CONST
+    z *= tv
+
+    # geopotential of full levels transformed to geometrical altitude
+    np.subtract(zg_half[_levels(axis, 1, None)], z, out=z)
+    z /= G
+    return z
+
+
+def virtual_temperature(t, q, dtype=np.float64):
+    """return virtual temperature from temperature (in K) and specific humidity (in kg/kg)"""
+    tv = np.multiply(np.asarray(q, dtype=dtype), VIRT_TEMP_FACTOR, dtype=dtype)
+    tv += 1
+    tv *= np.asarray(t, dtype=dtype)
+    return tv
+
+
+def _levels(axis, start, stop, step=None):
+    """index selecting a slice along the level axis"""
+    return (slice(None),) * axis + (slice(start, stop, step),)
+
+
+def _along(coeff, ndim, axis, dtype):
+    """reshape 1d level coefficients for broadcasting along all axes but the level axis"""
+    shape = [1] * ndim
+    shape[axis] = -1
+    return np.asarray(coeff, dtype=dtype).reshape(shape)
+
+
+def _output(out, shape, axis, n_levels, dtype):
+    """check a preallocated output array or allocate a new one if None"""
+    shape = list(shape)
+    shape[axis] = n_levels
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if list(out.shape) != shape or out.dtype != dtype:
+        raise MWRInputError('preallocated output has shape {} and type {} but {} and {} are needed'.format(
+            out.shape, out.dtype, tuple(shape), np.dtype(dtype)))
+    return out
@@ -0,0 +1,132 @@
+import glob
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+from mwr_l12l2.log import logger
+from mwr_l12l2.model.ecmwf.model_profiles import model_height_limit, model_profiles_file, precompute_model_profiles
+from mwr_l12l2.model.ecmwf.station_meta import station_meta_dir
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path, concat_filename
+
+MARKER_EXT = '.done'  # extension appended to the model profiles product for its completion marker
+
+
+def ingest_forecasts(conf, processes=None):
+    """compute the model profiles product of all new forecasts in model_dir in a pool of worker processes
+
+    A forecast counts as ingested once a completion marker has been written next to its product. The marker records
+    the modification times of the forecast and z file, hence forecasts which have been replaced are ingested again.
+    Retrievals then only read the product (see :func:`mwr_l12l2.model.ecmwf.model_profiles.get_model_profiles`)
+    instead of interpreting the forecast themselves.
+
+    Args:
+        conf: retrieval configuration file or dictionary
+        processes (optional): number of worker processes. Defaults to None, i.e. the number of CPUs of the machine.
+            Never more processes than new forecasts are started.
+
+    Returns:
+        list of product files which have been ingested successfully
+    """
+    if not isinstance(conf, dict):
+        conf = get_retrieval_config(abs_file_path(conf))
+    z_max = model_height_limit(conf)
+    meta_dir = station_meta_dir(conf)
+    tasks = []
+    for file_fc, file_zg in forecast_files(conf):
+        product_file = model_profiles_file(conf, file_fc)
+        if not is_ingested(product_file, file_fc, file_zg):
+            tasks.append((file_fc, file_zg, product_file, z_max, meta_dir))
+    if not tasks:
+        return []
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(tasks))
+    logger.info('Ingesting {} new forecast files using {} processes'.format(len(tasks), processes))
+    if processes == 1:
+        results = [ingest_forecast(task) for task in tasks]
+    else:
+        # spawn fresh workers as forking a process which has used netCDF/HDF5 or dask threads may deadlock
+        with mp.get_context('spawn').Pool(processes=processes) as workers:
+            results = list(workers.imap_unordered(ingest_forecast, tasks, chunksize=1))
+
+    ingested = []
+    for product_file, err_msg in results:
+        if err_msg is None:
+            ingested.append(product_file)
+        else:
+            logger.error('Could not ingest forecast for {}: {}'.format(product_file, err_msg))
+    return ingested
+
+
+def ingest_forecast(task):
+    """compute the model profiles product of one forecast and write its completion marker
+
+    Args:
+        task: tuple (file_fc, file_zg, product_file, z_max, meta_dir)
+
+    Returns:
+        tuple (product_file, error message or None if successful)
+    """
+    file_fc, file_zg, product_file, z_max, meta_dir = task
+    time_start = time.time()
+    try:
+        precompute_model_profiles(file_fc, file_zg, product_file, z_max=z_max, meta_dir=meta_dir)
+        write_marker(product_file, file_fc, file_zg, time.time() - time_start)
+    except Exception as e:  # report any error to parent process instead of breaking the pool
+        return product_file, '{}: {}'.format(type(e).__name__, e)
+    return product_file, None
+
+
+def forecast_files(conf):
+    """get list of tuples (file_fc, file_zg) for all forecast files in model_dir whose z file is available"""
+    data_conf = conf['data']
+    pattern_fc = '{}*{}{}'.format(data_conf['model_fc_file_prefix'], data_conf['model_fc_file_suffix'],
+                                  data_conf['model_fc_file_ext'])
+    files = []
+    for file_fc in sorted(glob.glob(os.path.join(data_conf['model_dir'], pattern_fc))):
+        # fc files are named {prefix}{wigos}_{inst_id}_{timestamp}{suffix}{ext}, the z file is not dated
+        wigos, inst_id = os.path.basename(file_fc)[len(data_conf['model_fc_file_prefix']):].split('_')[:2]
+        file_zg = os.path.join(data_conf['model_dir'], concat_filename(data_conf['model_z_file_prefix'], wigos,
+                                                                       inst_id, ext=data_conf['model_z_file_ext']))
+        if os.path.exists(file_zg):
+            files.append((file_fc, file_zg))
+        else:
+            logger.warning('No z file for {}. Cannot ingest it'.format(file_fc))
+    return files
+
+
+def marker_file(product_file):
+    """get the filename of the completion marker of a model profiles product"""
+    return product_file + MARKER_EXT
+
+
+def is_ingested(product_file, file_fc, file_zg):
+    """check if a completion marker for the current state of the forecast and z file exists"""
+    try:
+        with open(marker_file(product_file)) as f:
+            marker = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    return (os.path.exists(product_file)
+            and marker.get('mtime_fc') == os.stat(file_fc).st_mtime_ns
+            and marker.get('mtime_zg') == os.stat(file_zg).st_mtime_ns)
+
+
+def write_marker(product_file, file_fc, file_zg, duration):
+    """write the completion marker of a model profiles product (atomically)"""
+    marker = {'file_fc': file_fc, 'mtime_fc': os.stat(file_fc).st_mtime_ns,
+              'file_zg': file_zg, 'mtime_zg': os.stat(file_zg).st_mtime_ns,
+              'completed': time.time(), 'duration': duration}
+    tmp_file = '{}.{}.tmp'.format(marker_file(product_file), os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(marker, f)
+    os.replace(tmp_file, marker_file(product_file))
+
+
+if __name__ == '__main__':
+    conf_file = sys.argv[1] if len(sys.argv) > 1 else 'mwr_l12l2/config/retrieval_config_ewc.yaml'
+    ingest_forecasts(conf_file)
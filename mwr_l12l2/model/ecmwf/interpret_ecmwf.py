@@ -1,28 +1,43 @@
 import os
 
 import numpy as np
-import pandas as pd
 import xarray as xr
 
 from mwr_l12l2.log import logger
 from mwr_l12l2.errors import MWRInputError
+from mwr_l12l2.model.ecmwf import hybrid_levels
+from mwr_l12l2.model.ecmwf.station_meta import get_station_meta
 from mwr_l12l2.utils.file_utils import abs_file_path
 from mwr_l12l2.utils.data_utils import datetime64_to_str
 
+GRIB_EXTS = ['.grb', '.grib', '.grb2', '.grib2']  # extensions of files to be read as GRIB
+GRIB_INDEXPATH = '{path}.{short_hash}.idx'  # cfgrib index, cached next to the GRIB file and shared by all parameters
+
+
 class ModelInterpreter(object):
     """class to interpret model data from ECMWF and produce input files for TROPoe
 
     Args:
-        file_fc_nc: file containing forecast data in NetCDF. Must have been converted from grib to nc with
-            mwr_l12l2/model/ecmwf/grb_to_nc.sh before. Direct read-in of grib doesn't work because of dim of lnsp
+        file_fc_nc: file containing forecast data. Either GRIB as obtained from MARS (see :data:`GRIB_EXTS`) or NetCDF
+            converted from GRIB with grib_to_netcdf.
         file_zg_grb: file containing the geopotential of the lowest model level in grib format
         station_altitude (optional): Station altitude to inter/extrapolate model data to for sfc data.
             If not specified the lowest model level will be used for surface data.
         file_ml (optional): a and b parameters to transform model levels to pressure and altitude grid.
             If not specified the file named 'ecmwf_model_levels_137.csv' in same dir as interpret_ecmwf.py will be used.
+        dtype (optional): float type for computing pressure and altitude of the model levels. Defaults to
+            :class:`numpy.float64`. Use :class:`numpy.float32` to halve memory usage at reduced accuracy.
+        z_max (optional): height (in m above model surface) up to which model levels are needed. Levels which are
+            certainly above are not loaded. Defaults to None, i.e. use all levels.
+        meta_dir (optional): dir for caching the static surface geopotential and level coefficients of the station
+            (see :func:`mwr_l12l2.model.ecmwf.station_meta.get_station_meta`). Defaults to None, i.e. cache in memory
+            only.
+
+    Can be used as context manager releasing the forecast data on exit.
     """
 
-    def __init__(self, file_fc_nc, file_zg_grb=None, station_altitude=None, file_ml=None):
+    def __init__(self, file_fc_nc, file_zg_grb=None, station_altitude=None, file_ml=None, dtype=np.float64,
+                 z_max=None, meta_dir=None):
 
         self.file_fc_nc = abs_file_path(file_fc_nc)
         # TODO: check if geopotential from forecast is really equivalent to geopotential from analysis and if is does not crash MARS request
@@ -37,8 +52,14 @@ class ModelInterpreter(object):
         self.file_ml = file_ml
         if self.file_ml is None:
             self.file_ml = os.path.join(os.path.dirname(__file__), 'ecmwf_model_levels_137.csv')
+        self.dtype = dtype
+        self.z_max = z_max
+        self.meta_dir = meta_dir
+        self.level_coeffs = None
         self.fc = None
-        self.zg_surf = None
+        self.lnsp = None  # logarithm of surface pressure with dims (time, lat, lon)
+        self.drop_top = False  # whether the uppermost loaded level is only needed as upper boundary of the next one
+        self.zg_surf = None  # geopotential of the surface with dims (lat, lon)
         self.p = None
         self.p_half = None
         self.z = None
@@ -49,93 +70,103 @@ class ModelInterpreter(object):
         self.t_ref = None  # reference temperature profile (1d)
         self.q_err = None  # standard deviation of humidity profile within lat/lon area (1d)
         self.t_err = None  # standard deviation of humidity profile within lat/lon area (1d)
+        self.lat_ref = None  # latitude of reference profiles
+        self.lon_ref = None  # longitude of reference profiles
+
+    def run(self, time_min=None, time_max=None):
+        """run for data closest to selected time in :class:`numpy.datetime64` or :class:`datetime.datetime`
 
-    def run(self, time_min, time_max):
-        """run for data closest to selected time in :class:`numpy.datetime64` or :class:`datetime.datetime`"""
+        If time_min is None, all forecast steps are used
+        """
         self.load_data(time_min, time_max)
         self.hybrid_to_p()
         self.p_to_z()
+        if self.drop_top:
+            self.drop_top_level()
         self.compute_stats()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """release the forecast data"""
+        if self.fc is not None:
+            self.fc.close()
+        self.fc = None
+
     def load_data(self, time_min, time_max):
-        """load dataset and reduce to the time of interest (to speed up following computations)"""
-        fc_all = xr.open_dataset(self.file_fc_nc)
-        if time_max - time_min > np.timedelta64(1, 'h'):
-            self.fc = fc_all.sel(time=slice(time_min, time_max))
-        else:
-            self.fc = fc_all.sel(time=slice(time_min, time_min+np.timedelta64(1,'h')))
+        """load the forecast data needed for the time of interest (to speed up following computations)
+
+        The file is opened lazily and only the steps of interest and the levels up to z_max (plus the level above as
+        upper boundary) are read for t, q and (at the lowest level only) lnsp. File handles are closed after reading.
+        """
+        self.close()
+        self.read_station_meta()
+        with open_forecast(self.file_fc_nc, chunks={'time': 1}) as fc_all:
+            if time_min is not None:
+                fc_all = fc_all.sel(time=forecast_time_slice(time_min, time_max))
+            self.lnsp = fc_all.lnsp.load()
+
+            ind_start = 0
+            if self.z_max is not None:
+                ind_top = top_level_index(self.level_coeffs, fc_all.level.values, np.exp(self.lnsp.values.min()),
+                                          self.z_max)
+                ind_start = max(ind_top - 1, 0)  # keep level above as upper boundary for uppermost needed level
+                self.drop_top = ind_top > 0
+            variables = ['t', 'q', 'z'] if self.use_zg_from_fc else ['t', 'q']
+            self.fc = fc_all[variables].isel(level=slice(ind_start, None)).load()
 
         logger.info('Using forecast data between '+datetime64_to_str(self.fc.time.min().values, '%Y-%m-%d %H:%M:%S')+' and '+datetime64_to_str(self.fc.time.max().values, '%Y-%m-%d %H:%M:%S'))
 
         # Now keeping all models runs between time_min and time_max of the mwr observations, TROPoe does the interpolation
         if not self.use_zg_from_fc:
-            logger.info('Reading geopotential from analysis data')
-            self.zg_surf = xr.open_dataset(self.file_zg_grb, engine='cfgrib')
+            logger.info('Using geopotential from analysis data')
+            if self.zg_surf.shape != (len(self.fc.latitude), len(self.fc.longitude)):
+                raise MWRInputError('the grid of the geopotential in {} does not match the grid of the forecast in '
+                                    '{}'.format(self.file_zg_grb, self.file_fc_nc))
 
-    def hybrid_to_p(self):
-        """compute pressure (in Pa) of half and full levels from hybrid levels and fill to self.p and self.p_half"""
+    def read_station_meta(self):
+        """get parameters a and b for hybrid model levels to self.level_coeffs and surface geopotential to self.zg_surf
 
-        col_headers = ['level', 'a', 'b']  # expected column headers in self.file_ml
+        These static data are taken from the station metadata cache, hence the source files are only read once
+        """
+        meta = get_station_meta(self.file_zg_grb, self.file_ml, self.meta_dir)
+        self.level_coeffs = meta.level_coeffs
+        self.zg_surf = meta.zg_surf
 
-        # get parameters a and b for hybrid model levels from csv and do some basic input checking
-        level_coeffs = pd.read_csv(self.file_ml)
-        for name in col_headers:
-            if name not in level_coeffs:
-                MWRInputError("the file describing the model level coefficients at '{}' is supposed to contain "
-                              "a column header '{}' in the first line".format(self.file_ml, name))
-        if not (level_coeffs.loc[len(level_coeffs)-1, 'level'] == len(level_coeffs)-1
-                and level_coeffs.loc[0, 'level'] == 0):
-            MWRInputError("the file describing the model level coefficients at '{}' is supposed to contain all levels "
-                          'from 0 to n_levels (plus one line of column headers at the top)'.format(self.file_ml))
+    def hybrid_to_p(self):
+        """compute pressure (in Pa) of half and full levels from hybrid levels and fill to self.p and self.p_half"""
 
         # extract a and b parameters for levels of interest (half levels below and above)
-        ab = np.concatenate([level_coeffs.loc[self.fc.level - 1, ['a', 'b']].to_numpy(),
-                             np.expand_dims(level_coeffs.loc[self.fc.level[-1].values, ['a', 'b']].to_numpy(), axis=0)])
+        ab = np.concatenate([self.level_coeffs.loc[self.fc.level - 1, ['a', 'b']].to_numpy(),
+                             np.expand_dims(self.level_coeffs.loc[self.fc.level[-1].values, ['a', 'b']].to_numpy(),
+                                            axis=0)])
         a = ab[:, 0]
         b = ab[:, 1]
 
         # calculate pressure at model levels taking the mean between half levels
-        p_surf = np.exp(self.fc.lnsp)  # to test pseudo std atm (p, not T/q) use p_surf=np.tile(101325,(27, 48, 3, 3))
-        p_surf_all = np.tile(p_surf[:, 0:1, :, :], (1, ab.shape[0], 1, 1))  # slice instead of index to preserve dim
-        a_all = np.tile(a[np.newaxis, :, np.newaxis, np.newaxis],
-                        (p_surf.shape[0], 1, p_surf.shape[2], p_surf.shape[3]))
-        b_all = np.tile(b[np.newaxis, :, np.newaxis, np.newaxis],
-                        (p_surf.shape[0], 1, p_surf.shape[2], p_surf.shape[3]))
-        self.p_half = a_all + b_all*p_surf_all
-        self.p = (self.p_half + np.roll(self.p_half, 1, axis=1))[:, 1:, :, :] / 2
+        p_surf = np.exp(self.lnsp.values)[:, np.newaxis, :, :]
+        self.p_half, self.p = hybrid_levels.hybrid_to_p(a, b, p_surf, dtype=self.dtype)
 
     def p_to_z(self):
-        """transform pressure grid (from :meth:`hybrid_to_p`) to geometrical altitudes
-
-        according to: https://confluence.ecmwf.int/display/CKB/ERA5%3A+compute+pressure+and+geopotential+on+model+levels%2C+geopotential+height+and+geometric+height
-        """  # noqa: E501
-
-        gas_const = 287.06  # gas constant for dry air (Rd)
-        g = 9.80665  # gravitational acceleration of Earth
-
-        # TODO: check whole function with hypsometric equation and possibly re-write from scratch using it (clearer)
-        # TODO: get rid of RuntimeWarning: divide by zero encountered in log
-        dp = (self.p_half - np.roll(self.p_half, 1, axis=1))[:, 1:, :, :]
-        dlogp = np.log(self.p_half / np.roll(self.p_half, 1, axis=1))[:, 1:, :, :]
-        alpha = 1 - (self.p_half[:, 1:, :, :] / dp) * dlogp
-
-        # correct for uppermost level
-        dlogp[:, 0, :, :] = np.log(self.p_half[:, 1, :, :] / 0.1)
-        alpha[:, 0, :, :] = np.tile(-np.log(2), (self.p_half.shape[0], self.p_half.shape[2], self.p_half.shape[3]))
-
-        # transformation to geopotential height zg
-        dzg_half = self.virt_temp() * gas_const * dlogp  # diff between geopotential height half levels
+        """transform pressure grid (from :meth:`hybrid_to_p`) to geometrical altitudes"""
         if not self.use_zg_from_fc:
-            zg_surf_all = np.tile(self.zg_surf.z.values,(self.p_half.shape[0], 1, 1, 1)) #self.zg_surf.z.values[np.newaxis, np.newaxis, :, :]
+            zg_surf = self.zg_surf
         else:
             # New version to work with geopotential from the fc directly:
-            zg_surf_all = np.expand_dims(self.fc.z.isel(level=0).data,1)
-        dzg_half_with_sfc = np.concatenate((dzg_half, zg_surf_all), axis=1)
-        zg_half = np.flip(np.cumsum(np.flip(dzg_half_with_sfc, axis=1), axis=1), axis=1)  # integrate from surface
-        zg = zg_half[:, 1:, :, :] - alpha*gas_const*self.virt_temp()
+            zg_surf = self.fc.z.isel(level=0).values
+        self.z = hybrid_levels.p_to_z(self.p_half, self.fc.t.values, self.fc.q.values, zg_surf, dtype=self.dtype)
 
-        # transformation to geometrical height z
-        self.z = zg / g
+    def drop_top_level(self):
+        """remove the uppermost level, whose altitude is not correct if it is not the top of the model"""
+        self.fc = self.fc.isel(level=slice(1, None))
+        self.p_half = self.p_half[:, 1:, :, :]
+        self.p = self.p[:, 1:, :, :]
+        self.z = self.z[:, 1:, :, :]
+        self.drop_top = False
 
     def compute_stats(self):
         """take reference profiles and uncertainty"""
@@ -146,6 +177,8 @@ class ModelInterpreter(object):
         self.t_ref = get_ref_profile(self.fc.t)
         self.p_ref = get_ref_profile(self.p)
         self.time_ref = self.fc.time.values
+        self.lat_ref = self.fc.latitude.values[int(len(self.fc.latitude) / 2)]  # same centre as in get_ref_profile
+        self.lon_ref = self.fc.longitude.values[int(len(self.fc.longitude) / 2)]
 
         # Compute reference profile of RH
         self.rh = self.relative_humidity()
@@ -156,7 +189,7 @@ class ModelInterpreter(object):
 
     def virt_temp(self):
         """return virtual temperature from temperature and specific humidity in self.fc"""
-        return self.fc.t * (1 + 0.609133*self.fc.q)
+        return hybrid_levels.virtual_temperature(self.fc.t.values, self.fc.q.values, dtype=self.dtype)
     
     def relative_humidity(self):
         """return relative humidity from pressure, specific humitiy and temperature in self.rh according to https://codes.ecmwf.int/grib/param-db/?id=157"""        
@@ -176,6 +209,77 @@ class ModelInterpreter(object):
         # relative humity
         return self.p_ref*self.q_ref*(1/epsilon)/(esat*(1 + self.q_ref*(1/epsilon - 1)))
 
+def open_forecast(file, chunks=None, params=('t', 'q', 'lnsp')):
+    """open forecast data lazily with t and q in dims (time, level, latitude, longitude) and lnsp in (time, latitude, longitude)
+
+    GRIB files are read directly with cfgrib. As cfgrib cannot decode lnsp together with t and q (different level
+    types), each parameter is opened with its own filter and the parameters are merged into one dataset. NetCDF files
+    converted with grib_to_netcdf (which contain lnsp repeated on each level) are read with the NetCDF engine.
+
+    Args:
+        file: forecast file in GRIB or NetCDF
+        chunks (optional): dask chunks along dims of the output, e.g. {'time': 1}. Defaults to None, i.e. no dask
+        params (optional): short names of the parameters to read. Defaults to t, q and lnsp
+
+    Returns:
+        :class:`xarray.Dataset`. Closing it closes all underlying files
+    """
+    if os.path.splitext(str(file))[1] not in GRIB_EXTS:
+        ds = xr.open_dataset(file, chunks=chunks)
+        fc = ds[list(params)]
+        if 'lnsp' in fc:
+            fc['lnsp'] = fc.lnsp.isel(level=0, drop=True)  # lnsp is stored identically for each level
+        fc.set_close(ds.close)  # the subset does not inherit the close hook of the opened file
+        return fc
+
+    datasets = []
+    for param in params:
+        ds = xr.open_dataset(file, engine='cfgrib',
+                             backend_kwargs={'filter_by_keys': {'shortName': param}, 'indexpath': GRIB_INDEXPATH})
+        # use valid time as time dim like grib_to_netcdf, model level as level
+        ds = ds.drop_vars('time').swap_dims({'step': 'valid_time'}).drop_vars('step').rename({'valid_time': 'time'})
+        if 'hybrid' in ds.dims:
+            ds = ds.rename({'hybrid': 'level'}).assign_coords(level=lambda x: x.level.astype(np.int32))
+        else:
+            ds = ds.drop_vars('hybrid', errors='ignore')
+        datasets.append(ds)
+    fc = xr.merge(datasets, combine_attrs='drop_conflicts')
+    if chunks is not None:
+        fc = fc.chunk(chunks)
+    fc.set_close(lambda: [ds.close() for ds in datasets])
+    return fc
+
+
+def forecast_time_slice(time_min, time_max):
+    """get slice of forecast times to use for observations between time_min and time_max (covering at least 1 hour)"""
+    if time_max - time_min > np.timedelta64(1, 'h'):
+        return slice(time_min, time_max)
+    return slice(time_min, time_min + np.timedelta64(1, 'h'))
+
+
+def top_level_index(level_coeffs, levels, p_surf, z_max, t_min=200.):
+    """get index of the uppermost of the model levels which can be below z_max (in m above the surface)
+
+    The altitude of the levels is estimated from their lower half level with the hypsometric equation for an isothermal
+    atmosphere at t_min. As this underestimates the altitude for any atmosphere warmer than t_min, the selection is
+    conservative. Provide the lowest surface pressure of the area (in Pa) as p_surf for the same reason.
+
+    Args:
+        level_coeffs: :class:`pandas.DataFrame` with parameters a and b of all hybrid model levels
+        levels: model levels in the forecast data (sorted from top to bottom)
+        p_surf: surface pressure in Pa
+        z_max: altitude above surface in m
+        t_min (optional): lower bound of the mean virtual temperature of the atmosphere in K. Defaults to 200.
+    """
+    p_half_below = level_coeffs.loc[levels, 'a'].to_numpy() + level_coeffs.loc[levels, 'b'].to_numpy() * p_surf
+    with np.errstate(divide='ignore'):
+        z_est = hybrid_levels.GAS_CONST * t_min / hybrid_levels.G * np.log(p_surf / p_half_below)
+    ind_below = np.flatnonzero(z_est <= z_max)
+    if len(ind_below) == 0:
+        return len(levels) - 1
+    return ind_below[0]
+
+
 def get_ref_profile(x):
     """extract ref profile (last time, centre lat/lon) from a :class:`xarray.DataArray` with dim (time,level,lat,lon)"""
     if type(x) is not np.ndarray:
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.log import logger
+from mwr_l12l2.model.ecmwf.interpret_ecmwf import ModelInterpreter, forecast_time_slice
+from mwr_l12l2.model.ecmwf.station_meta import station_meta_dir
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+# profiles (dims: time, level) stored in the model profiles product
+PROFILE_VARS = ['z_ref', 't_ref', 'q_ref', 'p_ref', 'rh', 't_err', 'q_err']
+
+
+class ModelProfiles(object):
+    """TROPoe-ready reference profiles and uncertainties of all steps of one forecast for one instrument
+
+    Holds the same attributes as :class:`mwr_l12l2.model.ecmwf.interpret_ecmwf.ModelInterpreter` after its run() so
+    that it can be passed on to :func:`mwr_l12l2.retrieval.tropoe_helpers.model_to_tropoe` once reduced to the time of
+    interest with :meth:`select_time`.
+
+    Args:
+        time_ref: times of the forecast steps
+        lat_ref: latitude of the reference profiles
+        lon_ref: longitude of the reference profiles
+        **profiles: arrays with dims (time, level) for each of the variables in :data:`PROFILE_VARS`
+    """
+
+    def __init__(self, time_ref, lat_ref, lon_ref, **profiles):
+        self.time_ref = time_ref
+        self.lat_ref = lat_ref
+        self.lon_ref = lon_ref
+        for var in PROFILE_VARS:
+            setattr(self, var, profiles[var])
+
+    @classmethod
+    def from_interpreter(cls, model):
+        """set up from a :class:`mwr_l12l2.model.ecmwf.interpret_ecmwf.ModelInterpreter` with executed run()"""
+        return cls(model.time_ref, model.lat_ref, model.lon_ref,
+                   **{var: np.asarray(getattr(model, var)) for var in PROFILE_VARS})
+
+    @classmethod
+    def from_file(cls, file):
+        """read from a product file written by :meth:`to_file`"""
+        with xr.open_dataset(file) as ds:
+            ds.load()
+            return cls(ds.time.values, ds.lat_ref.values[()], ds.lon_ref.values[()],
+                       **{var: ds[var].values for var in PROFILE_VARS})
+
+    def to_file(self, file):
+        """write to a NetCDF file. The file is replaced atomically, hence safe to be read by other processes"""
+        ds = xr.Dataset({var: (('time', 'level'), getattr(self, var)) for var in PROFILE_VARS},
+                        coords={'time': self.time_ref})
+        ds['lat_ref'] = self.lat_ref
+        ds['lon_ref'] = self.lon_ref
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(file, os.getpid())
+        ds.to_netcdf(tmp_file)
+        os.replace(tmp_file, file)
+
+    def select_time(self, time_min, time_max):
+        """get a copy reduced to the forecast steps used for observations between time_min and time_max
+
+        The selection of steps is the same as in :meth:`mwr_l12l2.model.ecmwf.interpret_ecmwf.ModelInterpreter.run`
+        """
+        time_slice = forecast_time_slice(time_min, time_max)
+        ind = (self.time_ref >= np.datetime64(time_slice.start)) & (self.time_ref <= np.datetime64(time_slice.stop))
+        return ModelProfiles(self.time_ref[ind], self.lat_ref, self.lon_ref,
+                             **{var: getattr(self, var)[ind, :] for var in PROFILE_VARS})
+
+
+def model_profiles_file(conf, file_fc):
+    """get the filename of the model profiles product of a forecast file
+
+    The product is stored in 'model_profiles_dir' of the 'processing' section of the retrieval config. If not set, in
+    the subfolder 'profiles' of the model_dir.
+    """
+    product_dir = get_processing_conf(conf, 'model_profiles_dir')
+    if product_dir is None:
+        product_dir = os.path.join(conf['data']['model_dir'], 'profiles')
+    filename = os.path.splitext(os.path.basename(file_fc))[0] + '_profiles.nc'
+    return os.path.join(abs_file_path(product_dir), filename)
+
+
+def is_up_to_date(file, source_files):
+    """check if a file exists and is younger than all its source files"""
+    if not os.path.exists(file):
+        return False
+    return os.path.getmtime(file) >= max(os.path.getmtime(f) for f in source_files)
+
+
+def get_model_profiles(conf, file_fc, file_zg):
+    """get the model profiles product of a forecast, computing it if not available or outdated
+
+    Args:
+        conf: retrieval configuration dictionary
+        file_fc: forecast file in NetCDF
+        file_zg: file containing the geopotential of the lowest model level
+
+    Returns:
+        :class:`ModelProfiles` for all steps of the forecast
+    """
+    product_file = model_profiles_file(conf, file_fc)
+    if is_up_to_date(product_file, [file_fc, file_zg]):
+        return ModelProfiles.from_file(product_file)
+    return precompute_model_profiles(file_fc, file_zg, product_file, z_max=model_height_limit(conf),
+                                     meta_dir=station_meta_dir(conf))
+
+
+def model_height_limit(conf):
+    """get height (in m above model surface) up to which model levels are needed for the retrieval config
+
+    This is the top of the retrieval grid (vip.zgrid) or of the model profiles used by TROPoe (vip.mod_*_prof_maxht),
+    whichever is higher, plus 'model_height_margin' from the 'processing' section. None (all levels) if no margin is set
+    """
+    margin = get_processing_conf(conf, 'model_height_margin')
+    if margin is None:
+        return None
+    heights = [max(conf['vip']['zgrid'])]
+    heights += [conf['vip'][key] for key in ['mod_temp_prof_maxht', 'mod_wv_prof_maxht'] if key in conf['vip']]
+    return 1e3 * max(heights) + margin
+
+
+def precompute_model_profiles(file_fc, file_zg, product_file, z_max=None, meta_dir=None):
+    """compute the model profiles product for all steps of a forecast and write it to product_file
+
+    Args:
+        file_fc: forecast file in NetCDF
+        file_zg: file containing the geopotential of the lowest model level
+        product_file: output file
+        z_max (optional): height (in m above model surface) up to which model levels are needed. Defaults to None,
+            i.e. all levels
+        meta_dir (optional): dir of the station metadata cache. Defaults to None, i.e. cache in memory only
+
+    Returns:
+        :class:`ModelProfiles` for all steps of the forecast
+    """
+    logger.info('Computing model profiles for all steps of {}'.format(file_fc))
+    with ModelInterpreter(file_fc, file_zg, z_max=z_max, meta_dir=meta_dir) as model:
+        model.run()
+        profiles = ModelProfiles.from_interpreter(model)
+    profiles.to_file(product_file)
+    return profiles
+
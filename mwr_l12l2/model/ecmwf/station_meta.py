@@ -0,0 +1,152 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from mwr_l12l2.errors import MWRInputError
+from mwr_l12l2.log import logger
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+META_VARS = ['zg_surf', 'latitude', 'longitude', 'level', 'a', 'b']  # arrays stored in the station metadata cache
+
+_loaded = {}  # station metadata already loaded in this process by source key
+
+
+class StationMeta(object):
+    """static model metadata of a station: surface geopotential of its grid and coefficients of the hybrid levels
+
+    Both are constant for a station, hence they are read from their source files once and cached as small .npz file
+    (see :func:`get_station_meta`). All arrays are read-only as instances are shared within a process.
+
+    Args:
+        zg_surf: geopotential of the surface (in m2/s2) with dims (latitude, longitude)
+        latitude: latitudes of the grid points
+        longitude: longitudes of the grid points
+        level: number of the hybrid half levels (from 0 at the top to n_levels at the surface)
+        a: parameter a of the half levels (in Pa)
+        b: parameter b of the half levels
+    """
+
+    def __init__(self, zg_surf, latitude, longitude, level, a, b):
+        self.zg_surf = zg_surf
+        self.latitude = latitude
+        self.longitude = longitude
+        self.level = level
+        self.a = a
+        self.b = b
+        for var in META_VARS:
+            getattr(self, var).setflags(write=False)
+
+    @property
+    def level_coeffs(self):
+        """parameters a and b of the hybrid levels as :class:`pandas.DataFrame` like read from the csv file"""
+        return pd.DataFrame({'level': self.level, 'a': self.a, 'b': self.b})
+
+    @classmethod
+    def from_source(cls, file_zg, file_ml):
+        """read from the z file in GRIB and the csv file describing the model levels"""
+        # do not let cfgrib write an index next to the static file, it is only read once
+        with xr.open_dataset(file_zg, engine='cfgrib', backend_kwargs={'indexpath': ''}) as ds:
+            zg_surf = ds.z.values
+            latitude = ds.latitude.values
+            longitude = ds.longitude.values
+        level_coeffs = read_level_coeffs(file_ml)
+        return cls(zg_surf, latitude, longitude, level_coeffs['level'].to_numpy(), level_coeffs['a'].to_numpy(),
+                   level_coeffs['b'].to_numpy())
+
+    @classmethod
+    def from_file(cls, file):
+        """read from a cache file written by :meth:`to_file`"""
+        with np.load(file) as data:
+            return cls(**{var: data[var] for var in META_VARS})
+
+    def to_file(self, file):
+        """write to an .npz file. The file is replaced atomically, hence safe to be read by other processes"""
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp_file = '{}.{}.tmp.npz'.format(os.path.splitext(file)[0], os.getpid())
+        np.savez(tmp_file, **{var: getattr(self, var) for var in META_VARS})
+        os.replace(tmp_file, file)
+
+
+def read_level_coeffs(file_ml):
+    """read parameters a and b for hybrid model levels from csv file to a :class:`pandas.DataFrame`"""
+
+    col_headers = ['level', 'a', 'b']  # expected column headers in file_ml
+
+    # read and do some basic input checking
+    level_coeffs = pd.read_csv(file_ml)
+    for name in col_headers:
+        if name not in level_coeffs:
+            raise MWRInputError("the file describing the model level coefficients at '{}' is supposed to contain "
+                                "a column header '{}' in the first line".format(file_ml, name))
+    if not (level_coeffs.loc[len(level_coeffs)-1, 'level'] == len(level_coeffs)-1
+            and level_coeffs.loc[0, 'level'] == 0):
+        raise MWRInputError("the file describing the model level coefficients at '{}' is supposed to contain all "
+                            'levels from 0 to n_levels (plus one line of column headers at the top)'.format(file_ml))
+    return level_coeffs
+
+
+def source_key(*files):
+    """get a short hash identifying the current state (path, size and modification time) of the source files"""
+    key = hashlib.sha1()
+    for file in files:
+        stat = os.stat(file)
+        key.update('{}:{}:{};'.format(os.path.realpath(file), stat.st_size, stat.st_mtime_ns).encode())
+    return key.hexdigest()[:16]
+
+
+def station_meta_dir(conf):
+    """get the dir of the station metadata cache from 'model_meta_dir' of the 'processing' section of the retrieval
+    config. If not set, the subfolder 'meta' of the model_dir"""
+    meta_dir = get_processing_conf(conf, 'model_meta_dir')
+    if meta_dir is None:
+        meta_dir = os.path.join(conf['data']['model_dir'], 'meta')
+    return abs_file_path(meta_dir)
+
+
+def station_meta_file(meta_dir, file_zg, key):
+    """get the filename of the station metadata cache of a z file for the source key"""
+    return os.path.join(meta_dir, '{}_{}.npz'.format(os.path.splitext(os.path.basename(file_zg))[0], key))
+
+
+def get_station_meta(file_zg, file_ml, meta_dir=None):
+    """get the static model metadata of a station, reading the source files only if not cached yet or if changed
+
+    Metadata are kept in memory for the lifetime of the process. If meta_dir is given, they are also cached on disk,
+    keyed by the state of the source files, for sharing with other (worker) processes. Outdated cache files of the same
+    z file are removed.
+
+    Args:
+        file_zg: file containing the geopotential of the lowest model level in grib format
+        file_ml: csv file with parameters a and b of the hybrid model levels
+        meta_dir (optional): dir of the cache files. Defaults to None, i.e. cache in memory only
+
+    Returns:
+        :class:`StationMeta`
+    """
+    key = source_key(file_zg, file_ml)
+    if key in _loaded:
+        return _loaded[key]
+
+    if meta_dir is None:
+        meta = StationMeta.from_source(file_zg, file_ml)
+    else:
+        file = station_meta_file(meta_dir, file_zg, key)
+        try:
+            meta = StationMeta.from_file(file)
+        except FileNotFoundError:
+            logger.info('Caching station metadata of {} to {}'.format(file_zg, file))
+            meta = StationMeta.from_source(file_zg, file_ml)
+            meta.to_file(file)
+            for old_file in glob.glob(station_meta_file(meta_dir, file_zg, '*')):
+                if old_file != file and not old_file.endswith('.tmp.npz'):
+                    try:
+                        os.remove(old_file)
+                    except FileNotFoundError:  # already removed by another process
+                        pass
+    _loaded[key] = meta
+    return meta
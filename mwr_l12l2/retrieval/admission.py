@@ -0,0 +1,166 @@
+import netCDF4
+import numpy as np
+from xarray.coding.times import decode_cf_datetime
+
+import datetime as dt
+
+from mwr_l12l2.errors import AdmissionError
+from mwr_l12l2.log import logger
+from mwr_l12l2.retrieval.l1_buffer import file_signature
+from mwr_l12l2.utils.file_utils import files_covering
+
+# reasons for rejecting a retrieval
+REASON_NO_FILES = 'no MWR files for time range'
+REASON_NO_SAMPLES = 'no MWR samples in time range'
+REASON_SHORT_WINDOW = 'time range shorter than tres'
+REASON_WIGOS = 'WIGOS-ID mismatch'
+REASON_COORDINATES = 'station coordinates mismatch'
+
+# station coordinates checked against the instrument config with the key of their tolerance in the 'data' section
+COORD_TOLERANCES = {'station_latitude': 'tolerance_lat_lon',
+                    'station_longitude': 'tolerance_lat_lon',
+                    'station_altitude': 'tolerance_alt'}
+
+_meta_cache = {}  # metadata of the MWR files read by the current process as tuples of file signature and FileMeta
+
+
+class FileMeta(object):
+    """metadata of an MWR L1 file used for deciding whether a retrieval can run without loading the data
+
+    Args:
+        time_min: first sample time as :class:`numpy.datetime64` (NaT if the file has no samples)
+        time_max: last sample time as :class:`numpy.datetime64` (NaT if the file has no samples)
+        wigos: WIGOS-ID of the station in the global attributes of the file (None if missing)
+        coord_ranges: dictionary with tuples (min, max) of the station coordinates in the file. Coordinates missing in
+            the file or without valid values are not contained
+    """
+
+    __slots__ = ['time_min', 'time_max', 'wigos', 'coord_ranges']
+
+    def __init__(self, time_min, time_max, wigos=None, coord_ranges=None):
+        self.time_min = time_min
+        self.time_max = time_max
+        self.wigos = wigos
+        self.coord_ranges = coord_ranges if coord_ranges is not None else {}
+
+    @classmethod
+    def from_file(cls, file):
+        """read the metadata from an MWR L1 file. Only the time and the station coordinates are read"""
+        with netCDF4.Dataset(file) as nc:
+            time_in = nc['time']
+            times = decode_cf_datetime(np.ma.compressed(time_in[:]), time_in.units,
+                                       getattr(time_in, 'calendar', None))
+            time_min = times.min() if times.size else np.datetime64('NaT')
+            time_max = times.max() if times.size else np.datetime64('NaT')
+            coord_ranges = {}
+            for var in COORD_TOLERANCES:
+                if var not in nc.variables:
+                    continue
+                values = np.ma.filled(nc[var][:].astype(float), np.nan)
+                if np.any(np.isfinite(values)):
+                    coord_ranges[var] = (np.nanmin(values), np.nanmax(values))
+            return cls(time_min, time_max, getattr(nc, 'wigos_station_id', None), coord_ranges)
+
+
+def get_file_meta(file):
+    """get the :class:`FileMeta` of an MWR file, reading it only if not done before by this process or if modified"""
+    signature = file_signature(file)
+    if file not in _meta_cache or _meta_cache[file][0] != signature:
+        _meta_cache[file] = (signature, FileMeta.from_file(file))
+    return _meta_cache[file][1]
+
+
+def check_admission(conf, wigos, inst_conf, mwr_files, start_time=None, end_time=None):
+    """check whether a retrieval can run from the filenames and the metadata of the MWR files without loading any data
+
+    The retrieval is only rejected if it is sure to fail in
+    :meth:`mwr_l12l2.retrieval.retrieval.Retrieval.prepare_obs`, i.e. if the files contain no samples in the time range,
+    if the samples in the time range span less than 'tres' of the 'vip' section of the retrieval config, if the WIGOS-ID
+    of the files does not match or if none of the station coordinates in the files is within the tolerances. The time
+    range and the coordinates are judged from the first and last sample time and the coordinate ranges of each file.
+    Files which cannot be read are left to the retrieval to report.
+
+    Args:
+        conf: retrieval configuration dictionary
+        wigos: WIGOS-ID of the station
+        inst_conf: instrument configuration dictionary with the station coordinates
+        mwr_files: list of all MWR files of the instrument
+        start_time (optional): :class:`datetime.datetime` of the earliest time from which to consider data. If None, the
+            'max_age' setting of the 'data' section of the retrieval config is applied as in
+            :meth:`mwr_l12l2.retrieval.retrieval.Retrieval.prepare`
+        end_time (optional): :class:`datetime.datetime` of the latest time from which to consider data. Defaults to None
+    Raises:
+        AdmissionError: if the retrieval cannot succeed. The reason of the rejection is one of the REASON_* constants
+    """
+    if start_time is None and conf['data'].get('max_age') is not None:
+        start_time = dt.datetime.utcnow() - dt.timedelta(minutes=conf['data']['max_age'])
+    start_time = np.datetime64(start_time)
+    end_time = np.datetime64(end_time)
+
+    files = files_covering(mwr_files, start_time, end_time)
+    if not files:
+        reject(REASON_NO_FILES, 'All MWR files of {} start after the required end time ({})'.format(wigos, end_time))
+
+    metas = []
+    for file in files:
+        try:
+            metas.append(get_file_meta(file))
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning('Could not read metadata of {} for admission check: {}'.format(file, e))
+            return
+    wigos_in = metas[0].wigos  # global attributes of the L1 data are taken from the first file
+
+    # the time range spanned by the samples in the window can only be shorter than estimated from the file limits
+    metas = [meta for meta in metas if not np.isnat(meta.time_min)
+             and (np.isnat(start_time) or meta.time_max >= start_time)
+             and (np.isnat(end_time) or meta.time_min <= end_time)]
+    if not metas:
+        reject(REASON_NO_SAMPLES, 'None of the MWR files of {} contains data between the required time limits '
+                                  '(min={}; max={})'.format(wigos, start_time, end_time))
+    time_min = min(meta.time_min for meta in metas)
+    time_max = max(meta.time_max for meta in metas)
+    if not np.isnat(start_time):
+        time_min = max(time_min, start_time)
+    if not np.isnat(end_time):
+        time_max = min(time_max, end_time)
+    if time_max - time_min < np.timedelta64(conf['vip']['tres'], 'm'):
+        reject(REASON_SHORT_WINDOW, 'MWR data of {} between {} and {} are not enough to run the retrieval'.format(
+            wigos, time_min, time_max))
+
+    if wigos_in is not None and wigos_in != wigos:
+        reject(REASON_WIGOS, 'The wigos id in the MWR files ({}) does not match the one in the config file ({})'.format(
+            wigos_in, wigos))
+
+    for var, tolerance_key in COORD_TOLERANCES.items():
+        ranges = [meta.coord_ranges[var] for meta in metas if var in meta.coord_ranges]
+        if var not in inst_conf or not ranges:
+            continue
+        tolerance = conf['data'][tolerance_key]
+        if min(r[0] for r in ranges) > inst_conf[var] + tolerance or \
+                max(r[1] for r in ranges) < inst_conf[var] - tolerance:
+            reject(REASON_COORDINATES, 'The {} in the MWR files of {} does not match the one in the config file'.format(
+                var, wigos))
+
+
+def reject(reason, msg):
+    """log and raise an :class:`mwr_l12l2.errors.AdmissionError`"""
+    logger.warning('Retrieval rejected: {}'.format(msg))
+    raise AdmissionError(msg, reason)
+
+
+def log_rejections(rejections, n_total, unit='instruments'):
+    """log the rejected retrievals aggregated by reason
+
+    Args:
+        rejections: dictionary with the names of the rejected retrievals as keys and their reasons as values
+        n_total: total number of retrievals that were checked
+        unit (optional): what the retrievals are counted in for the log message. Defaults to 'instruments'
+    """
+    if not rejections:
+        return
+    by_reason = {}
+    for name, reason in rejections.items():
+        by_reason.setdefault(reason, []).append(name)
+    logger.warning('Rejected {} of {} {} before retrieval: {}'.format(
+        len(rejections), n_total, unit, '; '.join('{} ({}: {})'.format(reason, len(names), ', '.join(names))
+                                                  for reason, names in sorted(by_reason.items()))))
@@ -0,0 +1,63 @@
+import os
+import threading
+
+import numpy as np
+
+from mwr_l12l2.retrieval.l1_buffer import L1Buffer
+from mwr_l12l2.retrieval.tropoe_input import ALC_VARS
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.data_utils import datetime64_to_str, select_time
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+_buffers = {}  # buffers of the cloud base data of the current process by station (wigos)
+_locks = {}  # one lock per station so that instruments of the same station wait for one load instead of loading twice
+_locks_lock = threading.Lock()
+
+
+def alc_files_for_window(files, time_min, time_max):
+    """get the ALC files with the date of a day between time_min and time_max in their filename
+
+    ALC files are daily or instantaneous files with the date in the filename. If no file matches, all files are returned
+    as the data of the time range might be in files named differently.
+    """
+    days = np.arange(time_min.astype('datetime64[D]'), time_max.astype('datetime64[D]') + 1)
+    datestrings = [datetime64_to_str(day, '%Y%m%d') for day in days]
+    selected = [file for file in files if any(ds in os.path.basename(file) for ds in datestrings)]
+    return selected or files
+
+
+def get_alc_buffer(conf, wigos):
+    """get the :class:`mwr_l12l2.retrieval.l1_buffer.L1Buffer` with the cloud base data of a station in this process
+
+    The buffer is stored on disk if 'alc_cache_dir' of the 'processing' section of the retrieval config is set.
+    """
+    if wigos not in _buffers:
+        store_dir = None
+        cache_dir = get_processing_conf(conf, 'alc_cache_dir')
+        if cache_dir is not None:
+            store_dir = os.path.join(abs_file_path(cache_dir), 'alc_{}'.format(wigos))
+        _buffers[wigos] = L1Buffer(ALC_VARS, store_dir)
+    return _buffers[wigos]
+
+
+def get_alc_data(conf, wigos, files, time_min, time_max):
+    """get the cloud base data of a station between time_min and time_max from its ALC files
+
+    Only the variables in :data:`mwr_l12l2.retrieval.tropoe_input.ALC_VARS` of the files dated within the time range
+    are read. The data are kept per station between retrievals, so that the files are only read again if modified and
+    all instruments of a station share them.
+
+    Args:
+        conf: retrieval configuration dictionary
+        wigos: WIGOS-ID of the station
+        files: list of ALC files of the station sorted by filename
+        time_min: start of the time range as :class:`numpy.datetime64`
+        time_max: end of the time range as :class:`numpy.datetime64`
+    Returns:
+        :class:`xarray.Dataset` with the cloud base data in the time range (possibly with time of size 0)
+    """
+    with _locks_lock:
+        lock = _locks.setdefault(wigos, threading.Lock())
+    with lock:
+        data = get_alc_buffer(conf, wigos).get(alc_files_for_window(files, time_min, time_max))
+    return select_time(data, time_min, time_max)
@@ -1,17 +1,14 @@
 import os
 import time
-import glob
 
-import datetime as dt
-
-from mwr_l12l2.errors import MissingDataError, MWRConfigError
+from mwr_l12l2.errors import LeaseError, MissingDataError, MWRConfigError
 from mwr_l12l2.log import logger
+from mwr_l12l2.retrieval.retrieval import Retrieval
 from mwr_l12l2.utils.config_utils import get_retrieval_config, get_inst_config
+from mwr_l12l2.utils.file_index import FileIndex
 from mwr_l12l2.utils.file_utils import abs_file_path
-from retrieval import Retrieval
+from mwr_l12l2.utils.lease import get_instrument_leases
 
-# from watchdog.observers import Observer
-# from watchdog.events import LoggingEventHandler
 
 
 class InstrumentSelector(object):
@@ -33,6 +30,9 @@ class InstrumentSelector(object):
             logger.error("The argument 'conf' must be a conf dictionary or a path pointing to a config file")
             raise MWRConfigError("The argument 'conf' must be a conf dictionary or a path pointing to a config file")
 
+        self.file_index = None  # set by get_file_index()
+        self.leases = get_instrument_leases(self.conf)  # None if processing by a single host
+
         # set by select_instrument():
         self.wigos = None
         self.inst_id = None
@@ -43,58 +43,48 @@ class InstrumentSelector(object):
         self.alc_files = None
 
     def select_oldest(self):
-        """select instrument which has oldest (processable) mwr file in input dir"""
-        # TODO: implement this
-        # TODO: Need to lock lookup for station selection for other nodes until prepare_eprofile_main with delete_mwr_in
-        #       is done. Something like https://stackoverflow.com/questions/52815858/python-lock-directory might work.
-        #       but better use ecflow to not data listing for other nodes until end of prepare_eprofile_main
-        # find oldest file in the folder and get station id from filename (or from file content)
-        # list files in input dir
-        list_of_files = glob.glob(os.path.join(self.conf['data']['mwr_dir'],
-                                               '{}*.nc'.format(self.conf['data']['mwr_file_prefix'])))
-        
-        if not list_of_files:
-            logger.error('No MWR data found in {}'.format(self.conf['data']['mwr_dir']))
-            raise MissingDataError('No MWR data found in {}'.format(self.conf['data']['mwr_dir']))
-        
-        # extract filename and dates of all files
-        list_of_file_date = [os.path.basename(x).split('/')[-1].split('_')[3] for x in list_of_files]
-        list_of_dates = [dt.datetime.strptime(x[1:-3], '%Y%m%d%H%M%S') for x in list_of_file_date]
-
-        # get oldest file based on the date in the filename:
-        id_oldest = list_of_dates.index(min(list_of_dates))
-        oldest_file = list_of_files[id_oldest]
-        
-        # get station id from filename
-        self.wigos = oldest_file.split('/')[-1].split('_')[2]
-        #self.wigos = '0-20008-0-INO'
-        
-        self.inst_id = oldest_file.split('/')[-1].split('_')[3][0]
-        #self.inst_id = 'A'
+        """select instrument which has oldest (processable) mwr file in input dir
+
+        If a 'lease_dir' is configured, the oldest instrument not leased by another host is selected and leased until
+        :meth:`release` is called.
+        """
+        # find instrument with oldest file in the folder (based on timestamp in filename)
+        instruments = self.get_file_index().instruments(by_age=True)
+        if not instruments:
+            err_msg = 'No MWR data found in {}'.format(self.conf['data']['mwr_dir'])
+            logger.error(err_msg)
+            raise MissingDataError(err_msg)
+        selected = instruments[0]
+        if self.leases is not None:
+            # claim lazily to not lease any instrument beyond the selected one
+            selected = next((inst for inst in instruments if self.leases.claim(*inst)), None)
+            if selected is None:
+                err_msg = 'All instruments with data in {} are processed by other hosts'.format(
+                    self.conf['data']['mwr_dir'])
+                logger.info(err_msg)
+                raise LeaseError(err_msg)
+        self.wigos, self.inst_id = selected
 
         inst_conf_file = '{}{}_{}.yaml'.format(self.conf['data']['inst_config_file_prefix'],
                                                self.wigos, self.inst_id)
         self.inst_conf = get_inst_config(os.path.join(self.conf['data']['inst_config_dir'], inst_conf_file))
 
     def set_instrument(self, wigos, inst_id):
-        """set instrument and config file manually providing wigos and inst_id"""
-        # TODO: implement this
-        # TODO: Need to lock lookup for station selection for other nodes until prepare_eprofile_main with delete_mwr_in
-        #       is done. Something like https://stackoverflow.com/questions/52815858/python-lock-directory might work.
-        #       but better use ecflow to not data listing for other nodes until end of prepare_eprofile_main
+        """set instrument and config file manually providing wigos and inst_id
 
+        Raises:
+            LeaseError: if a 'lease_dir' is configured and the instrument is leased by another host
+        """
         logger.info('Setting instrument to {} {}'.format(wigos, inst_id))
+        if self.leases is not None and not self.leases.claim(wigos, inst_id):
+            raise LeaseError('Instrument {} {} is processed by another host'.format(wigos, inst_id))
 
         # set wigos and station id
         self.wigos = wigos
         self.inst_id = inst_id
 
         # List files to check it some exist
-        list_of_files = glob.glob(os.path.join(self.conf['data']['mwr_dir'],
-                                                '{}*{}_{}*.nc'.format(self.conf['data']['mwr_file_prefix'],
-                                                                      self.wigos, self.inst_id)))
-        
-        if not list_of_files:
+        if not self.get_file_index().mwr_files(self.wigos, self.inst_id):
             err_msg = 'No MWR data found in {}'.format(self.conf['data']['mwr_dir'])
             logger.error(err_msg)
             raise MissingDataError(err_msg)
@@ -103,6 +93,18 @@ class InstrumentSelector(object):
                                                self.wigos, self.inst_id)
         self.inst_conf = get_inst_config(os.path.join(self.conf['data']['inst_config_dir'], inst_conf_file))
 
+    def release(self):
+        """release the lease on the selected instrument (if leases are used)"""
+        if self.leases is not None and self.wigos is not None:
+            self.leases.release(self.wigos, self.inst_id)
+
+    def get_file_index(self):
+        """get the :class:`mwr_l12l2.utils.file_index.FileIndex` of the input directories (updated to current state)"""
+        if self.file_index is None:
+            self.file_index = FileIndex.from_conf(self.conf)
+        self.file_index.refresh()
+        return self.file_index
+
     def list_obs_files(self):
         """get file lists for the selected station
 
@@ -110,11 +112,9 @@ class InstrumentSelector(object):
              this method shall list all (MWR) files not just the ones matching time settings. Like that old (obsolete)
              files are removed when :meth:`prepare_obs` is run with delete_mwr_in=True
         """
-        self.mwr_files = glob.glob(os.path.join(self.conf['data']['mwr_dir'],
-                                                '{}*{}_{}*.nc'.format(self.conf['data']['mwr_file_prefix'],
-                                                                      self.wigos, self.inst_id)))
-        self.alc_files = glob.glob(os.path.join(self.conf['data']['alc_dir'],
-                                                '{}*{}*.nc'.format(self.conf['data']['alc_file_prefix'], self.wigos)))
+        file_index = self.get_file_index()
+        self.mwr_files = file_index.mwr_files(self.wigos, self.inst_id)
+        self.alc_files = file_index.alc_files(self.wigos)
         if not self.mwr_files:
             err_msg = ('No MWR data for {} {} found in {}. These files must have been removed between station selection'
                        ' and file listing. This should not happen!'.format(self.wigos, self.inst_id,
@@ -131,23 +131,26 @@ class InstrumentSelector(object):
             end_time (optional): latest time from which to consider data. If not specified, all data received by now is
                 processed.
         """
-        if wigos is not None and inst_id is not None:
-            self.set_instrument(wigos, inst_id)
-        else:
-            self.select_oldest()
-        self.list_obs_files()
-
-        # Necessary information to perform the retrieval for the selected instrument
-        selected_instrument = {
-            'wigos': self.wigos,
-            'inst_id': self.inst_id,
-            'inst_conf': self.inst_conf,
-            'mwr_files': self.mwr_files,
-            'alc_files': self.alc_files
-        }
-
-        ret = Retrieval(self.conf, selected_instrument, node=1)
-        ret.run(start_time, end_time)
+        try:
+            if wigos is not None and inst_id is not None:
+                self.set_instrument(wigos, inst_id)
+            else:
+                self.select_oldest()
+            self.list_obs_files()
+
+            # Necessary information to perform the retrieval for the selected instrument
+            selected_instrument = {
+                'wigos': self.wigos,
+                'inst_id': self.inst_id,
+                'inst_conf': self.inst_conf,
+                'mwr_files': self.mwr_files,
+                'alc_files': self.alc_files
+            }
+
+            ret = Retrieval(self.conf, selected_instrument, node=1)
+            ret.run(start_time, end_time)
+        finally:
+            self.release()
 
 if __name__ == '__main__':
     start = time.time()
@@ -0,0 +1,141 @@
+import glob
+import json
+import os
+
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.log import logger
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.data_utils import concat_unique, get_from_nc_files
+from mwr_l12l2.utils.file_utils import abs_file_path
+from mwr_l12l2.utils.publish import atomic_output
+
+SOURCE_ATTR = 'l1_source'  # attribute of the store files describing the buffered L1 file and its attributes (JSON)
+
+_buffers = {}  # L1 buffers of the current process by instrument (wigos, inst_id)
+
+
+class L1Buffer(object):
+    """rolling buffer of the L1 data of one MWR instrument for successive retrievals with overlapping time windows
+
+    Each L1 file is only read once (unless it is modified) and kept with the selected variables. Files which are not
+    requested anymore, i.e. which have become older than the time window of the retrievals or have been removed, are
+    evicted. The data served are the same as those from :func:`mwr_l12l2.utils.data_utils.get_from_nc_files` for the
+    requested files, including the removal of duplicate time samples.
+
+    The buffer lives in memory, which is useful for long-lived processes like the workers of the
+    :class:`mwr_l12l2.retrieval.retrieval_daemon.RetrievalDaemon`. If a store directory is given, the buffer is also
+    kept on disk as one NetCDF file per buffered L1 file and read from there by a new process. Only the files newly read
+    are written to the store and the files of evicted L1 files are deleted, so the I/O per change scales with the new
+    data and not with the size of the buffer. The buffer is also used for the cloud base data of the ALC files of a
+    station (see :mod:`mwr_l12l2.retrieval.alc_reader`).
+
+    Args:
+        data_vars (optional): variables to read from the L1 files. Defaults to None, i.e. all variables
+        store_dir (optional): directory for storing the buffer on disk. Defaults to None, i.e. memory only
+    """
+
+    def __init__(self, data_vars=None, store_dir=None):
+        self.data_vars = data_vars
+        self.store_dir = store_dir
+        self.files = {}  # buffered data by L1 file as tuple of file signature and dataset
+        self._store_checked = store_dir is None
+
+    def get(self, files):
+        """get the data of the L1 files as :class:`xarray.Dataset`, reading only files not buffered yet
+
+        Args:
+            files: list of L1 files sorted by their timestamp. All other buffered files are evicted
+        """
+        if not self._store_checked:
+            self.load_store()
+            self._store_checked = True
+
+        buffered = {}
+        new_files = []
+        for file in files:
+            signature = file_signature(file)
+            if file in self.files and self.files[file][0] == signature:
+                buffered[file] = self.files[file]
+            else:
+                buffered[file] = (signature, get_from_nc_files([file], data_vars=self.data_vars))
+                new_files.append(file)
+        evicted = [file for file in self.files if file not in buffered]
+        self.files = buffered
+        logger.info('Buffer read {} of {} files'.format(len(new_files), len(files)))
+
+        if self.store_dir is not None:
+            self.update_store(new_files, evicted)
+        return concat_unique([self.files[file][1] for file in files])
+
+    def store_file(self, file):
+        """get the file in the store directory holding the buffered data of an L1 file"""
+        return os.path.join(self.store_dir, os.path.basename(file))
+
+    def load_store(self):
+        """load the buffer from the store directory (if existing)"""
+        for store_file in sorted(glob.glob(os.path.join(self.store_dir, '*.nc'))):
+            try:
+                data = xr.load_dataset(store_file)
+                entry = json.loads(data.attrs[SOURCE_ATTR])
+            except (OSError, KeyError, ValueError):  # e.g. removed by another process in the meantime
+                continue
+            data.attrs = entry['attrs']
+            self.files[entry['file']] = ((entry['mtime_ns'], entry['size']), data)
+
+    def update_store(self, new_files, evicted):
+        """write the data of newly read L1 files to the store and remove the data of evicted L1 files from it
+
+        Each store file is replaced atomically, so that other processes never see a partially written file
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        for file in new_files:
+            signature, data = self.files[file]
+            source = dict(file=file, mtime_ns=signature[0], size=signature[1], attrs=data.attrs)
+            store = data.copy()
+            store.attrs = {SOURCE_ATTR: json.dumps(source, default=_to_json)}
+            with atomic_output(self.store_file(file)) as tmp_file:
+                store.to_netcdf(tmp_file)
+        for file in evicted:
+            try:
+                os.remove(self.store_file(file))
+            except FileNotFoundError:
+                pass
+
+
+def file_signature(file):
+    """get modification time (in ns) and size of a file for finding out whether it has changed"""
+    stat = os.stat(file)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _to_json(value):
+    """transform numpy types in attributes for JSON output"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value.item()
+
+
+def get_l1_buffer(conf, wigos, inst_id, data_vars=None):
+    """get the :class:`L1Buffer` of an instrument in the current process or None if disabled in the retrieval config
+
+    The buffer is enabled by 'l1_buffer' of the 'processing' section of the retrieval config. If 'l1_buffer_dir' is set,
+    the buffer is also stored in this dir, otherwise it is kept in memory only.
+
+    Args:
+        conf: retrieval configuration dictionary
+        wigos: WIGOS-ID of the station
+        inst_id: instrument ID
+        data_vars (optional): variables to read from the L1 files. Defaults to None, i.e. all variables
+    """
+    if not get_processing_conf(conf, 'l1_buffer', False):
+        return None
+    key = (wigos, inst_id)
+    if key not in _buffers:
+        store_dir = None
+        buffer_dir = get_processing_conf(conf, 'l1_buffer_dir')
+        if buffer_dir is not None:
+            store_dir = os.path.join(abs_file_path(buffer_dir), 'l1_buffer_{}_{}'.format(wigos, inst_id))
+        _buffers[key] = L1Buffer(data_vars, store_dir)
+    return _buffers[key]
@@ -1,22 +1,29 @@
 import glob
 import os
-import shutil
 
 import datetime as dt
 import numpy as np
 import xarray as xr
 
-from mwr_l12l2.errors import MissingDataError, MWRConfigError, MWRInputError, MWRRetrievalError
+from mwr_l12l2.errors import MissingDataError, MWRConfigError, MWRInputError, MWRRetrievalError, \
+    TropoeContainerError
 from mwr_l12l2.log import logger
-from mwr_l12l2.model.ecmwf.interpret_ecmwf import ModelInterpreter
-from mwr_l12l2.retrieval.tropoe_helpers import model_to_tropoe, run_tropoe, transform_units, height_to_altitude, extract_prior, extract_avk, extract_attrs, add_variables_attrs, add_flags
-from mwr_l12l2.utils.config_utils import get_retrieval_config, get_inst_config, get_nc_format_config, get_conf
+from mwr_l12l2.model.ecmwf.model_profiles import get_model_profiles
+from mwr_l12l2.retrieval.admission import check_admission
+from mwr_l12l2.retrieval.alc_reader import get_alc_data
+from mwr_l12l2.retrieval.l1_buffer import get_l1_buffer
+from mwr_l12l2.retrieval.tropoe_helpers import model_to_tropoe, run_tropoe, transform_units, height_to_altitude, extract_state, extract_attrs, add_variables_attrs, add_flags
+from mwr_l12l2.retrieval.tropoe_input import ALC_VARS, MWR_VARS, get_tropoe_input_format, write_tropoe_input
+from mwr_l12l2.retrieval.workspace import STATIC_SUBDIR, clean_dir, tropoe_node_dir
+from mwr_l12l2.utils.config_utils import get_retrieval_config, get_inst_config, get_conf, get_processing_conf
 from mwr_l12l2.utils.data_utils import datetime64_to_str, get_from_nc_files, has_data, datetime64_to_hour, \
-    scalars_to_time, vectors_to_time
+    scalars_to_time, select_time, vectors_to_time
+from mwr_l12l2.utils.file_index import FileIndex
 from mwr_l12l2.utils.file_utils import abs_file_path, concat_filename, datetime64_from_filename, dict_to_file, \
-    generate_output_filename
-from mwr_l12l2.write_netcdf import Writer
-
+    files_covering, generate_output_filename
+from mwr_l12l2.utils.merge_netcdf import merge_nc_files
+from mwr_l12l2.utils.publish import get_output_publisher
+from mwr_l12l2.write_netcdf import Writer, get_write_plan
 
 class Retrieval(object):
     """Class for gathering and preparing all necessary information to run the retrieval
@@ -24,9 +31,15 @@ class Retrieval(object):
     Args:
         conf: configuration file or dictionary
         node: identifier for different parallel TROPoe runs. Defaults to 0.
+        tropoe_pool (optional): :class:`mwr_l12l2.retrieval.tropoe_pool.TropoePool` with long-lived TROPoe containers.
+            If the pool contains a container for :obj:`node` the retrieval is dispatched to it, otherwise (or if this
+            container is missing or not running) a one-shot TROPoe container is used. Defaults to None.
+        workspace (optional): :class:`mwr_l12l2.retrieval.workspace.Workspace` leased from a
+            :class:`mwr_l12l2.retrieval.workspace.WorkspaceManager`. If provided, the retrieval runs in this (already
+            clean) workspace and :obj:`node` is taken from it. Defaults to None.
     """
 
-    def __init__(self, conf, selected_instrument=None, node=0):
+    def __init__(self, conf, selected_instrument=None, node=0, tropoe_pool=None, workspace=None):
         if isinstance(conf, dict):
             self.conf = conf
         elif os.path.isfile(conf):
@@ -54,7 +67,10 @@ class Retrieval(object):
             self.mwr_files = None
             self.alc_files = None
         
-        self.node = node
+        self.workspace = workspace
+        self.node = node if workspace is None else workspace.node
+        self.file_index = None  # set by get_file_index()
+        self.tropoe_pool = tropoe_pool
 
         # set by prepare_pahts():
         self.tropoe_dir = None  # directory to store temporary data and config files for the current run of TROPoe
@@ -66,7 +82,7 @@ class Retrieval(object):
         self.tropoe_dir_mountpoint = None  # mountpoint for tropoe_dir inside the TROPoe container
 
         # set by prepare_obs():
-        self.mwr = None  # Level1 contents of MWR instrument for considered time period
+        self.mwr = None  # Level1 contents of MWR instrument for considered time period (no tb if l1_stream_merge)
         self.time_min = None  # min time of MWR observations available and considered
         self.time_max = None  # max time of MWR observations available and considered
         self.time_mean = None  # average time of period containing considered MWR observations
@@ -91,6 +107,19 @@ class Retrieval(object):
             end_time (optional): latest time from which to consider data. If not specified, all data received by now is
                 processed.
         """
+        self.prepare(start_time, end_time)
+        self.do_retrieval()
+        self.postprocess_tropoe()
+        # TODO: adapt drawing on https://meteoswiss.atlassian.net/wiki/spaces/MDA/pages/46564537/L2+retrieval+EWC
+        #  by inverting order between interpret_ecmwf and prepare_eprofile
+
+    def prepare(self, start_time=None, end_time=None):
+        """prepare all inputs for TROPoe up to the vip file (i.e. the part of :meth:`run` before the TROPoe run)
+
+        Args:
+            start_time (optional): see :meth:`run`
+            end_time (optional): see :meth:`run`
+        """
         if start_time is not None and not isinstance(start_time, dt.datetime):
             logger.error("input argument 'start_time' is expected to be of type datetime.datetime or None")
             raise MWRInputError("input argument 'start_time' is expected to be of type datetime.datetime or None")
@@ -101,15 +130,18 @@ class Retrieval(object):
 
         datestamp = start_time.strftime('%Y%m%d')
 
-        self.prepare_paths(datestamp)
-        self.prepare_tropoe_dir()
-
         # Now only new instrument selection if not provided by a RetrievalManager or an InstrumentSelector
         if self.wigos is None:
             logger.info('No instrument specified. Selecting the oldest one.')
             self.select_instrument()
             self.list_obs_files()
 
+        # reject hopeless retrievals before setting up the workspace and loading any data
+        check_admission(self.conf, self.wigos, self.inst_conf, self.mwr_files, start_time, end_time)
+
+        self.prepare_paths(datestamp)
+        self.prepare_tropoe_dir()
+
         self.prepare_obs(start_time=start_time, end_time=end_time,
                          delete_mwr_in=False)  # TODO: switch delete_mwr_in to True for operational processing
         # TODO: Make sure that we have at least 10 minutes of data before running the retrieval and deleting files !
@@ -134,15 +166,13 @@ class Retrieval(object):
                 logger.warning('No model data will be used for the retrieval')
             
         self.prepare_vip()
-        self.do_retrieval()
-        self.postprocess_tropoe()
-        # TODO: adapt drawing on https://meteoswiss.atlassian.net/wiki/spaces/MDA/pages/46564537/L2+retrieval+EWC
-        #  by inverting order between interpret_ecmwf and prepare_eprofile
 
     def prepare_paths(self, datestamp='', netcdf_ext='.nc'):
         """prepare input and output paths and filenames from config"""
-        self.tropoe_dir = os.path.join(self.conf['data']['tropoe_basedir'],
-                                       '{}{}/'.format(self.conf['data']['tropoe_subfolder_basename'], self.node))
+        if self.workspace is not None:
+            self.tropoe_dir = self.workspace.path
+        else:
+            self.tropoe_dir = tropoe_node_dir(self.conf, self.node)
         self.vip_file_tropoe = os.path.join(self.tropoe_dir, self.conf['data']['vip_filename_tropoe'])
         self.mwr_file_tropoe = os.path.join(self.tropoe_dir,
                                             self.conf['data']['mwr_basefilename_tropoe'] + datestamp + netcdf_ext)
@@ -155,10 +185,17 @@ class Retrieval(object):
         self.tropoe_dir_mountpoint = self.conf['data']['tropoe_dir_mountpoint']
 
     def prepare_tropoe_dir(self):
-        """set up an empty tropoe tmp file directory for the current node (remove old one if existing)"""
-        if os.path.exists(self.tropoe_dir):
-            shutil.rmtree(self.tropoe_dir)
-        os.mkdir(self.tropoe_dir)
+        """set up an empty tropoe tmp file directory for the current node (empty old one if existing)
+
+        The directory itself is kept as it might be bind-mounted into a long-lived TROPoe container. Nothing to do for
+        leased workspaces as they are cleaned by the :class:`mwr_l12l2.retrieval.workspace.WorkspaceManager`
+        """
+        if self.workspace is not None:
+            return
+        if not os.path.exists(self.tropoe_dir):
+            os.makedirs(self.tropoe_dir)
+            return
+        clean_dir(self.tropoe_dir, keep=[STATIC_SUBDIR])
 
     def select_instrument(self):
         """Selects the instrument which has the oldest MWR file in the input directory (based on its filename).
@@ -172,27 +209,12 @@ class Retrieval(object):
         Raises:
             MissingDataError: If no MWR data is found in the specified directory.
         """
-        list_of_files = glob.glob(os.path.join(self.conf['data']['mwr_dir'],
-                                               '{}*.nc'.format(self.conf['data']['mwr_file_prefix'])))
-        
-        if not list_of_files:
-            logger.error('No MWR data found in {}'.format(self.conf['data']['mwr_dir']))
-            raise MissingDataError('No MWR data found in {}'.format(self.conf['data']['mwr_dir']))
-        
-        # extract filename and dates of all files
-        list_of_file_date = [os.path.basename(x).split('/')[-1].split('_')[3] for x in list_of_files]
-        list_of_dates = [dt.datetime.strptime(x[1:-3], '%Y%m%d%H%M%S') for x in list_of_file_date]
-
-        # get oldest file based on the date in the filename:
-        id_oldest = list_of_dates.index(min(list_of_dates))
-        oldest_file = list_of_files[id_oldest]
-        
-        # get station id from filename
-        self.wigos = oldest_file.split('/')[-1].split('_')[2]
-        #self.wigos = '0-20000-0-10505'
-        
-        self.inst_id = oldest_file.split('/')[-1].split('_')[3][0]
-        #self.inst_id = 'A'
+        file_index = self.get_file_index()
+        try:
+            self.wigos, self.inst_id = file_index.oldest_instrument()
+        except MissingDataError as e:
+            logger.error(e)
+            raise
 
         inst_conf_file = '{}{}_{}.yaml'.format(self.conf['data']['inst_config_file_prefix'],
                                                self.wigos, self.inst_id)
@@ -200,6 +222,13 @@ class Retrieval(object):
 
         self.tropoe_output_basename = self.conf['data']['result_basefilename_tropoe'] + '_' + self.wigos + self.inst_id
 
+    def get_file_index(self):
+        """get the :class:`mwr_l12l2.utils.file_index.FileIndex` of the input directories (updated to current state)"""
+        if self.file_index is None:
+            self.file_index = FileIndex.from_conf(self.conf)
+        self.file_index.refresh()
+        return self.file_index
+
     def list_obs_files(self):
         """get file lists for the selected station
 
@@ -207,11 +236,9 @@ class Retrieval(object):
              this method shall list all (MWR) files not just the ones matching time settings. Like that old (obsolete)
              files are removed when :meth:`prepare_obs` is run with delete_mwr_in=True
         """
-        self.mwr_files = glob.glob(os.path.join(self.conf['data']['mwr_dir'],
-                                                '{}*{}_{}*.nc'.format(self.conf['data']['mwr_file_prefix'],
-                                                                      self.wigos, self.inst_id)))
-        self.alc_files = glob.glob(os.path.join(self.conf['data']['alc_dir'],
-                                                '{}*{}*.nc'.format(self.conf['data']['alc_file_prefix'], self.wigos)))
+        file_index = self.get_file_index()
+        self.mwr_files = file_index.mwr_files(self.wigos, self.inst_id)
+        self.alc_files = file_index.alc_files(self.wigos)
         if not self.mwr_files:
             err_msg = ('No MWR data for {} {} found in {}. These files must have been removed between station selection'
                        ' and file listing. This should not happen!'.format(self.wigos, self.inst_id,
@@ -240,15 +267,38 @@ class Retrieval(object):
         start_time = np.datetime64(start_time)
         end_time = np.datetime64(end_time)
 
-        # MWR treatment
-        mwr = get_from_nc_files(self.mwr_files)
+        # MWR treatment. Only read files which can contain data of the time range (judged from timestamp in filename)
+        mwr_files_covering = files_covering(self.mwr_files, start_time, end_time)
+        if not mwr_files_covering:
+            logger.error('All MWR files found for {} {} start after the required end time ({})'.format(
+                self.wigos, self.inst_id, end_time))
+            raise MissingDataError('All MWR files found for {} {} start after the required end time ({})'.format(
+                self.wigos, self.inst_id, end_time))
+        l1_buffer = get_l1_buffer(self.conf, self.wigos, self.inst_id, data_vars=MWR_VARS)
+        stream_merge = l1_buffer is None and get_processing_conf(self.conf, 'l1_stream_merge', False)
+        if stream_merge:
+            # merge directly to the input file for TROPoe and only load the series without frequency dim for the checks
+            # plus the frequencies needed for the vip file
+            time_max_in = merge_nc_files(mwr_files_covering, self.mwr_file_tropoe, MWR_VARS, start_time, end_time,
+                                         nc_format=get_tropoe_input_format(self.conf))
+            with xr.open_dataset(self.mwr_file_tropoe) as mwr_merged:
+                mwr = mwr_merged[[var for var in mwr_merged.data_vars if 'frequency' not in mwr_merged[var].dims]]
+                mwr = mwr.assign_coords(frequency=mwr_merged.frequency).load()
+        else:
+            if l1_buffer is None:
+                mwr = get_from_nc_files(mwr_files_covering, data_vars=MWR_VARS)
+            else:
+                mwr = l1_buffer.get(mwr_files_covering)
+            time_max_in = mwr.time.max().values
+        data_after_end_time = (not np.isnat(end_time)) and any(
+            datetime64_from_filename(file) > end_time for file in self.mwr_files)
 
         self.time_min = max(mwr.time.min().values, start_time) 
         self.time_max = min(mwr.time.max().values, end_time)
         self.time_mean = self.time_min + (self.time_max - self.time_min) / 2  # need to work with diff to get timedelta 
             
         # If the provided end_time is smaller than the time present in the mwr files, we should not delete the files
-        if end_time < mwr.time.max().values:
+        if end_time < time_max_in:
             Warning('The provided end_time is smaller than the time present in the mwr files. ')
 
         self.time_min = max(mwr.time.min().values, start_time) 
@@ -261,13 +311,12 @@ class Retrieval(object):
         self.time_mean = self.time_min + (self.time_max - self.time_min) / 2  # need to work with diff to get timedelta 
         
         # If the provided end_time is smaller than the time present in the mwr files, we should not delete the files
-        if self.time_max < mwr.time.max().values:
+        if self.time_max < time_max_in or data_after_end_time:
             delete_mwr_in=False
             logger.warning('The provided end_time is smaller than the time present in the mwr files. ')
             Warning('The provided end_time is smaller than the time present in the mwr files. ')
 
-        mwr = mwr.where((mwr.time >= self.time_min) & (mwr.time <= self.time_max),
-                        drop=True)  # brackets because of precedence of & over > and <
+        mwr = select_time(mwr, self.time_min, self.time_max)
         
         # Add here a check on the time_min and time_max to make sure that we have at least 10 minutes of data
         # Before file deletion so that the files are kept for the next retrievals
@@ -322,7 +371,8 @@ class Retrieval(object):
             logger.error('The station coordinates in the MWR file do not match the ones in the config file')
             raise MissingDataError('The station coordinates in the MWR file do not match the ones in the config file')
         
-        mwr.to_netcdf(self.mwr_file_tropoe)
+        if not stream_merge:
+            write_tropoe_input(mwr, self.mwr_file_tropoe, MWR_VARS, get_tropoe_input_format(self.conf))
 
         self.sfc_temp_obs_exists = has_data(mwr, 'air_temperature')
         self.sfc_rh_obs_exists = has_data(mwr, 'relative_humidity')
@@ -334,13 +384,12 @@ class Retrieval(object):
         self.alc_exists = True  # start assuming ALC obs exist, set to False if not.
         if self.alc_files:  # not empty list, not None
             # careful: MeteoSwiss daily concat files have problem with calendar. Use instant files or concat at CEDA
-            alc = get_from_nc_files(self.alc_files)
-            alc = alc.where((alc.time >= self.time_min - tolerance_alc_time)
-                                & (alc.time <= self.time_max + tolerance_alc_time), drop=True)
+            alc = get_alc_data(self.conf, self.wigos, self.alc_files, self.time_min - tolerance_alc_time,
+                               self.time_max + tolerance_alc_time)
             if alc.time.size == 0:
                 self.alc_exists = False
             else:
-                alc.to_netcdf(self.alc_file_tropoe)
+                write_tropoe_input(alc, self.alc_file_tropoe, ALC_VARS, get_tropoe_input_format(self.conf))
         else:
             self.alc_exists = False
 
@@ -376,14 +425,20 @@ class Retrieval(object):
             raise MissingDataError('found no model file containing model altitude grid points')
 
     def prepare_model(self):
-        """extract reference profile and uncertainties as well as surface data from ECMWF to files readable by TROPoe"""
-        model = ModelInterpreter(self.model_fc_file, self.model_zg_file)
-        model.run(self.time_min, self.time_max)
+        """extract reference profile and uncertainties as well as surface data from ECMWF to files readable by TROPoe
+
+        The profiles are taken from the model profiles product of the forecast, which is computed for all forecast steps
+        at once by the first retrieval using the forecast (or beforehand by
+        :func:`mwr_l12l2.model.ecmwf.ingest_ecmwf.ingest_forecasts`)
+        """
+        profiles = get_model_profiles(self.conf, self.model_fc_file, self.model_zg_file)
+        model = profiles.select_time(self.time_min, self.time_max)
         prof_data, sfc_data = model_to_tropoe(model, station_altitude=self.inst_conf['station_altitude'])
-        prof_data.to_netcdf(self.model_prof_file_tropoe)
+        nc_format = get_tropoe_input_format(self.conf)
+        write_tropoe_input(prof_data, self.model_prof_file_tropoe, nc_format=nc_format)
         self.met_sfc_offset = int(1e3*sfc_data.height.mean(dim='time').data)
         if not (self.sfc_temp_obs_exists & self.sfc_rh_obs_exists & self.sfc_p_obs_exists):
-            sfc_data.to_netcdf(self.model_sfc_file_tropoe)
+            write_tropoe_input(sfc_data, self.model_sfc_file_tropoe, nc_format=nc_format)
         
     def prepare_vip(self):
         """prepare the vip configuration file for running the TROPoe container"""
@@ -469,14 +524,61 @@ class Retrieval(object):
         dict_to_file(self.conf['vip'], self.vip_file_tropoe, sep=' = ', header=header,
                      remove_brackets=True, remove_parentheses=True, remove_braces=True)
 
-    def do_retrieval(self):
-        """run the retrieval using the TROPoe container"""
+    def tropoe_job(self):
+        """get the arguments describing the TROPoe run of this retrieval as a dictionary"""
         # TODO: decide which a-priori file to use. associate with inst or general? where to store this config:
         #  inst config file, some DB or a apriori config file with info for all instruments
         apriori_file = 'prior.MIDLAT.nc'  # located outside TROPoe container unless starting with prior.*
-        date = datetime64_to_str(self.time_mean, '%Y%m%d')
-        run_tropoe(self.tropoe_dir, date, datetime64_to_hour(self.time_min), datetime64_to_hour(self.time_max),
-                   self.vip_file_tropoe, apriori_file, verbosity=1)
+        if self.workspace is not None and self.workspace.static_file(apriori_file) is not None:
+            apriori_file = self.workspace.static_file(apriori_file)  # prefer copy from static area of workspace
+        return dict(date=datetime64_to_str(self.time_mean, '%Y%m%d'),
+                    start_hour=datetime64_to_hour(self.time_min),
+                    end_hour=datetime64_to_hour(self.time_max),
+                    vip_file=self.vip_file_tropoe,
+                    apriori_file=apriori_file)
+
+    def do_retrieval(self):
+        """run the retrieval using the TROPoe container
+
+        Raises:
+            MWRRetrievalError: if the TROPoe run exceeds the 'tropoe_timeout' or exits with an error
+        """
+        job = self.tropoe_job()
+        if self.tropoe_pool is not None and self.node in self.tropoe_pool:
+            try:
+                self.tropoe_pool.run(self.node, verbosity=1, **job)
+                return
+            except TropoeContainerError as e:  # only retry for container failures, not for TROPoe errors
+                logger.warning('{}. Falling back to one-shot TROPoe container'.format(e))
+                self.remove_tropoe_outputs()
+        timeout = get_processing_conf(self.conf, 'tropoe_timeout')
+        tropoe_run = run_tropoe(self.tropoe_dir, data_mountpoint=self.tropoe_dir_mountpoint,
+                                tropoe_img=get_processing_conf(self.conf, 'tropoe_image', 'davidturner53/tropoe'),
+                                verbosity=1, name='tropoe_run_{}'.format(self.node), timeout=timeout, **job)
+        if tropoe_run is None:
+            raise MWRRetrievalError('TROPoe run for {} {} exceeded timeout of {} s'.format(self.wigos, self.inst_id,
+                                                                                         timeout))
+        if tropoe_run.returncode != 0:
+            raise MWRRetrievalError('TROPoe run for {} {} exited with code {}'.format(self.wigos, self.inst_id,
+                                                                                    tropoe_run.returncode))
+
+    async def do_retrieval_async(self, executor):
+        """run the retrieval in a TROPoe container from within an asyncio event loop
+
+        Args:
+            executor: :class:`mwr_l12l2.retrieval.tropoe_async.AsyncTropoeExecutor` running the container
+
+        Returns:
+            :class:`mwr_l12l2.retrieval.tropoe_async.TropoeRunStatus` of the TROPoe run
+        """
+        return await executor.run(self.node, self.tropoe_dir, data_mountpoint=self.tropoe_dir_mountpoint,
+                                  tropoe_img=get_processing_conf(self.conf, 'tropoe_image', 'davidturner53/tropoe'),
+                                  verbosity=1, **self.tropoe_job())
+
+    def remove_tropoe_outputs(self):
+        """remove possible (partial) outputs of a previous TROPoe run in the current tropoe directory"""
+        for file in glob.glob(os.path.join(self.tropoe_dir, self.tropoe_output_basename + '*.nc')):
+            os.remove(file)
 
     def postprocess_tropoe(self):
         """post-process the outputs of TROPoe and write to NetCDF file matching the E-PROFILE format"""
@@ -498,7 +600,9 @@ class Retrieval(object):
         tropoe_out_config = get_conf(abs_file_path('mwr_l12l2/config/tropoe_output_config.yaml'))
 
         # Some variables needs to be extracted from TROPoe output (e.g. prior for each quantity)
-        data = extract_prior(data, tropoe_out_config) 
+        data = extract_state(data, tropoe_out_config, 'prior')
+        priors = ['{}_prior'.format(quantity) for quantity in tropoe_out_config['extract_quantities']
+                  if '{}_prior'.format(quantity) in data]
         
         # Some variables needs to be propagated from L1
         # e.g azi
@@ -507,12 +611,13 @@ class Retrieval(object):
         data = transform_units(data)
 
         data = height_to_altitude(data, self.mwr.station_altitude)
-        data = scalars_to_time(data, ['lat', 'lon', 'azi', 'station_altitude','lwp_prior'])  # to be executed after height_to_altitude 
-        data = vectors_to_time(data, ['temperature_prior', 'waterVapor_prior']) 
+        data = scalars_to_time(data, ['lat', 'lon', 'azi', 'station_altitude']
+                               + [var for var in priors if data[var].ndim == 0])  # to be executed after height_to_altitude
+        data = vectors_to_time(data, [var for var in priors if data[var].ndim > 0])
         # TODO: add postprocessing calculations for derived quantities, e.g. forecast indices
 
         # TODO: xarray has problem with duplicate dimensions... for now we use a renamed altitude axis which is the same as the main one.
-        data = extract_avk(data, tropoe_out_config)
+        data = extract_state(data, tropoe_out_config, 'avk')
 
         data = add_flags(data)
 
@@ -549,21 +654,20 @@ class Retrieval(object):
         
         # write output  # TODO probably better split into seperate method
         nc_format_config_file = abs_file_path('mwr_l12l2/config/L2_format.yaml')
-        conf_nc = get_nc_format_config(nc_format_config_file)
+        write_plan = get_write_plan(nc_format_config_file)
         basename = os.path.join(self.conf['data']['output_dir'], self.conf['data']['output_file_prefix']
                                 + self.wigos + '_' + self.inst_id)
         #TODO: at the moment use mwr_files for filename and not the actual retrieved period: TO CHANGE !
         filename = generate_output_filename(basename, 'time_mean', files_in=self.mwr_files, time=data.time)
-        nc_writer = Writer(data, filename, conf_nc)
+        nc_writer = Writer(data, filename, write_plan)
         nc_writer.run()
-        # copy file to other location:
+        # duplicate output and TROPoe output to other location (linked if possible, else copied in background):
         # check if filename exist:
         if os.path.isfile(filename) & ('output_dir_copy' in self.conf['data']):
-            # copy file to other location:
-            shutil.copy(filename, self.conf['data']['output_dir_copy'])
-            logger.info(filename+' copied to'+self.conf['data']['output_dir_copy'])
-            shutil.copy(outfiles[0], self.conf['data']['output_dir_copy'])
-            logger.info(outfiles[0]+' copied to'+self.conf['data']['output_dir_copy'])
+            publisher = get_output_publisher()
+            for file in [filename, outfiles[0]]:
+                how = publisher.duplicate(file, self.conf['data']['output_dir_copy'])
+                logger.info('{} duplicated to {} ({})'.format(file, self.conf['data']['output_dir_copy'], how))
 
 if __name__ == '__main__':
     ret = Retrieval(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
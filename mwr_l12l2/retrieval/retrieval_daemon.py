@@ -0,0 +1,238 @@
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+from mwr_l12l2.errors import MissingDataError
+from mwr_l12l2.log import logger
+from mwr_l12l2.model.ecmwf.ingest_ecmwf import ingest_forecasts
+from mwr_l12l2.retrieval.retrieval_manager import RetrievalManager
+from mwr_l12l2.retrieval.scheduler import OUTCOME_DEFERRED, OUTCOME_FAILED, RetrievalJob, RetrievalScheduler, \
+    job_slack
+from mwr_l12l2.retrieval.tropoe_pool import TropoePool
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional, fall back to polling the input directories
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class RetrievalDaemon(object):
+    """Long-running retrieval service triggered by the arrival of new input files
+
+    The daemon watches mwr_dir, alc_dir and model_dir (using watchdog if installed, otherwise by polling) and keeps
+    the retrieval config, the :class:`mwr_l12l2.utils.file_index.FileIndex` of the inputs and the worker processes of a
+    :class:`mwr_l12l2.retrieval.scheduler.RetrievalScheduler` alive between cycles. Arrivals are debounced per
+    instrument, i.e. an instrument is only considered once no new file has arrived for it during 'daemon_debounce'
+    seconds. A retrieval is triggered as soon as the new data of an instrument span at least vip.tres minutes or the
+    oldest new file has been waiting for that long. Instruments whose retrieval failed are retried after a new model
+    file has arrived even if no new MWR data have arrived for them.
+
+    Args:
+        conf: configuration file or dictionary
+        cores (optional): number of worker processes. Defaults to 2.
+        use_pool (optional): use long-lived TROPoe containers. If None, the 'tropoe_pool' setting of the 'processing'
+            section in the retrieval config is used. Defaults to None.
+    """
+
+    def __init__(self, conf, cores=2, use_pool=None):
+        self.manager = RetrievalManager(conf)
+        self.conf = self.manager.conf
+        self.cores = cores
+        self.use_pool = self.manager.use_tropoe_pool(use_pool)
+        self.poll_interval = get_processing_conf(self.conf, 'daemon_poll_interval', 10)
+        self.debounce = get_processing_conf(self.conf, 'daemon_debounce', 5)
+        self.min_data = np.timedelta64(int(self.conf['vip']['tres']), 'm')
+
+        self.scheduler = None
+        self.observer = None
+        self._wake = threading.Event()  # set by file system events to trigger a check before the poll interval ends
+        self._stop = threading.Event()
+
+        self._latest_file = {}  # newest MWR file seen for each instrument (wigos, inst_id)
+        self._last_arrival = {}  # time.monotonic() of last arrival of an MWR file for each instrument
+        self._waiting_since = {}  # time.monotonic() of the first arrival of not yet processed data for each instrument
+        self._processed_until = {}  # timestamp of the newest MWR file included in the last retrieval of each instrument
+        self._failed = set()  # instruments whose last retrieval failed
+        self._model_mtime = None
+
+    def start(self):
+        """start the worker processes, the TROPoe container pool (if used) and the file system observer"""
+        nodes = [10*(1+n) for n in range(self.cores)]
+        if self.use_pool:
+            self.manager.tropoe_pool = TropoePool(self.conf, nodes)
+            self.manager.tropoe_pool.start()
+        self.scheduler = RetrievalScheduler(self.conf, self.cores, nodes, self.manager.tropoe_pool)
+        self.scheduler.start()
+
+        if Observer is not None:
+            self.observer = Observer()
+            handler = _WakeUpHandler(self._wake)
+            for key in ['mwr_dir', 'alc_dir', 'model_dir']:
+                self.observer.schedule(handler, str(self.conf['data'][key]), recursive=False)
+            self.observer.start()
+            logger.info('Retrieval daemon watching input directories for new files')
+        else:
+            logger.info('watchdog not installed. Retrieval daemon polling input directories every {} s'.format(
+                self.poll_interval))
+
+    def stop(self):
+        """request the main loop to terminate after the current cycle"""
+        self._stop.set()
+        self._wake.set()
+
+    def close(self):
+        """stop the file system observer, the worker processes and the TROPoe container pool"""
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None
+        self.manager.stop_tropoe_pool()
+
+    def run_forever(self):
+        """run the daemon until :meth:`stop` is called or SIGTERM/SIGINT is received"""
+        if threading.current_thread() is threading.main_thread():
+            for sig in [signal.SIGTERM, signal.SIGINT]:
+                signal.signal(sig, lambda signum, frame: self.stop())
+        self.start()
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                time.sleep(min(self.debounce, 1))  # let burst of events settle before rescanning
+                self.run_cycle()
+        finally:
+            self.close()
+
+    def run_cycle(self):
+        """check the inputs and run the retrievals for all instruments that are ready
+
+        Returns:
+            dictionary with outcome of each job as returned by
+            :meth:`mwr_l12l2.retrieval.scheduler.RetrievalScheduler.run_cycle` (empty if no instrument was ready)
+        """
+        try:
+            self.manager.select_all_instruments()
+        except MissingDataError:
+            return {}
+        self.check_model_arrival()
+        ready = self.ready_instruments()
+        if not ready:
+            return {}
+
+        # only read the instrument configs for the instruments that are ready
+        self.manager.wigos_and_inst_id_unique = ['{}_{}'.format(*inst) for inst in ready]
+        self.manager.retrieval_dict = {}
+        self.manager.prepare_retrieval_dicts()
+
+        for inst in ready:
+            if '{}_{}'.format(*inst) not in self.manager.retrieval_dict:  # no config or leased by other host. Wait for new data
+                self._waiting_since.pop(inst, None)
+                self._processed_until[inst] = self.manager.file_index.timestamp(self._latest_file[inst])
+
+        # instruments whose retrieval cannot succeed wait for new data without being run
+        for wigos_and_id in self.manager.admit_retrievals(None, None):
+            inst = tuple(wigos_and_id.split('_'))
+            self._waiting_since.pop(inst, None)
+            self._processed_until[inst] = self.manager.file_index.timestamp(self._latest_file[inst])
+        if not self.manager.retrieval_dict:
+            self.manager.release_instruments()
+            return {}
+
+        newest = {}  # timestamp of newest file of each instrument included in this cycle
+        for wigos_and_id, selected in self.manager.retrieval_dict.items():
+            newest[wigos_and_id] = self.manager.file_index.timestamp(selected['mwr_files'][-1])
+            self.scheduler.submit(RetrievalJob(selected, None, None, job_slack(selected, self.conf)))
+        logger.info('Retrieval daemon triggering retrievals for {}'.format(', '.join(newest)))
+        if self.manager.tropoe_pool is not None:
+            self.manager.tropoe_pool.check_health()  # replace containers which died since the last cycle
+        try:
+            results = self.scheduler.run_cycle()
+        finally:
+            self.manager.release_instruments()
+
+        for wigos_and_id, (outcome, _, _) in results.items():
+            inst = tuple(wigos_and_id.split('_'))
+            if outcome == OUTCOME_DEFERRED:
+                continue
+            self._processed_until[inst] = newest[wigos_and_id]
+            self._waiting_since.pop(inst, None)
+            if outcome == OUTCOME_FAILED:
+                self._failed.add(inst)
+            else:
+                self._failed.discard(inst)
+        return results
+
+    def ready_instruments(self, now=None):
+        """get the list of instruments (wigos, inst_id) with enough new data which have not received files lately
+
+        Args:
+            now (optional): current time as returned by :func:`time.monotonic`. Defaults to the current time.
+        """
+        if now is None:
+            now = time.monotonic()
+        index = self.manager.file_index
+        ready = []
+        for inst in index.instruments():
+            files = index.mwr_files(*inst)
+            if files[-1] != self._latest_file.get(inst):
+                self._latest_file[inst] = files[-1]
+                self._last_arrival[inst] = now
+                self._waiting_since.setdefault(inst, now)
+            if inst not in self._waiting_since:
+                continue
+            if now - self._last_arrival[inst] < self.debounce:
+                continue  # more files of this instrument might be arriving
+
+            new_start = self._processed_until.get(inst, index.timestamp(files[0]))
+            enough_data = index.timestamp(files[-1]) - new_start >= self.min_data
+            waited_long = now - self._waiting_since[inst] >= self.min_data / np.timedelta64(1, 's')
+            if enough_data or waited_long:
+                ready.append(inst)
+        return ready
+
+    def check_model_arrival(self):
+        """ingest new forecasts and re-enable retrievals of failed instruments if model files have arrived"""
+        try:
+            mtime = os.stat(self.conf['data']['model_dir']).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._model_mtime:
+            ingest_forecasts(self.conf, processes=self.cores)
+        if self._model_mtime is not None and mtime != self._model_mtime and self._failed:
+            logger.info('New model data available. Retrying retrievals for {} failed instruments'.format(
+                len(self._failed)))
+            for inst in self._failed:
+                self._waiting_since.setdefault(inst, time.monotonic())
+            self._failed.clear()
+        self._model_mtime = mtime
+
+
+class _WakeUpHandler(FileSystemEventHandler):
+    """watchdog event handler waking up the daemon on file creation or moves into the watched directories"""
+
+    def __init__(self, wake):
+        super().__init__()
+        self.wake = wake
+
+    def on_created(self, event):
+        self.wake.set()
+
+    def on_moved(self, event):
+        self.wake.set()
+
+
+if __name__ == '__main__':
+    daemon = RetrievalDaemon(abs_file_path('mwr_l12l2/config/retrieval_config_ewc.yaml'), cores=4)
+    daemon.run_forever()
@@ -1,15 +1,39 @@
+import asyncio
+import copy
+import glob
+import json
 import os
 import time
-import glob
 
 import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 
 import datetime as dt
+import numpy as np
 
-from mwr_l12l2.errors import MissingDataError, MWRConfigError
+from mwr_l12l2.errors import AdmissionError, FilenameError, MissingDataError, MWRConfigError
 from mwr_l12l2.log import logger
-from mwr_l12l2.utils.config_utils import abs_file_path, get_retrieval_config, get_inst_config
-from retrieval import Retrieval
+from mwr_l12l2.retrieval.admission import check_admission, log_rejections
+from mwr_l12l2.retrieval.retrieval import Retrieval
+from mwr_l12l2.retrieval.scheduler import OUTCOME_DONE, OUTCOME_REJECTED, OUTCOME_SKIPPED, RetrievalJob, \
+    RetrievalScheduler, job_slack
+from mwr_l12l2.retrieval.tropoe_async import AsyncTropoeExecutor
+from mwr_l12l2.retrieval.tropoe_pool import TropoePool
+from mwr_l12l2.retrieval.workspace import WorkspaceManager
+from mwr_l12l2.utils.config_utils import abs_file_path, get_retrieval_config, get_inst_config, get_processing_conf
+from mwr_l12l2.utils.file_index import FileIndex
+from mwr_l12l2.utils.file_utils import datetime64_from_filename
+from mwr_l12l2.utils.lease import get_instrument_leases
+
+# node of the TROPoe container pool assigned to the current worker process (set by init_worker_node)
+_worker_node = None
+
+
+def init_worker_node(node_queue):
+    """initializer of worker processes taking one node of the TROPoe container pool for the lifetime of the worker"""
+    global _worker_node
+    _worker_node = node_queue.get()
+
 
 class RetrievalManager(object):
     """Class to manage the operational retrieval of MWR data from E-PROFILE
@@ -29,62 +53,49 @@ class RetrievalManager(object):
             logger.error("The argument 'conf' must be a conf dictionary or a path pointing to a config file")
             raise MWRConfigError("The argument 'conf' must be a conf dictionary or a path pointing to a config file")
 
+        self.file_index = None
         self.wigos_list = []
-        self.wigos_and_inst_id_list = []
         self.wigos_and_inst_id_unique = []
         self.mwr_files_dict = {}
         self.alc_files_dict = {}
         self.retrieval_dict = {}
         self.inst_conf = {}
+        self.tropoe_pool = None
+        self.leases = get_instrument_leases(self.conf)  # None if processing by a single host
 
     def select_all_instruments(self):
         """select all instruments which have mwr files in input dir.
 
-        Sets dictionaries for MWR and ALC with all the instruments filenames present in the folder.
+        Sets dictionaries for MWR and ALC with all the instruments filenames present in the folder. The file lists are
+        taken from a :class:`mwr_l12l2.utils.file_index.FileIndex` which is kept across calls and only updated with the
+        changes in the input directories.
         """
-        list_of_files = glob.glob(os.path.join(self.conf['data']['mwr_dir'],
-                                               '{}*.nc'.format(self.conf['data']['mwr_file_prefix'])))
-        
-        if not list_of_files:
+        if self.file_index is None:
+            self.file_index = FileIndex.from_conf(self.conf)
+        self.file_index.refresh()
+        instruments = self.file_index.instruments()
+
+        if not instruments:
             logger.error('No MWR data found in {}'.format(self.conf['data']['mwr_dir']))
             raise MissingDataError('No MWR data found in {}'.format(self.conf['data']['mwr_dir']))
-        
-        # get station id from filenames
-        for filename in list_of_files:
-            self.wigos_list.append(filename.split('/')[-1].split('_')[2])
-            self.wigos_and_inst_id_list.append(filename.split('/')[-1].split('_')[2]+'_'+filename.split('/')[-1].split('_')[3][0])
-        
-        # identify unique wigos and instr_id combination
-        self.wigos_and_inst_id_unique = list(set(self.wigos_and_inst_id_list))
 
-        # split filenames per wigos and put in a dictionary:
-        # TODO: add a filter to only list filenames between start and end time of retrieval 
+        # TODO: add a filter to only list filenames between start and end time of retrieval
         # Otherwise these files will get deleted and not retrieved
-        mwr_files_dict = {}
-        for wigos_and_id in self.wigos_and_inst_id_unique:
-            mwr_files_dict[wigos_and_id] = []
-            for filenames in list_of_files:
-                if wigos_and_id in filenames:
-                    mwr_files_dict[wigos_and_id].append(filenames)
-            
-        self.mwr_files_dict = mwr_files_dict
-
-        # get alc files for each identified MWR
-        alc_files_dict = {}
-        for wigos_and_id in self.wigos_and_inst_id_unique:
-            alc_files_dict[wigos_and_id] = []
-            for filenames in glob.glob(os.path.join(self.conf['data']['alc_dir'],
-                                                    '{}*{}*.nc'.format(self.conf['data']['alc_file_prefix'],
-                                                                       wigos_and_id.split('_')[0]))):
-                alc_files_dict[wigos_and_id].append(filenames)
-
-        self.alc_files_dict = alc_files_dict
+        self.wigos_list = sorted(set(wigos for wigos, _ in instruments))
+        self.wigos_and_inst_id_unique = ['{}_{}'.format(wigos, inst_id) for wigos, inst_id in instruments]
+        self.mwr_files_dict = {}
+        self.alc_files_dict = {}
+        for (wigos, inst_id), wigos_and_id in zip(instruments, self.wigos_and_inst_id_unique):
+            self.mwr_files_dict[wigos_and_id] = self.file_index.mwr_files(wigos, inst_id)
+            self.alc_files_dict[wigos_and_id] = self.file_index.alc_files(wigos)
 
     def prepare_retrieval_dicts(self):
         """Method to prepare the dictionarie for the retrieval
 
         For now, it only create a dictionary for the instrument where a config file exist.
-
+        If a 'lease_dir' is configured, instruments leased by another host are skipped and the others are leased until
+        :meth:`release_instruments` is called. Instruments are only leased once their config file has been read, so that
+        instruments without valid config are left to the other hosts.
         """
         # prepare the dictionaries for the retrieval
         for wigos_and_id in self.wigos_and_inst_id_unique:
@@ -92,20 +103,70 @@ class RetrievalManager(object):
             try:
                 inst_conf_file = '{}{}_{}.yaml'.format(self.conf['data']['inst_config_file_prefix'],
                                                        wigos_and_id.split('_')[0], wigos_and_id.split('_')[1])
-                self.inst_conf = get_inst_config(os.path.join(self.conf['data']['inst_config_dir'], inst_conf_file))
-                self.retrieval_dict[wigos_and_id] = {
-                    'wigos': wigos_and_id.split('_')[0],
-                    'inst_id': wigos_and_id.split('_')[1],
-                    'inst_conf': self.inst_conf,
-                    'mwr_files': self.mwr_files_dict[wigos_and_id],
-                    'alc_files': self.alc_files_dict[wigos_and_id]
-                }
+                inst_conf = get_inst_config(os.path.join(self.conf['data']['inst_config_dir'], inst_conf_file))
             except:  # TODO: catch a specific exception here e.g. MWRConfigError
                 logger.error('Instrument config file not found for {}_{}'.format(wigos_and_id.split('_')[0],
                                                                           wigos_and_id.split('_')[1]))
                 continue
+            if self.leases is not None and not self.leases.claim(*wigos_and_id.split('_')):
+                continue
+            self.inst_conf = inst_conf
+            self.retrieval_dict[wigos_and_id] = {
+                'wigos': wigos_and_id.split('_')[0],
+                'inst_id': wigos_and_id.split('_')[1],
+                'inst_conf': self.inst_conf,
+                'mwr_files': self.mwr_files_dict[wigos_and_id],
+                'alc_files': self.alc_files_dict[wigos_and_id]
+            }
+
+    def admit_retrievals(self, start_time, end_time):
+        """remove the instruments from self.retrieval_dict for which the retrieval cannot succeed
+
+        This is decided by :func:`mwr_l12l2.retrieval.admission.check_admission` from the filenames and the cached
+        metadata of the MWR files, i.e. before loading any data and setting up a workspace. The rejections are logged
+        aggregated by reason.
+
+        Args:
+            start_time: earliest time from which to consider data (see :meth:`run_retrieval`)
+            end_time: latest time from which to consider data (see :meth:`run_retrieval`)
 
-    def run_retrieval(self, start_time, end_time, selected, node=None):
+        Returns:
+            dictionary with the rejected instruments as keys and the reasons of their rejection as values
+        """
+        rejections = {}
+        for wigos_and_id, selected in list(self.retrieval_dict.items()):
+            try:
+                check_admission(self.conf, selected['wigos'], selected['inst_conf'], selected['mwr_files'],
+                                start_time, end_time)
+            except AdmissionError as e:
+                rejections[wigos_and_id] = e.reason
+                del self.retrieval_dict[wigos_and_id]
+        log_rejections(rejections, len(rejections) + len(self.retrieval_dict))
+        return rejections
+
+    def release_instruments(self):
+        """release the leases on all instruments claimed by :meth:`prepare_retrieval_dicts` (if leases are used)"""
+        if self.leases is not None:
+            self.leases.release_all()
+
+    def start_tropoe_pool(self, nodes):
+        """start a pool of long-lived TROPoe containers (one per node) to which the retrievals will be dispatched"""
+        self.tropoe_pool = TropoePool(self.conf, nodes)
+        self.tropoe_pool.start()
+
+    def stop_tropoe_pool(self):
+        """remove the containers of the TROPoe pool (if any)"""
+        if self.tropoe_pool is not None:
+            self.tropoe_pool.stop()
+            self.tropoe_pool = None
+
+    def use_tropoe_pool(self, use_pool=None):
+        """decide on using a TROPoe container pool from input argument or, if None, from 'processing' section of conf"""
+        if use_pool is None:
+            use_pool = get_processing_conf(self.conf, 'tropoe_pool', False)
+        return use_pool
+
+    def run_retrieval(self, start_time, end_time, selected, node=None, workspace=None):
         """Perform retrieval for a single instrument using a dictionary with all relevant instrument information
         
         Args:
@@ -114,52 +175,334 @@ class RetrievalManager(object):
                 'max_age' specified in retrieval config will be used or, if 'max_age' is None, age of data is unlimited.
             end_time (optional): latest time from which to consider data. If not specified, all data received by now is
                 processed.
-            node (optional): node number to be used for the retrieval. If not specified, node 0 is used.
+            node (optional): node number to be used for the retrieval. If not specified, the node of the TROPoe pool
+                assigned to the current worker process is used or node 0 if there is none.
+            workspace (optional): :class:`mwr_l12l2.retrieval.workspace.Workspace` leased for this retrieval. If
+                provided, :obj:`node` is ignored.
         """
-        ret = Retrieval(self.conf, selected, node)
+        if node is None:
+            node = _worker_node if _worker_node is not None else 0
+        ret = Retrieval(self.conf, selected, node, tropoe_pool=self.tropoe_pool, workspace=workspace)
         ret.run(start_time, end_time)
 
-    def retrieve_all(self, start_time, end_time):
+    def retrieve_all(self, start_time, end_time, use_pool=None):
         """Perform the retrieval for all the instrument found in the folder. 
         At the moment we perform the retrievals one after the other.
 
+        The retrievals alternate between two pre-allocated workspaces (see
+        :class:`mwr_l12l2.retrieval.workspace.WorkspaceManager`) so that the cleaning of the previous run does not delay
+        the next one. With a TROPoe container pool all retrievals use the workspace of the single container.
+
+        Args:
+            use_pool (optional): dispatch the retrievals to a long-lived TROPoe container instead of starting a new
+                container for each retrieval. If None, the 'tropoe_pool' setting of the 'processing' section in the
+                retrieval config is used. Defaults to None.
         """
         self.select_all_instruments()
         self.prepare_retrieval_dicts()
-
-        for (node_number, wigos_and_id) in enumerate(self.retrieval_dict):
-            try:
-                self.run_retrieval(start_time, end_time, self.retrieval_dict[wigos_and_id], node=node_number)
-            except Exception as e:
-                logger.error(f"Retrieval for {wigos_and_id} failed with error: {e}")
-
-    def retrieve_all_in_parallel(self, start_time, end_time, cores=2):
+        self.admit_retrievals(start_time, end_time)
+
+        nodes = [0, 1]
+        if self.use_tropoe_pool(use_pool):
+            nodes = [0]  # all retrievals run one after the other in the same container
+            self.start_tropoe_pool(nodes)
+        try:
+            with WorkspaceManager(self.conf, nodes) as workspaces:
+                for wigos_and_id in self.retrieval_dict:
+                    with workspaces.leased() as workspace:
+                        try:
+                            self.run_retrieval(start_time, end_time, self.retrieval_dict[wigos_and_id],
+                                               workspace=workspace)
+                        except Exception as e:
+                            logger.error(f"Retrieval for {wigos_and_id} failed with error: {e}")
+        finally:
+            self.stop_tropoe_pool()
+            self.release_instruments()
+
+    def retrieve_all_in_parallel(self, start_time, end_time, cores=2, use_pool=None):
         """Use multiprocessing to run the retrieval in parallel. 
+
+        Args:
+            use_pool (optional): dispatch the retrievals to a pool of long-lived TROPoe containers (one per worker
+                process) instead of starting a new container for each retrieval. If None, the 'tropoe_pool' setting of
+                the 'processing' section in the retrieval config is used. Defaults to None.
         """
         logger.info('Starting operational retrievals in multiprocessing')
         self.select_all_instruments()
         self.prepare_retrieval_dicts()
+        self.admit_retrievals(start_time, end_time)
+
+        pool = None
+        try:
+            if self.use_tropoe_pool(use_pool):
+                # each worker process takes one node of the container pool for its whole lifetime
+                nodes = [10*(1+n) for n in range(cores)]
+                self.start_tropoe_pool(nodes)
+                node_queue = mp.Queue()
+                for node in nodes:
+                    node_queue.put(node)
+                pool = mp.Pool(processes=cores, initializer=init_worker_node, initargs=(node_queue,))
+                node_numbers = [None] * len(self.retrieval_dict)
+            else:
+                pool = mp.Pool(processes=cores)
+                node_numbers = [10*(1+n) for n in range(len(self.retrieval_dict))]
+
+            # Perform the retrieval in parallel.
+            # warning: we need to loop into the dictionary itself and NOT on the self.wigos_and_inst_id_unique to avoid
+            #          including instrument without config file
+            results = [pool.apply_async(self.run_retrieval,
+                                        args=(start_time, end_time, self.retrieval_dict[wigos_and_id], node_number)
+                                        ) for (node_number, wigos_and_id) in zip(node_numbers, self.retrieval_dict)]
+
+            output = []
+            for p in results:
+                try:
+                    output.append(p.get())
+                except Exception as e:  # TODO: possibly catch a specific exception related to async. Not 100% sure
+                    logger.critical(f"A process failed with error: {e}")
+            # handle the error as appropriate for your program
+        finally:
+            # wait for the workers to finish before removing the containers they run in and releasing the instruments
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self.stop_tropoe_pool()
+            self.release_instruments()
+
+    def retrieve_all_async(self, start_time, end_time, max_containers=None, timeout=None, use_pool=None):
+        """Perform the retrieval for all instruments from one asyncio event loop
+
+        The preparation of the inputs and the post-processing run in a thread pool while the TROPoe containers are
+        driven by an :class:`mwr_l12l2.retrieval.tropoe_async.AsyncTropoeExecutor` streaming their output to the logger.
 
-        # Create a pool of workers equal using 2 cores
-        pool = mp.Pool(processes=cores)
-        
-        # Perform the retrieval in parallel.
-        # warning: we need to loop into the dictionary itself and NOT on the self.wigos_and_inst_id_unique to avoid
-        #          including instrument without config file
-        results = [pool.apply_async(self.run_retrieval,
-                                    args=(start_time, end_time, self.retrieval_dict[wigos_and_id], 10*(1+node_number))
-                                    ) for (node_number, wigos_and_id) in enumerate(self.retrieval_dict)]
-
-        output = []
-        for p in results:
-            try:
-                output.append(p.get())
-            except Exception as e:  # TODO: possibly catch a specific exception related to async. Not 100% sure
-                logger.critical(f"A process failed with error: {e}")
-        # handle the error as appropriate for your program
+        Args:
+            max_containers (optional): maximum number of TROPoe containers running at the same time. If None, the
+                'max_containers' setting of the 'processing' section in the retrieval config is used (default 2).
+            timeout (optional): wall-clock time in seconds after which a TROPoe run is killed. If None, the
+                'tropoe_timeout' setting of the 'processing' section in the retrieval config is used (default no
+                timeout).
+            use_pool (optional): use long-lived TROPoe containers. See :meth:`retrieve_all`
+
+        Returns:
+            dictionary with the :class:`mwr_l12l2.retrieval.tropoe_async.TropoeRunStatus` (or the exception raised)
+            for each instrument
+        """
+        if max_containers is None:
+            max_containers = get_processing_conf(self.conf, 'max_containers', 2)
+        if timeout is None:
+            timeout = get_processing_conf(self.conf, 'tropoe_timeout')
+
+        logger.info('Starting operational retrievals in asyncio event loop')
+        self.select_all_instruments()
+        self.prepare_retrieval_dicts()
+        self.admit_retrievals(start_time, end_time)
+
+        if self.use_tropoe_pool(use_pool):
+            nodes = [10*(1+n) for n in range(max_containers)]
+            self.start_tropoe_pool(nodes)
+        else:
+            nodes = [10*(1+n) for n in range(len(self.retrieval_dict))]
+        try:
+            results = asyncio.run(self.run_cycle_async(start_time, end_time, nodes, max_containers, timeout))
+        finally:
+            self.stop_tropoe_pool()
+            self.release_instruments()
 
-        # Close the pool
-        pool.close()
+        n_ok = sum(1 for res in results.values() if getattr(res, 'ok', False))
+        logger.info('Retrievals terminated successfully for {} of {} instruments'.format(n_ok, len(results)))
+        return results
+
+    async def run_cycle_async(self, start_time, end_time, nodes, max_containers, timeout):
+        """coroutine running the retrievals of all instruments in self.retrieval_dict. See :meth:`retrieve_all_async`
+
+        Args:
+            nodes: list of nodes that can be used for the retrievals. Each node is used by one retrieval at a time.
+        """
+        executor = AsyncTropoeExecutor(max_containers, timeout, self.tropoe_pool)
+
+        with WorkspaceManager(self.conf, nodes) as workspaces, \
+                ThreadPoolExecutor(max_workers=max_containers) as thread_pool:
+            tasks = [self.retrieve_async(start_time, end_time, self.retrieval_dict[wigos_and_id], workspaces,
+                                         executor, thread_pool) for wigos_and_id in self.retrieval_dict]
+            outputs = await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = {}
+        for wigos_and_id, output in zip(self.retrieval_dict, outputs):
+            if isinstance(output, Exception):
+                logger.error(f"Retrieval for {wigos_and_id} failed with error: {output}")
+            results[wigos_and_id] = output
+        return results
+
+    async def retrieve_async(self, start_time, end_time, selected, workspaces, executor, thread_pool):
+        """coroutine performing the retrieval for a single instrument. See :meth:`run_cycle_async`
+
+        Args:
+            workspaces: started :class:`mwr_l12l2.retrieval.workspace.WorkspaceManager` to lease the workspace from
+        """
+        loop = asyncio.get_running_loop()
+        workspace = await loop.run_in_executor(None, workspaces.lease)
+        try:
+            # retrievals of the same cycle run side by side in threads and modify their conf, hence work on copies
+            ret = Retrieval(copy.deepcopy(self.conf), selected, tropoe_pool=self.tropoe_pool, workspace=workspace)
+            await loop.run_in_executor(thread_pool, ret.prepare, start_time, end_time)
+            status = await ret.do_retrieval_async(executor)
+            if status.ok:
+                await loop.run_in_executor(thread_pool, ret.postprocess_tropoe)
+            else:
+                logger.error('TROPoe run for {}_{} failed ({}). Skipping post-processing'.format(
+                    selected['wigos'], selected['inst_id'], status))
+            return status
+        finally:
+            workspaces.release(workspace)
+
+    def schedule_jobs(self, scheduler, start_time, end_time, deadline=None):
+        """submit one job per instrument in self.retrieval_dict to the scheduler, prioritised by latency SLA slack
+
+        Args:
+            scheduler: :class:`mwr_l12l2.retrieval.scheduler.RetrievalScheduler` to submit the jobs to
+            deadline (optional): time (as returned by :func:`time.time`) after which jobs shall not be started anymore
+        """
+        for selected in self.retrieval_dict.values():
+            scheduler.submit(RetrievalJob(selected, start_time, end_time, job_slack(selected, self.conf),
+                                          deadline=deadline))
+
+    def retrieve_all_scheduled(self, start_time, end_time, cores=2, cycle_deadline=None, use_pool=None):
+        """Perform the retrieval for all instruments with a scheduler running the most urgent instruments first
+
+        Args:
+            cores (optional): number of worker processes. Defaults to 2.
+            cycle_deadline (optional): time in seconds from now after which no new retrieval is started in this cycle.
+                Retrievals not started by then are deferred. If None, the 'cycle_deadline' setting of the 'processing'
+                section in the retrieval config is used (default no deadline).
+            use_pool (optional): use long-lived TROPoe containers. See :meth:`retrieve_all_in_parallel`
+
+        Returns:
+            dictionary with outcome of each job as returned by
+            :meth:`mwr_l12l2.retrieval.scheduler.RetrievalScheduler.run_cycle`, including the instruments rejected by
+            :meth:`admit_retrievals` with outcome 'rejected'
+        """
+        if cycle_deadline is None:
+            cycle_deadline = get_processing_conf(self.conf, 'cycle_deadline')
+        deadline = None
+        if cycle_deadline is not None:
+            deadline = time.time() + cycle_deadline
+
+        logger.info('Starting operational retrievals with scheduler')
+        self.select_all_instruments()
+        self.prepare_retrieval_dicts()
+        rejections = self.admit_retrievals(start_time, end_time)
+
+        nodes = [10*(1+n) for n in range(cores)]
+        if self.use_tropoe_pool(use_pool):
+            self.start_tropoe_pool(nodes)
+        try:
+            with RetrievalScheduler(self.conf, cores, nodes, self.tropoe_pool) as scheduler:
+                self.schedule_jobs(scheduler, start_time, end_time, deadline)
+                results = scheduler.run_cycle()
+        finally:
+            self.stop_tropoe_pool()
+            self.release_instruments()
+        results.update({wigos_and_id: (OUTCOME_REJECTED, reason, 0.) for wigos_and_id, reason in rejections.items()})
+
+        n_done = sum(1 for res in results.values() if res[0] == OUTCOME_DONE)
+        logger.info('Retrievals terminated successfully for {} of {} instruments'.format(n_done, len(results)))
+        return results
+
+    def reprocess(self, start_time, end_time, window=dt.timedelta(days=1), instruments=None, cores=2,
+                  progress_file=None, use_pool=None):
+        """Reprocess the data of a period by splitting it into time windows run in parallel for every instrument
+
+        Windows never extend across midnight as one TROPoe run can only cover one day. Windows for which an L2 output
+        file of the instrument already exists are skipped. The outcome of each window is appended to a progress file
+        as soon as it terminates, so that an interrupted reprocessing can be resumed by calling this method again with
+        the same arguments. Windows recorded as done or skipped are not run again, failed ones are retried. Windows for
+        which the retrieval cannot succeed are rejected before being run (see
+        :func:`mwr_l12l2.retrieval.admission.check_admission`) and checked again on resumption.
+
+        Args:
+            start_time: :class:`datetime.datetime` of the start of the reprocessing period
+            end_time: :class:`datetime.datetime` of the end of the reprocessing period
+            window (optional): :class:`datetime.timedelta` of the length of the time windows. Defaults to one day.
+            instruments (optional): list of instruments to reprocess as '{wigos}_{inst_id}'. Defaults to all
+                instruments with data in mwr_dir.
+            cores (optional): number of worker processes. Defaults to 2.
+            progress_file (optional): JSON lines file recording the outcome of each window. Defaults to
+                'reprocess_{start}_{end}.jsonl' in output_dir.
+            use_pool (optional): use long-lived TROPoe containers. See :meth:`retrieve_all_in_parallel`
+
+        Returns:
+            dictionary with outcome of each window run in this call as returned by
+            :meth:`mwr_l12l2.retrieval.scheduler.RetrievalScheduler.run_cycle`
+        """
+        if progress_file is None:
+            progress_file = os.path.join(self.conf['data']['output_dir'], 'reprocess_{}_{}.jsonl'.format(
+                start_time.strftime('%Y%m%d%H%M'), end_time.strftime('%Y%m%d%H%M')))
+        completed = read_progress(progress_file)
+
+        self.select_all_instruments()
+        if instruments is not None:
+            self.wigos_and_inst_id_unique = [inst for inst in self.wigos_and_inst_id_unique if inst in instruments]
+        self.prepare_retrieval_dicts()
+
+        windows = split_windows(start_time, end_time, window)
+        jobs = []
+        rejections = {}
+        for wigos_and_id, selected in self.retrieval_dict.items():
+            output_times = self.output_times(selected['wigos'], selected['inst_id'])
+            for window_start, window_end in windows:
+                name = '{}_{}'.format(wigos_and_id, window_start.strftime('%Y%m%d%H%M'))
+                if name in completed:
+                    continue
+                if any(np.datetime64(window_start) <= t < np.datetime64(window_end) for t in output_times):
+                    write_progress(progress_file, name, OUTCOME_SKIPPED)
+                    continue
+                mwr_files = self.file_index.mwr_files_covering(selected['wigos'], selected['inst_id'], window_start,
+                                                               window_end)
+                if not mwr_files:
+                    continue
+                try:
+                    check_admission(self.conf, selected['wigos'], selected['inst_conf'], mwr_files, window_start,
+                                    window_end - dt.timedelta(seconds=1))
+                except AdmissionError as e:
+                    rejections[name] = e.reason
+                    write_progress(progress_file, name, OUTCOME_REJECTED, e.reason)
+                    continue
+                alc_files = [f for f in selected['alc_files'] if window_start.strftime('%Y%m%d') in os.path.basename(f)]
+                selected_window = dict(selected, mwr_files=mwr_files, alc_files=alc_files or selected['alc_files'])
+                # earliest windows first. The end time is exclusive to not process samples of adjacent windows twice
+                jobs.append(RetrievalJob(selected_window, window_start, window_end - dt.timedelta(seconds=1),
+                                         (window_start - start_time).total_seconds(), name=name))
+        log_rejections(rejections, len(rejections) + len(jobs), unit='windows')
+        logger.info('Reprocessing {} windows of {} instruments between {} and {}'.format(
+            len(jobs), len(self.retrieval_dict), start_time, end_time))
+
+        nodes = [10*(1+n) for n in range(cores)]
+        if self.use_tropoe_pool(use_pool):
+            self.start_tropoe_pool(nodes)
+        try:
+            with RetrievalScheduler(self.conf, cores, nodes, self.tropoe_pool) as scheduler:
+                for job in jobs:
+                    scheduler.submit(job)
+                results = scheduler.run_cycle(
+                    callback=lambda name, outcome, msg, duration: write_progress(progress_file, name, outcome, msg))
+        finally:
+            self.stop_tropoe_pool()
+            self.release_instruments()
+
+        n_done = sum(1 for res in results.values() if res[0] == OUTCOME_DONE)
+        logger.info('Reprocessing terminated successfully for {} of {} windows'.format(n_done, len(results)))
+        return results
+
+    def output_times(self, wigos, inst_id):
+        """get the timestamps of the L2 output files existing for an instrument"""
+        basename = self.conf['data']['output_file_prefix'] + wigos + '_' + inst_id
+        times = []
+        for file in glob.glob(os.path.join(self.conf['data']['output_dir'], basename + '*.nc')):
+            try:
+                times.append(datetime64_from_filename(file))
+            except FilenameError:
+                continue
+        return times
 
     def move_to_bucket(self):
         """Move the files to the bucket
@@ -168,6 +511,46 @@ class RetrievalManager(object):
         pass
 
 
+def split_windows(start_time, end_time, window):
+    """split the period between start_time and end_time into windows of length window not extending across midnight
+
+    Returns:
+        list of tuples (window_start, window_end) of :class:`datetime.datetime`
+    """
+    windows = []
+    window_start = start_time
+    while window_start < end_time:
+        next_midnight = dt.datetime.combine(window_start.date() + dt.timedelta(days=1), dt.time())
+        window_end = min(window_start + window, next_midnight, end_time)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+def read_progress(progress_file):
+    """get the names of the jobs recorded as done or skipped in a progress file of :meth:`RetrievalManager.reprocess`"""
+    completed = set()
+    if not os.path.exists(progress_file):
+        return completed
+    with open(progress_file) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # last line might be incomplete if the reprocessing has been killed
+                continue
+            if entry['outcome'] in [OUTCOME_DONE, OUTCOME_SKIPPED]:
+                completed.add(entry['job'])
+    return completed
+
+
+def write_progress(progress_file, name, outcome, msg=''):
+    """append the outcome of a job to a progress file of :meth:`RetrievalManager.reprocess`"""
+    os.makedirs(os.path.dirname(os.path.abspath(progress_file)), exist_ok=True)
+    with open(progress_file, 'a') as f:
+        f.write(json.dumps({'job': name, 'outcome': outcome, 'message': msg,
+                            'time': dt.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')}) + '\n')
+
+
 if __name__ == '__main__':
     start = time.time()
     run_parallel = True
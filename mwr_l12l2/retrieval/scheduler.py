@@ -0,0 +1,207 @@
+import copy
+import heapq
+import multiprocessing as mp
+import time
+
+import datetime as dt
+import numpy as np
+
+from mwr_l12l2.errors import AdmissionError, FilenameError, MWRInputError
+from mwr_l12l2.log import logger
+from mwr_l12l2.retrieval.retrieval import Retrieval
+from mwr_l12l2.utils.config_utils import config_registry, get_processing_conf
+from mwr_l12l2.utils.file_utils import datetime64_from_filename
+
+# state of long-lived worker processes (set once per worker by init_scheduler_worker)
+_worker_conf = None
+_worker_node = None
+_worker_tropoe_pool = None
+
+# outcomes of jobs reported by the workers
+OUTCOME_DONE = 'done'
+OUTCOME_FAILED = 'failed'
+OUTCOME_DEFERRED = 'deferred'
+OUTCOME_SKIPPED = 'skipped'  # not run as the output already exists (only used for reprocessing)
+OUTCOME_REJECTED = 'rejected'  # not run as the admission check found that the retrieval cannot succeed
+
+
+class RetrievalJob(object):
+    """Compact descriptor of the retrieval for one instrument as sent to the worker processes
+
+    Args:
+        selected: dictionary with the information on the instrument as prepared by
+            :meth:`mwr_l12l2.retrieval.retrieval_manager.RetrievalManager.prepare_retrieval_dicts`
+        start_time: earliest time from which to consider data (see :meth:`mwr_l12l2.retrieval.retrieval.Retrieval.run`)
+        end_time: latest time from which to consider data (see :meth:`mwr_l12l2.retrieval.retrieval.Retrieval.run`)
+        slack: time in seconds left until the latency SLA of the instrument is violated. Negative if already violated.
+            Jobs with smallest slack are processed first.
+        deadline (optional): time (as returned by :func:`time.time`) after which the job shall not be started anymore
+        name (optional): name of the job. Must be unique within a cycle. Defaults to '{wigos}_{inst_id}'
+    """
+
+    __slots__ = ['selected', 'start_time', 'end_time', 'slack', 'deadline', '_name']
+
+    def __init__(self, selected, start_time, end_time, slack, deadline=None, name=None):
+        self.selected = selected
+        self.start_time = start_time
+        self.end_time = end_time
+        self.slack = slack
+        self.deadline = deadline
+        self._name = name
+
+    @property
+    def name(self):
+        if self._name is not None:
+            return self._name
+        return '{}_{}'.format(self.selected['wigos'], self.selected['inst_id'])
+
+    def __lt__(self, other):
+        return self.slack < other.slack
+
+
+class RetrievalScheduler(object):
+    """Scheduler running retrieval jobs in long-lived worker processes in order of urgency
+
+    Jobs are kept in a priority queue ordered by their slack with respect to the latency SLA of the instrument. Idle
+    workers always pick up the most urgent of the remaining jobs. The workers receive the retrieval config only once
+    when they are started and then only get the compact :class:`RetrievalJob` descriptors. Jobs which have not been
+    started before their deadline are deferred, i.e. not executed in this cycle.
+
+    Can be used as a context manager starting the workers on entry and terminating them on exit. The workers can be
+    kept running across several cycles.
+
+    Args:
+        conf: retrieval configuration dictionary
+        cores (optional): number of worker processes. Defaults to 2.
+        nodes (optional): list of nodes, one per worker. Defaults to 10, 20, ...
+        tropoe_pool (optional): :class:`mwr_l12l2.retrieval.tropoe_pool.TropoePool` containing the nodes of the workers
+    """
+
+    def __init__(self, conf, cores=2, nodes=None, tropoe_pool=None):
+        self.conf = conf
+        self.cores = cores
+        self.nodes = nodes
+        if self.nodes is None:
+            self.nodes = [10*(1+n) for n in range(cores)]
+        if len(self.nodes) != cores:
+            raise MWRInputError('need exactly one node per worker but got {} nodes for {} workers'.format(
+                len(self.nodes), cores))
+        self.tropoe_pool = tropoe_pool
+        self.queue = []
+        self.workers = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """start the long-lived worker processes"""
+        node_queue = mp.Queue()
+        for node in self.nodes:
+            node_queue.put(node)
+        self.workers = mp.Pool(processes=self.cores, initializer=init_scheduler_worker,
+                               initargs=(self.conf, node_queue, self.tropoe_pool, config_registry))
+
+    def close(self):
+        """terminate the worker processes after they have finished their current jobs"""
+        if self.workers is not None:
+            self.workers.close()
+            self.workers.join()
+            self.workers = None
+
+    def submit(self, job):
+        """add a :class:`RetrievalJob` to the priority queue"""
+        heapq.heappush(self.queue, job)
+
+    def run_cycle(self, callback=None):
+        """run all jobs in the queue, most urgent first, and return dictionary with outcome of each job
+
+        Args:
+            callback (optional): function called as callback(name, outcome, message, duration) as soon as a job has
+                terminated. Defaults to None.
+
+        Returns:
+            dictionary with job names as keys and tuples (outcome, message, duration) as values. Outcome is one of
+            'done', 'failed', 'deferred' or 'rejected'. For rejected jobs the message is the reason of the rejection.
+        """
+        if self.workers is None:
+            self.start()
+        jobs = []
+        while self.queue:
+            jobs.append(heapq.heappop(self.queue))
+
+        # tasks are handed out to the workers in the order of the list with each idle worker taking the next one
+        results = {}
+        for name, outcome, msg, duration in self.workers.imap_unordered(run_job, jobs, chunksize=1):
+            results[name] = (outcome, msg, duration)
+            if callback is not None:
+                callback(name, outcome, msg, duration)
+            if outcome == OUTCOME_FAILED:
+                logger.error('Retrieval for {} failed with error: {}'.format(name, msg))
+            elif outcome == OUTCOME_DEFERRED:
+                logger.warning('Retrieval for {} deferred: {}'.format(name, msg))
+            elif outcome == OUTCOME_REJECTED:
+                logger.warning('Retrieval for {} rejected: {}'.format(name, msg))
+        return results
+
+
+def init_scheduler_worker(conf, node_queue, tropoe_pool, registry=None):
+    """initializer of the worker processes storing the config and taking one node for the lifetime of the worker
+
+    The configs already read by the parent process are taken over from its registry instead of being parsed again
+    """
+    global _worker_conf, _worker_node, _worker_tropoe_pool
+    if registry is not None:
+        config_registry.update(registry)
+    _worker_conf = conf
+    _worker_node = node_queue.get()
+    _worker_tropoe_pool = tropoe_pool
+
+
+def run_job(job):
+    """run one :class:`RetrievalJob` in a worker process and return (name, outcome, message, duration)"""
+    time_start = time.time()
+    if job.deadline is not None and time_start > job.deadline:
+        return job.name, OUTCOME_DEFERRED, 'deadline of cycle exceeded before start', 0.
+    try:
+        # the retrieval modifies its conf (e.g. the vip section), hence work on a copy not to leak into the next job
+        ret = Retrieval(copy.deepcopy(_worker_conf), job.selected, _worker_node, tropoe_pool=_worker_tropoe_pool)
+        ret.run(job.start_time, job.end_time)
+    except AdmissionError as e:
+        return job.name, OUTCOME_REJECTED, e.reason, time.time() - time_start
+    except Exception as e:
+        return job.name, OUTCOME_FAILED, str(e), time.time() - time_start
+    return job.name, OUTCOME_DONE, '', time.time() - time_start
+
+
+def job_slack(selected, conf, now=None):
+    """compute the slack in seconds of the retrieval for an instrument with respect to its latency SLA
+
+    The age of the data is taken from the oldest timestamp in the MWR filenames. The SLA (in minutes) is taken from
+    'latency_sla' in the instrument config or, if not set there, from the 'processing' section of the retrieval config
+    (default 60 minutes).
+
+    Args:
+        selected: dictionary with the information on the instrument (see :class:`RetrievalJob`)
+        conf: retrieval configuration dictionary
+        now (optional): :class:`numpy.datetime64` of the current time. Defaults to the current UTC time
+    """
+    if now is None:
+        now = np.datetime64(dt.datetime.utcnow())
+    sla = selected['inst_conf'].get('latency_sla')
+    if sla is None:
+        sla = get_processing_conf(conf, 'latency_sla', 60)
+
+    timestamps = []
+    for file in selected['mwr_files']:
+        try:
+            timestamps.append(datetime64_from_filename(file))
+        except FilenameError:
+            continue
+    if not timestamps:
+        return 0.
+    age = (now - min(timestamps)) / np.timedelta64(1, 's')
+    return 60*sla - age
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from mwr_l12l2.log import logger
+from mwr_l12l2.retrieval.tropoe_helpers import kill_container, tropoe_run_cmd
+
+# maximum length of one line of TROPoe output in bytes (default of asyncio streams is 64 KiB)
+STREAM_LIMIT = 2**20
+
+
+class TropoeRunStatus(object):
+    """exit status of one TROPoe run
+
+    Args:
+        name: name of the container in which TROPoe was run
+        returncode: exit code of the podman call. None if the run has been killed after exceeding the timeout
+        timed_out: True if the run has been killed because the timeout was exceeded
+        duration: wall-clock time of the run in seconds
+    """
+
+    def __init__(self, name, returncode, timed_out, duration):
+        self.name = name
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.duration = duration
+
+    @property
+    def ok(self):
+        """True if TROPoe has terminated successfully"""
+        return self.returncode == 0 and not self.timed_out
+
+    def __repr__(self):
+        return 'TropoeRunStatus(name={!r}, returncode={}, timed_out={}, duration={:.1f})'.format(
+            self.name, self.returncode, self.timed_out, self.duration)
+
+
+class AsyncTropoeExecutor(object):
+    """Run TROPoe containers from an asyncio event loop with a bounded number of simultaneously running containers
+
+    The output of TROPoe is streamed line by line to the logger while the container is running. Runs exceeding the
+    timeout are killed.
+
+    Args:
+        max_containers (optional): maximum number of TROPoe containers running at the same time. Defaults to 2.
+        timeout (optional): wall-clock time in seconds after which a TROPoe run is killed. Defaults to None (no timeout)
+        tropoe_pool (optional): :class:`mwr_l12l2.retrieval.tropoe_pool.TropoePool` with long-lived containers. Runs
+            for nodes contained in the pool are executed in the respective container, all others in one-shot containers.
+    """
+
+    def __init__(self, max_containers=2, timeout=None, tropoe_pool=None):
+        self.max_containers = max_containers
+        self.timeout = timeout
+        self.tropoe_pool = tropoe_pool
+        self._semaphore = None  # created in the running event loop by the first call of run()
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_containers)
+        return self._semaphore
+
+    async def run(self, node, data_path, date, start_hour, end_hour, vip_file, apriori_file, data_mountpoint='/data',
+                  tropoe_img='davidturner53/tropoe', verbosity=1):
+        """run one TROPoe retrieval as soon as less than max_containers are running
+
+        Args:
+            node: node identifier of the retrieval. Used for naming the container or selecting it from the pool
+            for the other arguments see :func:`mwr_l12l2.retrieval.tropoe_helpers.run_tropoe`
+
+        Returns:
+            :class:`TropoeRunStatus` of the run
+        """
+        container = None
+        if self.tropoe_pool is not None and node in self.tropoe_pool:
+            container = self.tropoe_pool.containers[node]
+            name = container.name
+        else:
+            name = 'tropoe_run_{}'.format(node)
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            if container is not None:
+                if not await loop.run_in_executor(None, container.is_healthy):
+                    await loop.run_in_executor(None, container.restart)
+                cmd = container.exec_cmd(date, start_hour, end_hour, vip_file, apriori_file, verbosity)
+            else:
+                cmd = tropoe_run_cmd(data_path, date, start_hour, end_hour, vip_file, apriori_file,
+                                     data_mountpoint=data_mountpoint, tropoe_img=tropoe_img, verbosity=verbosity,
+                                     name=name)
+            status = await self._run_cmd(cmd, name)
+
+            if not status.ok and container is not None:
+                # killing podman exec does not stop TROPoe inside the container, hence always replace the container
+                if status.timed_out or not await loop.run_in_executor(None, container.is_healthy):
+                    await loop.run_in_executor(None, container.restart)
+            elif status.timed_out:
+                await loop.run_in_executor(None, kill_container, name)
+        return status
+
+    async def _run_cmd(self, cmd, name):
+        """run the podman command cmd streaming its output to the logger and return a :class:`TropoeRunStatus`"""
+        logger.info('Starting TROPoe in container {}'.format(name))
+        time_start = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.STDOUT, limit=STREAM_LIMIT)
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.gather(stream_to_logger(proc.stdout, name), proc.wait()), self.timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.error('TROPoe run in container {} exceeded timeout of {} s. Killing it'.format(name, self.timeout))
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+        duration = time.monotonic() - time_start
+
+        status = TropoeRunStatus(name, None if timed_out else proc.returncode, timed_out, duration)
+        if status.ok:
+            logger.info('TROPoe run in container {} terminated after {:.1f} s'.format(name, duration))
+        elif not timed_out:
+            logger.error('TROPoe run in container {} exited with code {}'.format(name, proc.returncode))
+        return status
+
+
+async def stream_to_logger(stream, name):
+    """log each line of an asyncio stream as soon as it is available"""
+    async for line in stream:
+        logger.info('[{}] {}'.format(name, line.decode('utf-8', errors='replace').rstrip()))
@@ -4,6 +4,7 @@ import subprocess
 import numpy as np
 import xarray as xr
 
+from mwr_l12l2.errors import MWRInputError, MWRRetrievalError
 from mwr_l12l2.utils.data_utils import set_encoding
 from mwr_l12l2.utils.file_utils import abs_file_path, replace_path
 from mwr_l12l2.log import logger
@@ -12,15 +13,16 @@ def model_to_tropoe(model, station_altitude):
     """extract reference profile and uncertainties as well as surface data from ECMWF to files readable by TROPoe
 
     Args:
-        model: instance of :class:`mwr_l12l2.model.ecmwf.interpret_ecmwf.ModelInterpreter` that with executed run()
+        model: instance of :class:`mwr_l12l2.model.ecmwf.interpret_ecmwf.ModelInterpreter` that with executed run() or
+            :class:`mwr_l12l2.model.ecmwf.model_profiles.ModelProfiles` reduced to the time of interest
 
     Returns:
         prof_data: :class:`xarray.Dataset` containing model profile data in a form writable to an input nc for TROPoe
         sfc_data: :class:`xarray.Dataset` containing model surface data in a form writable to an input nc for TROPoe
     """
 
-    central_lat = model.fc.latitude.values[int(len(model.fc.latitude) / 2)]
-    central_lon = model.fc.longitude.values[int(len(model.fc.latitude) / 2)]
+    central_lat = model.lat_ref
+    central_lon = model.lon_ref
 
     height_agl = model.z_ref-station_altitude
     id_station_alt = height_agl[0,:]>0
@@ -97,7 +99,7 @@ def model_to_tropoe(model, station_altitude):
 
 def run_tropoe(data_path, date, start_hour, end_hour, vip_file, apriori_file,
                data_mountpoint='/data', tropoe_img='davidturner53/tropoe', tmp_path='mwr_l12l2/retrieval/tmp',
-               verbosity=1):
+               verbosity=1, name=None, timeout=None):
     """Run TROPoe container using podman for one specific retrieval
 
     Args:
@@ -113,6 +115,63 @@ def run_tropoe(data_path, date, start_hour, end_hour, vip_file, apriori_file,
         tropoe_img (optional): reference of TROPoe container image to use. Will take latest available by default
         tmp_path (optional): tmp path that will be mounted to /tmp inside the container. Uses a dummy folder by default
         verbosity (optional): verbosity level of TROPoe. Defaults to 1
+        name (optional): name of the container. Required for killing the container if :obj:`timeout` is exceeded.
+            Defaults to None, which lets podman choose a random name.
+        timeout (optional): wall-clock time in seconds after which the container is killed. Defaults to None (no
+            timeout).
+
+    Returns:
+        :class:`subprocess.CompletedProcess` of the podman call or None if the timeout has been exceeded
+    """
+
+    cmd = tropoe_run_cmd(data_path, date, start_hour, end_hour, vip_file, apriori_file,
+                         data_mountpoint=data_mountpoint, tropoe_img=tropoe_img, tmp_path=tmp_path,
+                         verbosity=verbosity, name=name)
+    try:
+        tropoe_run = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        logger.error('TROPoe run exceeded timeout of {} s. Killing container {}'.format(timeout, name))
+        kill_container(name)
+        if e.output:
+            logger.info(e.output.decode('utf-8'))
+        return None
+    logger.info('TROPoe run output:')
+    logger.info(tropoe_run.stdout.decode('utf-8'))
+    return tropoe_run
+
+
+def tropoe_run_cmd(data_path, date, start_hour, end_hour, vip_file, apriori_file,
+                   data_mountpoint='/data', tropoe_img='davidturner53/tropoe', tmp_path='mwr_l12l2/retrieval/tmp',
+                   verbosity=1, name=None):
+    """get the podman command running a one-shot TROPoe container. For the arguments see :func:`run_tropoe`"""
+    cmd = ['podman', 'run', '-i', '-u', 'root', '--rm']
+    if name is not None:
+        cmd += ['--name', name, '--replace']
+    cmd += ['-v', '{}:{}'.format(abs_file_path(data_path), data_mountpoint),  # map the data path inside the container
+            '-v', '{}:/tmp2'.format(abs_file_path(tmp_path)),  # map the tmp path to /tmp2 (for debug only)
+            ]
+    cmd += tropoe_env_args(data_path, date, start_hour, end_hour, vip_file, apriori_file,
+                           data_mountpoint=data_mountpoint, verbosity=verbosity)
+    cmd.append(tropoe_img)
+    return cmd
+
+
+def kill_container(name):
+    """kill a running container (ignoring errors, e.g. if the container has already exited)"""
+    if name is None:
+        return
+    subprocess.run(['podman', 'kill', name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def tropoe_env_args(data_path, date, start_hour, end_hour, vip_file, apriori_file, data_mountpoint='/data',
+                    verbosity=1):
+    """get the environment arguments (-e key=value) configuring one TROPoe run for podman run or podman exec
+
+    Args:
+        same as for :func:`run_tropoe`
+
+    Returns:
+        list of command line arguments to be passed on to podman
     """
 
     # generate date string. Accept datetime.datetime and strings/integers (for special calls, e.g. 0 for vip docs)
@@ -128,20 +187,13 @@ def run_tropoe(data_path, date, start_hour, end_hour, vip_file, apriori_file,
     else:
         apriori_fullpath = replace_path(apriori_file, data_path, data_mountpoint)
 
-    # construct cmd for subprocess
-    cmd = ['podman', 'run', '-i', '-u', 'root', '--rm',
-           '-v', '{}:{}'.format(abs_file_path(data_path), data_mountpoint),  # map the data path inside the container
-           '-v', '{}:/tmp2'.format(abs_file_path(tmp_path)),  # map the tmp path to /tmp2 (for debug only)
-           '-e', 'yyyymmdd=' + date_str,
-           '-e', 'shour={}'.format(start_hour),
-           '-e', 'ehour={}'.format(end_hour),
-           '-e', 'vfile=' + vip_fullpath,  # path inside container, e.g. relative to dir mapped to /data
-           '-e', 'pfile=' + apriori_fullpath,  # path inside container, e.g. relative to dir mapped to /data
-           '-e', 'verbose={}'.format(verbosity),
-           tropoe_img]
-    tropoe_run = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    logger.info('TROPoe run output:')
-    logger.info(tropoe_run.stdout.decode('utf-8'))
+    return ['-e', 'yyyymmdd=' + date_str,
+            '-e', 'shour={}'.format(start_hour),
+            '-e', 'ehour={}'.format(end_hour),
+            '-e', 'vfile=' + vip_fullpath,  # path inside container, e.g. relative to dir mapped to /data
+            '-e', 'pfile=' + apriori_fullpath,  # path inside container, e.g. relative to dir mapped to /data
+            '-e', 'verbose={}'.format(verbosity)]
+
 
 def transform_units(data):
     """Transform all units of TROPoe output file to match units in E-PROFILE output files"""
@@ -224,17 +276,60 @@ def add_variables_attrs(data, derived_product_list):
 
     return data
 
-def extract_prior(data, tropoe_out_config):
+def state_vector_slices(arb):
+    """get the slice of the state vector elements of each retrieval quantity
+
+    In the TROPoe state vector all elements of a retrieval quantity (e.g. the temperature at all heights) are adjacent,
+    so each quantity corresponds to a contiguous range of indices.
+
+    Args:
+        arb: indices of the retrieval quantity of each element of the state vector (arb1 or arb2 of the TROPoe output)
+
+    Returns:
+        dictionary with the indices of the retrieval quantities as keys and slices of the state vector as values
     """
-    Extracts prior information from the given data based on the TROPoe output configuration.
-    #TODO: this function could be done more generic, e.g. by inputing a list of variables to extract prior information from.
+    arb = np.asarray(arb)
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(arb)) + 1, [arb.size]))
+    slices = {}
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if arb[start] in slices:
+            raise MWRRetrievalError('elements of retrieval quantity {} are not contiguous in the state vector of TROPoe'
+                                    .format(arb[start]))
+        slices[arb[start]] = slice(start, stop)
+    return slices
+
+def state_quantity_dims(data, quantity, size):
+    """get the dimensions of one retrieval quantity without time, taken from its variable in the TROPoe output
+
+    If the variable is missing or does not match the number of state vector elements, a dimension named
+    '{quantity}_dim' is used for quantities with several elements.
+    """
+    if quantity in data.variables:
+        dims = tuple(dim for dim in data[quantity].dims if dim != 'time')
+        if int(np.prod([data.sizes[dim] for dim in dims])) == size:
+            return dims
+    if size == 1:
+        return ()
+    return ('{}_dim'.format(quantity),)
+
+def extract_state(data, tropoe_out_config, kind):
+    """
+    Extracts the prior or the averaging kernels of the retrieval quantities from the TROPoe output.
+
+    The quantities listed in 'extract_quantities' of the TROPoe output configuration are extracted using the indices
+    of the quantities in the state vector which are also defined there. The index ranges of all quantities are derived
+    once from arb1 and arb2 and the quantities are taken as slices of Xa resp. Akernal_no_model. Like this, only the
+    required part of the averaging kernels is read from the TROPoe output file. The dimensions are taken from the
+    variable of the quantity (e.g. height or altitude for profiles, none for scalars). The averaging kernels get the
+    time as additional first dimension and a copy of each dimension with prefix 'avk_' as last dimensions.
 
     Args:
-        data (xr.Dataset): The input data containing the variables to extract prior information from.
+        data (xr.Dataset): The TROPoe output.
         tropoe_out_config (dict): The TROPoe output configuration dictionary.
+        kind (str): 'prior' or 'avk'. The extracted variables are named '{quantity}_{kind}'.
 
     Returns:
-        xr.Dataset: The input data with the prior information variables added.
+        xr.Dataset: The input data with the extracted variables added.
 
     Raises:
         FileExistsError: If the tropoe_out_config argument is not a dictionary.
@@ -245,35 +340,38 @@ def extract_prior(data, tropoe_out_config):
         tropoe_conf = tropoe_out_config
     else:
         raise FileExistsError("The argument 'conf' must be a conf dictionary")
-
-    # Temperature
-    data = data.assign(
-        temperature_prior = xr.DataArray(
-        data.Xa.where(data.arb1==tropoe_conf['temperature'], drop=True).values,
-        coords= {'height':data.height},
-        dims='height',
-        attrs={'units':data.temperature.units},
-        ),
-    )
-    
-    # Water vapor
-    data = data.assign(
-        waterVapor_prior = xr.DataArray(
-        data.Xa.where(data.arb1==tropoe_conf['waterVapor'], drop=True).data,
-        coords= {'height':data.height},
-        dims='height',
-        attrs={'units':data.waterVapor.units},
-        ),
-    )
-        
-    # Liquid water path
-    data = data.assign(
-        lwp_prior = xr.DataArray(
-        data.Xa.where(data.arb1==tropoe_conf['lwp'], drop=True).data,
-        coords= {},
-        attrs={'units':data.lwp.units},
-        ),
-    )
+    if kind not in ['prior', 'avk']:
+        raise MWRInputError("unknown kind '{}' of state vector variables to extract".format(kind))
+
+    slices1 = state_vector_slices(data.arb1.values)
+    slices2 = state_vector_slices(data.arb2.values) if kind == 'avk' else None
+    for quantity in tropoe_conf['extract_quantities']:
+        index = tropoe_conf[quantity]
+        if index not in slices1:
+            logger.warning('Retrieval quantity {} not found in the state vector of TROPoe. Cannot extract its {}'
+                           .format(quantity, kind))
+            continue
+        sl1 = slices1[index]
+        dims = state_quantity_dims(data, quantity, sl1.stop - sl1.start)
+        shape = tuple(data.sizes[dim] if dim in data.dims else sl1.stop - sl1.start for dim in dims)
+        coords = {dim: data[dim].data for dim in dims if dim in data.coords}
+
+        if kind == 'prior':
+            attrs = {}
+            if quantity in data.variables and 'units' in data[quantity].attrs:
+                attrs['units'] = data[quantity].units
+            values = data.Xa.variable[sl1].values.reshape(shape)
+        else:
+            avk_dims = tuple('avk_{}'.format(dim) for dim in dims)
+            coords.update({'avk_{}'.format(dim): val for dim, val in list(coords.items())})
+            coords['time'] = data.time
+            attrs = {'long_name': '{} averaging kernels'.format(quantity)}
+            values = data.Akernal_no_model.variable[:, sl1, slices2[index]].values.reshape(
+                (data.sizes['time'],) + shape + shape)
+            dims = ('time',) + dims + avk_dims
+
+        data = data.assign({'{}_{}'.format(quantity, kind): xr.DataArray(values, coords=coords, dims=dims,
+                                                                         attrs=attrs)})
     return data
 
 def add_flags(data):
@@ -297,56 +395,6 @@ def add_flags(data):
 
     return data
 
-def extract_avk(data, tropoe_out_config):
-    """
-    Extracts prior information from the given data based on the TROPoe output configuration.
-    #TODO: this function could be done more generic, e.g. by inputing a list of variables to extract prior information from.
-
-    Args:
-        data (xr.Dataset): The input data containing the variables to extract prior information from.
-        tropoe_out_config (dict): The TROPoe output configuration dictionary.
-
-    Returns:
-        xr.Dataset: The input data with the prior information variables added.
-
-    Raises:
-        FileExistsError: If the tropoe_out_config argument is not a dictionary.
-    """
-
-    # read config file for TROPoe output
-    if isinstance(tropoe_out_config, dict):
-        tropoe_conf = tropoe_out_config
-    else:
-        raise FileExistsError("The argument 'conf' must be a conf dictionary")
-    
-    data = data.assign(
-        temperature_avk = xr.DataArray(
-        data.Akernal_no_model[:,data.arb1==tropoe_conf['temperature'],data.arb2==tropoe_conf['temperature']].data,
-        coords= {'time':data.time, 'altitude':data.altitude.data, 'avk_altitude':data.altitude.data},
-        dims=['time','altitude','avk_altitude'],
-        attrs={'long_name':'temperature averaging kernels'}
-        ),
-    )
-    # Water vapor
-    data = data.assign(
-        waterVapor_avk = xr.DataArray(
-        data.Akernal_no_model[:,data.arb1==tropoe_conf['waterVapor'],data.arb2==tropoe_conf['waterVapor']].data,
-        coords= {'time':data.time, 'altitude':data.altitude.data, 'avk_altitude':data.altitude.data},
-        dims=['time','altitude','avk_altitude'],
-        attrs={'long_name':'water vapor averaging kernels'}
-        ),
-    )
-    # Liquid water path
-    data = data.assign(
-        lwp_avk = xr.DataArray(
-        data.Akernal_no_model[:,data.arb1==tropoe_conf['lwp'],data.arb2==tropoe_conf['lwp']].data.ravel(),
-        coords= {'time':data.time},
-        dims=['time'],
-        attrs={'long_name':'liquid water path averaging kernels'}
-        ),
-    )
-    return data
-
 def extract_attrs(data):
     """
     Extracts some attributes from the TROPoe outputs and rename them.
@@ -0,0 +1,66 @@
+import numpy as np
+
+from mwr_l12l2.errors import MWRConfigError
+from mwr_l12l2.utils.config_utils import get_processing_conf
+
+# variables read from MWR files: inputs of TROPoe, surface met, quality info and station coordinates for checks
+MWR_VARS = ['tb', 'ele', 'azi', 'frequency', 'time_bnds', 'quality_flag', 'pointing_flag',
+            'air_temperature', 'relative_humidity', 'air_pressure',
+            'station_latitude', 'station_longitude', 'station_altitude']
+# variables of ALC files needed by TROPoe for the cloud base
+ALC_VARS = ['cloud_base_height', 'vertical_visibility', 'station_latitude', 'station_longitude', 'station_altitude']
+
+# on-disk formats for the input files of TROPoe selectable by 'tropoe_input_format' in the 'processing' config section
+TROPOE_INPUT_FORMATS = {'netcdf4': 'NETCDF4',  # uncompressed and contiguous
+                        'netcdf3': 'NETCDF3_64BIT'}
+ENCODING_KEYS = ['dtype', '_FillValue', 'scale_factor', 'add_offset', 'units', 'calendar']  # kept from source data
+DEFAULT_TIME_ENCODING = {'units': 'seconds since 1970-01-01', 'calendar': 'standard'}
+
+
+def get_tropoe_input_format(conf):
+    """get the NetCDF format of the input files of TROPoe from the 'processing' section of the retrieval config"""
+    key = get_processing_conf(conf, 'tropoe_input_format', 'netcdf4')
+    if key not in TROPOE_INPUT_FORMATS:
+        raise MWRConfigError("'tropoe_input_format' must be one of {} but is '{}'".format(
+            list(TROPOE_INPUT_FORMATS), key))
+    return TROPOE_INPUT_FORMATS[key]
+
+
+def input_encoding(variable, nc_format='NETCDF4'):
+    """get the fixed encoding of a variable for the input files of TROPoe
+
+    The encoding of the source data is reduced to data type, packing and time units, i.e. chunking and compression
+    settings inherited from the source files are dropped. Data are written uncompressed and contiguous. Data types not
+    supported by the classic format (64-bit and unsigned integers) are left for conversion by :mod:`xarray`.
+
+    Args:
+        variable: :class:`xarray.DataArray` to write
+        nc_format (optional): NetCDF format of the file. Defaults to 'NETCDF4'
+    """
+    encoding = {key: variable.encoding[key] for key in ENCODING_KEYS if key in variable.encoding}
+    if np.issubdtype(variable.dtype, np.datetime64):
+        for key, val in DEFAULT_TIME_ENCODING.items():
+            encoding.setdefault(key, val)
+    if nc_format.startswith('NETCDF4'):
+        encoding.update(zlib=False, contiguous=True)
+    elif 'dtype' in encoding:
+        dtype = np.dtype(encoding['dtype'])
+        if dtype.kind == 'u' or (dtype.kind == 'i' and dtype.itemsize > 4):
+            del encoding['dtype']
+    return encoding
+
+
+def write_tropoe_input(data, file, variables=None, nc_format='NETCDF4'):
+    """write an input file for TROPoe containing only the variables needed, with fixed encodings
+
+    Args:
+        data: :class:`xarray.Dataset` to write
+        file: output NetCDF file
+        variables (optional): list of variables to write (together with their coordinates). Variables missing in data
+            are ignored. Defaults to None, i.e. all variables of data
+        nc_format (optional): NetCDF format, typically one of :data:`TROPOE_INPUT_FORMATS`. Defaults to 'NETCDF4'
+    """
+    if variables is not None:
+        data = data[[var for var in variables if var in data]]
+    encoding = {var: input_encoding(data[var], nc_format) for var in data.variables}
+    data.to_netcdf(file, format=nc_format, encoding=encoding, unlimited_dims=[])
@@ -0,0 +1,194 @@
+import json
+import os
+import subprocess
+
+from mwr_l12l2.errors import MWRRetrievalError, TropoeContainerError
+from mwr_l12l2.log import logger
+from mwr_l12l2.retrieval.tropoe_helpers import tropoe_env_args
+from mwr_l12l2.retrieval.workspace import tropoe_node_dir
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+
+class TropoeContainer(object):
+    """Long-lived TROPoe container attached to one node directory accepting retrieval jobs through 'podman exec'
+
+    The container is started once with a dummy process keeping it alive. Each retrieval job is then executed inside
+    the running container with the command of the TROPoe image, which saves the start-up and teardown of a container
+    for every retrieval.
+
+    Args:
+        name: name of the container. Must be unique on the machine
+        data_path: node directory that will be mounted to :obj:`data_mountpoint` inside the container. Must remain the
+            same directory (not be removed and re-created) during the lifetime of the container.
+        data_mountpoint (optional): where the data path will be mounted. Defaults to '/data'
+        tropoe_img (optional): reference of TROPoe container image to use. Will take latest available by default
+        tmp_path (optional): tmp path that will be mounted to /tmp2 inside the container. Uses a dummy folder by default
+        tropoe_cmd (optional): command (list of str) executing TROPoe inside the container. If not specified it is
+            inferred from the entrypoint and cmd of the image
+        timeout (optional): wall-clock time in seconds after which a TROPoe run is aborted and the container replaced.
+            Defaults to None (no timeout).
+    """
+
+    def __init__(self, name, data_path, data_mountpoint='/data', tropoe_img='davidturner53/tropoe',
+                 tmp_path='mwr_l12l2/retrieval/tmp', tropoe_cmd=None, timeout=None):
+        self.name = name
+        self.data_path = abs_file_path(data_path)
+        self.data_mountpoint = data_mountpoint
+        self.tropoe_img = tropoe_img
+        self.tmp_path = abs_file_path(tmp_path)
+        self.tropoe_cmd = tropoe_cmd
+        self.timeout = timeout
+
+    def start(self):
+        """start the container in detached mode (removing a possibly left-over container with the same name)"""
+        if self.tropoe_cmd is None:
+            self.tropoe_cmd = get_image_cmd(self.tropoe_img)
+        os.makedirs(self.data_path, exist_ok=True)
+        self.remove()
+        cmd = ['podman', 'run', '-d', '-u', 'root', '--name', self.name,
+               '-v', '{}:{}'.format(self.data_path, self.data_mountpoint),
+               '-v', '{}:/tmp2'.format(self.tmp_path),
+               '--entrypoint', 'sleep',  # keep container alive without running TROPoe
+               self.tropoe_img, 'infinity']
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if res.returncode != 0:
+            raise TropoeContainerError('Could not start TROPoe container {}: {}'.format(
+                self.name, res.stdout.decode('utf-8')))
+        logger.info('Started TROPoe container {} for {}'.format(self.name, self.data_path))
+
+    def remove(self):
+        """stop and remove the container if it exists"""
+        subprocess.run(['podman', 'rm', '-f', self.name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def is_healthy(self):
+        """check whether the container is up and running"""
+        res = subprocess.run(['podman', 'container', 'inspect', '--format', '{{.State.Running}}', self.name],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return res.returncode == 0 and res.stdout.decode('utf-8').strip() == 'true'
+
+    def restart(self):
+        """replace the container by a fresh one"""
+        logger.warning('Restarting TROPoe container {}'.format(self.name))
+        self.start()
+
+    def exec_cmd(self, date, start_hour, end_hour, vip_file, apriori_file, verbosity=1):
+        """get the podman command executing one TROPoe run inside the container. Args as for :meth:`run`"""
+        cmd = ['podman', 'exec', '-i', '-u', 'root']
+        cmd += tropoe_env_args(self.data_path, date, start_hour, end_hour, vip_file, apriori_file,
+                               data_mountpoint=self.data_mountpoint, verbosity=verbosity)
+        cmd.append(self.name)
+        cmd += self.tropoe_cmd
+        return cmd
+
+    def run(self, date, start_hour, end_hour, vip_file, apriori_file, verbosity=1):
+        """run one TROPoe retrieval inside the container. For the arguments see :func:`run_tropoe`
+
+        Raises:
+            TropoeContainerError: if the container is not running (and cannot be restarted), stopped during the run or
+                the run exceeded the timeout
+            MWRRetrievalError: if TROPoe exits with an error inside the running container
+        """
+        if not self.is_healthy():
+            self.restart()
+        cmd = self.exec_cmd(date, start_hour, end_hour, vip_file, apriori_file, verbosity)
+        try:
+            tropoe_run = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            # stopping the exec client does not stop TROPoe inside the container, hence replace the whole container
+            logger.error('TROPoe run in container {} exceeded timeout of {} s'.format(self.name, self.timeout))
+            self.restart()
+            raise TropoeContainerError('TROPoe run in container {} exceeded timeout of {} s'.format(
+                self.name, self.timeout))
+        logger.info('TROPoe run output ({}):'.format(self.name))
+        logger.info(tropoe_run.stdout.decode('utf-8'))
+        if tropoe_run.returncode != 0:
+            if not self.is_healthy():
+                self.restart()
+                raise TropoeContainerError('TROPoe container {} stopped during run (exit code {})'.format(
+                    self.name, tropoe_run.returncode))
+            raise MWRRetrievalError('TROPoe run in container {} exited with code {}'.format(
+                self.name, tropoe_run.returncode))
+
+
+class TropoePool(object):
+    """Pool of long-lived TROPoe containers, one per node directory
+
+    Can be used as a context manager starting all containers on entry and removing them on exit. The pool itself only
+    holds names and paths of the containers so it can be passed on to worker processes.
+
+    Args:
+        conf: retrieval configuration dictionary (as returned by
+            :func:`mwr_l12l2.utils.config_utils.get_retrieval_config`)
+        nodes: list of node identifiers to start a container for
+        tropoe_img (optional): reference of TROPoe container image to use. Defaults to the 'tropoe_image' setting in the
+            'processing' section of the retrieval config or to 'davidturner53/tropoe' if not set there.
+    """
+
+    def __init__(self, conf, nodes, tropoe_img=None):
+        if tropoe_img is None:
+            tropoe_img = get_processing_conf(conf, 'tropoe_image', 'davidturner53/tropoe')
+        timeout = get_processing_conf(conf, 'tropoe_timeout')
+        self.containers = {}
+        for node in nodes:
+            data_path = tropoe_node_dir(conf, node)
+            self.containers[node] = TropoeContainer('tropoe_{}{}'.format(conf['data']['tropoe_subfolder_basename'],
+                                                                          node),
+                                                    data_path, data_mountpoint=conf['data']['tropoe_dir_mountpoint'],
+                                                    tropoe_img=tropoe_img, timeout=timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __contains__(self, node):
+        return node in self.containers
+
+    @property
+    def nodes(self):
+        return list(self.containers)
+
+    def start(self):
+        """start all containers of the pool. The TROPoe command is inferred only once for the whole pool"""
+        tropoe_cmd = None
+        for container in self.containers.values():
+            container.tropoe_cmd = tropoe_cmd
+            container.start()
+            tropoe_cmd = container.tropoe_cmd
+
+    def stop(self):
+        """remove all containers of the pool"""
+        for container in self.containers.values():
+            container.remove()
+
+    def check_health(self):
+        """check all containers and restart the ones which are not running any more
+
+        Containers which cannot be restarted are left to :meth:`TropoeContainer.run` to retry or report
+        """
+        for container in self.containers.values():
+            if not container.is_healthy():
+                try:
+                    container.restart()
+                except TropoeContainerError as e:
+                    logger.error(e)
+
+    def run(self, node, *args, **kwargs):
+        """run a retrieval in the container of the given node. For the arguments see :meth:`TropoeContainer.run`"""
+        self.containers[node].run(*args, **kwargs)
+
+
+def get_image_cmd(tropoe_img):
+    """get the command (entrypoint + cmd) executed by a container image when started without arguments"""
+    res = subprocess.run(['podman', 'image', 'inspect', '--format', '{{json .Config}}', tropoe_img],
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if res.returncode != 0:
+        raise MWRRetrievalError('Could not inspect TROPoe image {}: {}'.format(tropoe_img, res.stdout.decode('utf-8')))
+    img_conf = json.loads(res.stdout.decode('utf-8'))
+    cmd = (img_conf.get('Entrypoint') or []) + (img_conf.get('Cmd') or [])
+    if not cmd:
+        raise MWRRetrievalError('TROPoe image {} does not define any entrypoint or cmd'.format(tropoe_img))
+    return cmd
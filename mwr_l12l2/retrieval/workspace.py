@@ -0,0 +1,186 @@
+import glob
+import os
+import shutil
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from mwr_l12l2.errors import MWRRetrievalError
+from mwr_l12l2.log import logger
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+# name of the subfolder of each workspace holding static read-only files (e.g. a-priori files) kept across retrievals
+STATIC_SUBDIR = 'static'
+
+
+class Workspace(object):
+    """Directory of one node holding the inputs and outputs of one TROPoe run at a time
+
+    Args:
+        node: node identifier of the workspace
+        path: directory of the workspace (as returned by :func:`tropoe_node_dir`)
+    """
+
+    def __init__(self, node, path):
+        self.node = node
+        self.path = path
+        self.static_dir = os.path.join(path, STATIC_SUBDIR)
+
+    def static_file(self, filename):
+        """get the full path to a file in the static area of the workspace or None if it is not available there"""
+        file = os.path.join(self.static_dir, filename)
+        if os.path.isfile(file):
+            return file
+        return None
+
+    def __repr__(self):
+        return 'Workspace(node={!r}, path={!r})'.format(self.node, self.path)
+
+
+class WorkspaceManager(object):
+    """Manager of a fixed set of pre-allocated TROPoe node workspaces which are leased to retrievals
+
+    All workspaces are created once at start-up, preferably on a RAM-backed file system (see 'tropoe_ramdir' in the
+    'processing' section of the retrieval config), and are never removed while the manager is running. This keeps them
+    valid as bind mounts of long-lived TROPoe containers. After a retrieval releases its workspace, the files of the
+    run are deleted by a background thread so that the cleaning is not on the critical path of the next retrieval.
+    Each workspace has a static area with read-only copies of the files in 'prior_dir', which is kept across runs.
+
+    Can be used as a context manager allocating the workspaces on entry and waiting for pending cleanups on exit.
+
+    Args:
+        conf: retrieval configuration dictionary
+        nodes: list of node identifiers to allocate a workspace for
+        prior_dir (optional): directory with a-priori files to be provided in the static area of each workspace.
+            Defaults to the 'prior_dir' setting of the 'processing' section in the retrieval config (no static files
+            if not set there).
+    """
+
+    def __init__(self, conf, nodes, prior_dir=None):
+        if prior_dir is None:
+            prior_dir = get_processing_conf(conf, 'prior_dir')
+        self.prior_dir = abs_file_path(prior_dir) if prior_dir is not None else None
+        self.workspaces = {node: Workspace(node, tropoe_node_dir(conf, node)) for node in nodes}
+        self._free = []
+        self._condition = threading.Condition()
+        self._cleaner = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, node):
+        return node in self.workspaces
+
+    @property
+    def nodes(self):
+        return list(self.workspaces)
+
+    def start(self):
+        """allocate all workspaces (emptying left-overs of previous runs) and populate their static areas"""
+        for workspace in self.workspaces.values():
+            os.makedirs(workspace.path, exist_ok=True)
+            clean_dir(workspace.path, keep=[STATIC_SUBDIR])
+            self.populate_static(workspace)
+        with self._condition:
+            self._free = list(self.workspaces)
+        self._cleaner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='workspace_cleaner')
+        logger.info('Allocated {} TROPoe workspaces in {}'.format(
+            len(self.workspaces), os.path.commonpath([ws.path for ws in self.workspaces.values()])))
+
+    def close(self):
+        """wait for pending cleanups to finish. The workspaces themselves are kept for the next start"""
+        if self._cleaner is not None:
+            self._cleaner.shutdown(wait=True)
+            self._cleaner = None
+
+    def populate_static(self, workspace):
+        """(re-)create the static area of a workspace with read-only copies of the files in prior_dir"""
+        if os.path.exists(workspace.static_dir):
+            os.chmod(workspace.static_dir, stat.S_IRWXU)
+            shutil.rmtree(workspace.static_dir)
+        os.mkdir(workspace.static_dir)
+        if self.prior_dir is not None:
+            for file in glob.glob(os.path.join(self.prior_dir, '*')):
+                if not os.path.isfile(file):
+                    continue
+                target = os.path.join(workspace.static_dir, os.path.basename(file))
+                try:
+                    os.link(file, target)  # no copy needed if on same file system
+                except OSError:
+                    shutil.copy(file, target)
+                os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.chmod(workspace.static_dir, stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP
+                 | stat.S_IROTH | stat.S_IXOTH)
+
+    def lease(self, timeout=None):
+        """lease a clean workspace, waiting until one is available
+
+        Args:
+            timeout (optional): maximum time in seconds to wait for a free workspace. Defaults to None (wait forever)
+
+        Returns:
+            :class:`Workspace` for exclusive use until passed on to :meth:`release`
+
+        Raises:
+            MWRRetrievalError: if no workspace became available within the timeout
+        """
+        if self._cleaner is None:
+            raise MWRRetrievalError('WorkspaceManager must be started before leasing workspaces')
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._free, timeout):
+                raise MWRRetrievalError('No TROPoe workspace became available within {} s'.format(timeout))
+            node = self._free.pop(0)
+        return self.workspaces[node]
+
+    def release(self, workspace):
+        """give back a leased workspace. It is cleaned in the background and only then available for a new lease"""
+        self._cleaner.submit(self._clean_and_free, workspace)
+
+    @contextmanager
+    def leased(self, timeout=None):
+        """context manager leasing a workspace and releasing it on exit. For the arguments see :meth:`lease`"""
+        workspace = self.lease(timeout)
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def _clean_and_free(self, workspace):
+        try:
+            clean_dir(workspace.path, keep=[STATIC_SUBDIR])
+        except OSError as e:
+            # a workspace that cannot be cleaned must not be handed out again
+            logger.error('Could not clean TROPoe workspace {}. Retiring it: {}'.format(workspace.path, e))
+            return
+        with self._condition:
+            self._free.append(workspace.node)
+            self._condition.notify()
+
+
+def tropoe_node_dir(conf, node):
+    """get the directory for the TROPoe inputs and outputs of a node
+
+    The directory is located in 'tropoe_ramdir' of the 'processing' section of the retrieval config if set (e.g. a
+    folder on tmpfs like /dev/shm/mwr_l12l2) and in 'tropoe_basedir' of the 'data' section otherwise.
+    """
+    basedir = get_processing_conf(conf, 'tropoe_ramdir')
+    if basedir is None:
+        basedir = conf['data']['tropoe_basedir']
+    return os.path.join(abs_file_path(basedir), '{}{}/'.format(conf['data']['tropoe_subfolder_basename'], node))
+
+
+def clean_dir(path, keep=()):
+    """remove all contents of a directory except the entries with names listed in keep. The directory itself is kept"""
+    for entry in os.scandir(path):
+        if entry.name in keep:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
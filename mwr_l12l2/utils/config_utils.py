@@ -1,18 +1,77 @@
+import functools
 import logging
+import os
+import pickle
 import yaml
 
 from mwr_l12l2.errors import MissingConfig, MWRConfigError
 from mwr_l12l2.utils.data_utils import lists_to_np
 from mwr_l12l2.utils.file_utils import abs_file_path
 
+# use the fast libyaml-based loader if PyYAML has been built with it
+YamlLoader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
 
-def get_conf(file):
-    """get conf dictionary from yaml files. Don't do any checks on contents"""
+
+class ConfigRegistry(object):
+    """registry of configurations which have been read and validated, reloading only files that have changed
+
+    Configs are stored as pickled bytes once validated. This compiled form is immutable and each lookup returns a fresh
+    copy which callers are free to modify. Unpickling is much faster than parsing and validating the YAML again. Entries
+    are invalidated if modification time or size of their file change. The registry is picklable, hence can be handed
+    to worker processes (see :meth:`update`) which then do not need to parse the configs themselves.
+    """
+
+    def __init__(self):
+        self.entries = {}  # (reader name, abs file, args) -> (file state, pickled config)
+
+    def get(self, reader, file, *args, **kwargs):
+        """get config of file as returned by reader(file, *args, **kwargs), calling reader only if not up to date"""
+        stat = os.stat(file)
+        state = (stat.st_mtime_ns, stat.st_size)
+        key = (reader.__qualname__, os.path.abspath(file), repr(args), repr(sorted(kwargs.items())))
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != state:
+            entry = (state, pickle.dumps(reader(file, *args, **kwargs), protocol=pickle.HIGHEST_PROTOCOL))
+            self.entries[key] = entry
+        return pickle.loads(entry[1])
+
+    def update(self, other):
+        """take over the entries of another registry, e.g. one received from the parent process"""
+        self.entries.update(other.entries)
+
+    def clear(self):
+        """remove all entries"""
+        self.entries = {}
+
+
+config_registry = ConfigRegistry()  # registry used by all config readers of this module
+
+
+def registered(reader):
+    """decorator making a config reader serve its configs from :data:`config_registry`
+
+    The undecorated reader remains accessible as attribute 'uncached' of the decorated function
+    """
+    @functools.wraps(reader)
+    def get(file, *args, **kwargs):
+        return config_registry.get(reader, file, *args, **kwargs)
+    get.uncached = reader
+    return get
+
+
+def read_yaml(file):
+    """read yaml file to dictionary (bypassing the registry). Don't do any checks on contents"""
     with open(file) as f:
-        conf = yaml.load(f, Loader=yaml.FullLoader)
+        conf = yaml.load(f, Loader=YamlLoader)
     return conf
 
 
+@registered
+def get_conf(file):
+    """get conf dictionary from yaml files. Don't do any checks on contents"""
+    return read_yaml(file)
+
+
 def check_conf(conf, mandatory_keys, miss_description):
     """check for mandatory keys of conf dictionary
 
@@ -31,6 +90,7 @@ def to_abspath(conf, keys):
     return conf
 
 
+@registered
 def get_inst_config(file):
     """get configuration for each instrument and check for completeness of config file"""
 
@@ -46,7 +106,7 @@ def get_inst_config(file):
     mandatory_keys_model_request_grid = ['lat_res', 'lon_res', 'lat_offset', 'lon_offset']
     mandatory_keys_retrieval = ['tb_noise', 'tb_bias', 'zenith_channels', 'scan_channels']
 
-    conf = get_conf(file)
+    conf = read_yaml(file)
 
     # verify conf dictionary structure
     check_conf(conf, mandatory_keys, 'of instrument config files but is missing in {}'.format(file))
@@ -73,6 +133,7 @@ def get_inst_config(file):
     return conf
 
 
+@registered
 def get_retrieval_config(file):
     """get configuration for running the retrieval check for completeness of config file and ensure absolute paths"""
     mandatory_keys = ['data', 'vip']
@@ -90,7 +151,7 @@ def get_retrieval_config(file):
     mandatory_keys_vip = []
     paths_vip = []  # paths that shall be transformed to abs paths
 
-    conf = get_conf(file)
+    conf = read_yaml(file)
 
     check_conf(conf, mandatory_keys, 'of retrieval config files but is missing in {}.'.format(file))
     check_conf(conf['data'], mandatory_keys_data,
@@ -103,6 +164,16 @@ def get_retrieval_config(file):
     return conf
 
 
+def get_processing_conf(conf, key, default=None):
+    """get optional setting from the 'processing' section of the retrieval config. Return default if not set"""
+    conf_processing = conf.get('processing') or {}
+    val = conf_processing.get(key)
+    if val is None:
+        return default
+    return val
+
+
+@registered
 def get_mars_config(file, mandatory_keys=None, mandatory_keys_request=None):
     """get configuration for mars request to obtain ECMWF data and check for completeness of config file
 
@@ -123,7 +194,7 @@ def get_mars_config(file, mandatory_keys=None, mandatory_keys_request=None):
     mandatory_keys_grid = ['lat_res', 'lon_res' , 'lat_offset', 'lon_offset']
     mandatory_keys_outfile = ['path', 'basename']
 
-    conf = get_conf(file)
+    conf = read_yaml(file)
 
     # verify conf dictionary structure
     note_msg = "Note that some fields can be set to 'null' if waiting for input by instrument config or current time."
@@ -157,6 +228,7 @@ def merge_mars_inst_config(mars_conf, inst_conf):
     return merged_conf
 
 
+@registered
 def get_nc_format_config(file):
     """get configuration for output NetCDF format and check for completeness of config file"""
 
@@ -164,7 +236,7 @@ def get_nc_format_config(file):
     mandatory_variable_keys = ['name', 'dim', 'type', '_FillValue', 'optional', 'attributes']
     mandatory_dimension_keys = ['unlimited', 'fixed']
 
-    conf = get_conf(file)
+    conf = read_yaml(file)
 
     # verify conf dictionary structure
     check_conf(conf, mandatory_keys,
@@ -178,10 +250,14 @@ def get_nc_format_config(file):
         if not isinstance(varval['dim'], list):
             raise MWRConfigError("The value attributed to 'dim' in variable '{}' is not a list in {}"
                                  .format(varname, file))
+        if varval.get('chunksizes') is not None and len(varval['chunksizes']) != len(varval['dim']):
+            raise MWRConfigError("The number of 'chunksizes' in variable '{}' does not match its number of dims in {}"
+                                 .format(varname, file))
 
     return conf
 
 
+@registered
 def get_log_config(file):
     """get configuration for logger and check for completeness of config file"""
 
@@ -189,7 +265,7 @@ def get_log_config(file):
     mandatory_keys_file = ['logfile_path', 'logfile_basename', 'logfile_ext', 'logfile_timestamp_format',
                            'loglevel_file']
 
-    conf = get_conf(file)
+    conf = read_yaml(file)
     check_conf(conf, mandatory_keys,
                'of logs config files but is missing in {}'.format(file))
     if conf['write_logfile']:
@@ -3,18 +3,64 @@ import pandas as pd
 import xarray as xr
 
 
-def get_from_nc_files(files_in, concat_dim='time'):
-    """read (several) NetCDF input files to a :class:`xarray.Dataset` and fix time encoding for correct nc output"""
-    data = xr.open_mfdataset(files_in, concat_dim=concat_dim, combine='nested')
-    data = drop_duplicates(data, dim=concat_dim)
+def get_from_nc_files(files_in, concat_dim='time', data_vars=None):
+    """read (several) NetCDF input files to a :class:`xarray.Dataset` keeping time encoding for correct nc output
+
+    Each file is opened once. Only the selected variables are read and the files are closed again before returning, so
+    they can be removed right after. The time encoding (especially units) is taken from the first file.
 
-    # correct time encoding (especially units) which is broken by open_mfdateset by explicitly loading first file
-    data_first = xr.open_dataset(files_in[0])
-    data = set_encoding(data, ['time'], data_first.time.encoding)
+    Args:
+        files_in: list of NetCDF files
+        concat_dim (optional): dimension along which the files are concatenated. Defaults to 'time'
+        data_vars (optional): list of variables to read (together with the coordinates they need). Variables missing in
+            the files are ignored. Defaults to None, i.e. all variables are read
+    """
+    opened = []
+    datasets = []
+    try:
+        for file in files_in:
+            ds = xr.open_dataset(file)
+            opened.append(ds)
+            if data_vars is not None:
+                ds = ds[[var for var in data_vars if var in ds]]
+            datasets.append(ds)
+        data = concat_unique(datasets, concat_dim).load()
+    finally:
+        for ds in opened:
+            ds.close()
 
     return data
 
 
+def concat_unique(datasets, concat_dim='time'):
+    """concatenate datasets, drop duplicates in concat_dim (keeping the first) and keep time encoding of the first one
+
+    Args:
+        datasets: list of :class:`xarray.Dataset`
+        concat_dim (optional): dimension along which the datasets are concatenated. Defaults to 'time'
+    """
+    data = xr.concat(datasets, dim=concat_dim)
+    data = drop_duplicates(data, dim=concat_dim)
+    return set_encoding(data, ['time'], datasets[0].time.encoding)
+
+
+def select_time(ds, time_min, time_max, dim='time'):
+    """select data with time between time_min and time_max (both included) by index
+
+    Args:
+        ds: :class:`xarray.Dataset` or :class:`xarray.DataArray` sorted along dim, e.g. by :func:`drop_duplicates`
+        time_min: lower limit as :class:`numpy.datetime64`. NaT for no limit
+        time_max: upper limit as :class:`numpy.datetime64`. NaT for no limit
+        dim (optional): name of the time dimension. Defaults to 'time'
+    Returns:
+        ds limited to the time range. Other than with :meth:`xarray.Dataset.where`, data types are preserved
+    """
+    times = ds[dim].values
+    ind_start = 0 if np.isnat(time_min) else np.searchsorted(times, time_min, side='left')
+    ind_end = len(times) if np.isnat(time_max) else np.searchsorted(times, time_max, side='right')
+    return ds.isel({dim: slice(ind_start, ind_end)})
+
+
 def drop_duplicates(ds, dim):
     """drop duplicates from all data in ds for duplicates in dimension vector
 
@@ -0,0 +1,182 @@
+import bisect
+import os
+
+import numpy as np
+
+from mwr_l12l2.errors import FilenameError, MissingDataError
+from mwr_l12l2.log import logger
+from mwr_l12l2.utils.file_utils import datetime64_from_filename
+
+
+def _normalise_path(path):
+    """get absolute and normalised path for comparing paths independently of their spelling (e.g. trailing slash)"""
+    return os.path.normpath(os.path.abspath(str(path)))
+
+
+class FileIndex(object):
+    """Index of the MWR and ALC input files parsing each filename only once
+
+    MWR files are kept in lists sorted by the timestamp in their filename per instrument (wigos, inst_id), ALC files in
+    lists sorted by filename per station. The index is updated incrementally by :meth:`refresh`, which only rescans a
+    directory if its modification time has changed and only parses the names of new files, or by :meth:`add` and
+    :meth:`remove` (e.g. from file system change events).
+
+    Args:
+        mwr_dir: directory containing the MWR files
+        mwr_file_prefix: prefix of the MWR filenames (before the WIGOS-ID)
+        alc_dir: directory containing the ALC files
+        alc_file_prefix: prefix of the ALC filenames (before the WIGOS-ID)
+        ext (optional): extension of the files to be indexed. Defaults to '.nc'
+    """
+
+    def __init__(self, mwr_dir, mwr_file_prefix, alc_dir, alc_file_prefix, ext='.nc'):
+        self.mwr_dir = _normalise_path(mwr_dir)
+        self.mwr_file_prefix = mwr_file_prefix
+        self.alc_dir = _normalise_path(alc_dir)
+        self.alc_file_prefix = alc_file_prefix
+        self.ext = ext
+
+        self._mwr_times = {}  # sorted timestamps of MWR files with (wigos, inst_id) as keys
+        self._mwr_files = {}  # MWR files in same order as _mwr_times
+        self._alc_files = {}  # sorted ALC files with wigos as keys
+        self._keys = {}  # key of each indexed file (path) for removal
+        self._dir_mtimes = {}  # modification time of directories at last scan
+
+    @classmethod
+    def from_conf(cls, conf):
+        """set up a file index for the input directories of a retrieval configuration dictionary"""
+        return cls(conf['data']['mwr_dir'], conf['data']['mwr_file_prefix'],
+                   conf['data']['alc_dir'], conf['data']['alc_file_prefix'])
+
+    def refresh(self):
+        """update the index with the files added to or removed from the input directories since the last refresh"""
+        for directory in [self.mwr_dir, self.alc_dir]:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                logger.warning('Input directory {} does not exist'.format(directory))
+                continue
+            if self._dir_mtimes.get(directory) == mtime:
+                continue
+            self._dir_mtimes[directory] = mtime
+
+            present = set()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    present.add(entry.path)
+                    if entry.path not in self._keys:
+                        self.add(entry.path)
+            for file in [f for f in self._keys if os.path.dirname(f) == directory and f not in present]:
+                self.remove(file)
+
+    def add(self, file):
+        """add a single file to the index. Files not matching the MWR or ALC naming pattern are ignored"""
+        file = _normalise_path(file)
+        if file in self._keys:
+            return
+        directory, filename = os.path.split(file)
+        if not filename.endswith(self.ext):
+            return
+        try:
+            if directory == self.mwr_dir and filename.startswith(self.mwr_file_prefix):
+                # MWR filenames are of type {prefix}{wigos}_{inst_id}{timestamp}{ext}
+                wigos, inst_part = filename[len(self.mwr_file_prefix):-len(self.ext)].split('_')[:2]
+                key = (wigos, inst_part[0])
+                timestamp = datetime64_from_filename(filename)
+                ind = bisect.bisect_right(self._mwr_times.setdefault(key, []), timestamp)
+                self._mwr_times[key].insert(ind, timestamp)
+                self._mwr_files.setdefault(key, []).insert(ind, file)
+            elif directory == self.alc_dir and filename.startswith(self.alc_file_prefix):
+                # ALC filenames are of type {prefix}{wigos}_{timestamp}{ext}
+                key = filename[len(self.alc_file_prefix):].split('_')[0]
+                bisect.insort(self._alc_files.setdefault(key, []), file)
+            else:
+                return
+        except (ValueError, IndexError, FilenameError):
+            logger.warning('Ignoring file {} as its name does not match the expected pattern'.format(file))
+            return
+        self._keys[file] = key
+
+    def remove(self, file):
+        """remove a single file from the index (if it is indexed)"""
+        file = _normalise_path(file)
+        key = self._keys.pop(file, None)
+        if key is None:
+            return
+        if isinstance(key, tuple):
+            ind = self._mwr_files[key].index(file)
+            del self._mwr_files[key][ind]
+            del self._mwr_times[key][ind]
+            if not self._mwr_files[key]:
+                del self._mwr_files[key], self._mwr_times[key]
+        else:
+            self._alc_files[key].remove(file)
+            if not self._alc_files[key]:
+                del self._alc_files[key]
+
+    def instruments(self, by_age=False):
+        """get list of all instruments as tuples (wigos, inst_id) with at least one MWR file in the index
+
+        Args:
+            by_age (optional): sort instruments by the timestamp of their oldest MWR file (oldest first) instead of by
+                WIGOS-ID and instrument ID. Defaults to False.
+        """
+        if by_age:
+            return sorted(self._mwr_times, key=lambda k: self._mwr_times[k][0])
+        return sorted(self._mwr_files)
+
+    def oldest_instrument(self):
+        """get the instrument (wigos, inst_id) having the MWR file with the oldest timestamp
+
+        Raises:
+            MissingDataError: if the index does not contain any MWR file
+        """
+        if not self._mwr_times:
+            raise MissingDataError('No MWR data found in {}'.format(self.mwr_dir))
+        return min(self._mwr_times, key=lambda k: self._mwr_times[k][0])
+
+    def mwr_files(self, wigos, inst_id, start_time=None, end_time=None):
+        """get MWR files of an instrument sorted by their timestamp
+
+        Args:
+            wigos: WIGOS-ID of the station
+            inst_id: instrument ID
+            start_time (optional): only return files with timestamp >= start_time (:class:`numpy.datetime64` or
+                :class:`datetime.datetime`). Defaults to None (no limit).
+            end_time (optional): only return files with timestamp <= end_time. Defaults to None (no limit).
+        """
+        key = (wigos, inst_id)
+        if key not in self._mwr_files:
+            return []
+        times = self._mwr_times[key]
+        ind_start = 0 if start_time is None else bisect.bisect_left(times, _to_datetime64(start_time))
+        ind_end = len(times) if end_time is None else bisect.bisect_right(times, _to_datetime64(end_time))
+        return self._mwr_files[key][ind_start:ind_end]
+
+    def mwr_files_covering(self, wigos, inst_id, start_time, end_time):
+        """get MWR files of an instrument which can contain data between start_time and end_time
+
+        These are the files with timestamp between start_time and end_time plus the last file before start_time, as
+        timestamps in filenames indicate the start of the data in the file.
+        """
+        key = (wigos, inst_id)
+        if key not in self._mwr_files:
+            return []
+        times = self._mwr_times[key]
+        ind_start = max(bisect.bisect_right(times, _to_datetime64(start_time)) - 1, 0)
+        ind_end = bisect.bisect_right(times, _to_datetime64(end_time))
+        return self._mwr_files[key][ind_start:ind_end]
+
+    def timestamp(self, file):
+        """get the timestamp (from the filename) of an MWR file in the index"""
+        key = self._keys[file]
+        return self._mwr_times[key][self._mwr_files[key].index(file)]
+
+    def alc_files(self, wigos):
+        """get ALC files of a station sorted by filename"""
+        return list(self._alc_files.get(wigos, []))
+
+
+def _to_datetime64(time):
+    """transform time to :class:`numpy.datetime64` with the same unit as the timestamps parsed from filenames"""
+    return np.datetime64(time, 'us')
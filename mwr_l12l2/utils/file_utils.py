@@ -91,6 +91,33 @@ def datetime64_from_filename(filename, *args, **kwargs):
                         'of the accepted formats ({})'.format(len(dstr), accepted_formats))
 
 
+def files_covering(files, start_time=None, end_time=None, suffix=''):
+    """get the files which can contain data between start_time and end_time judging from the dates in their filenames
+
+    As the dates in filenames indicate the start of the data in the file, these are the files dated between start_time
+    and end_time plus the last file dated before start_time. Files are not opened.
+
+    Args:
+        files: list of filenames containing a date as understood by :func:`datetime64_from_filename`
+        start_time (optional): :class:`numpy.datetime64`. Defaults to None, i.e. no lower limit. NaT is the same as None
+        end_time (optional): :class:`numpy.datetime64`. Defaults to None, i.e. no upper limit. NaT is the same as None
+        suffix (optional): suffix of the filenames coming after the date and before the extension. Defaults to ''
+    Returns:
+        list of the selected files sorted by their date
+    """
+    times = np.array([datetime64_from_filename(file, suffix) for file in files], dtype='datetime64[us]')
+    order = np.argsort(times, kind='stable')
+    files_sorted = [files[ind] for ind in order]
+    times = times[order]
+    ind_start = 0
+    if start_time is not None and not np.isnat(start_time):
+        ind_start = max(np.searchsorted(times, start_time, side='right') - 1, 0)
+    ind_end = len(times)
+    if end_time is not None and not np.isnat(end_time):
+        ind_end = np.searchsorted(times, end_time, side='right')
+    return files_sorted[ind_start:ind_end]
+
+
 def generate_output_filename(basename, timestamp_src, files_in=None, time=None, ext='nc'):
     """generate filename in form {basename}{timestamp}.{ext} where timestamp comes from input files or time vector
 
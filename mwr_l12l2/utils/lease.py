@@ -0,0 +1,255 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from mwr_l12l2.errors import LeaseError
+from mwr_l12l2.log import logger
+from mwr_l12l2.utils.config_utils import get_processing_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+
+class Lease(object):
+    """Lease on a named resource for several hosts sharing a file system without any central service
+
+    A lease is a file in a shared lease directory created with O_CREAT | O_EXCL, which is atomic also on NFS, hence
+    only one host can hold it at a time. The file contains the owner and the expiry time of the lease. A lease whose
+    expiry time has passed (e.g. because the holding host crashed) is recovered by renaming the lease file to a unique
+    name, which only succeeds for one of the hosts trying to do so, before claiming it anew. If the renamed file turns
+    out not to be the stale lease (identified by inode and contents), it is put back instead. The clocks of the hosts
+    are assumed to be synchronised (e.g. by NTP) much better than the time to live of the leases.
+
+    Can be used as context manager acquiring the lease (raising :class:`mwr_l12l2.errors.LeaseError` if held by
+    another owner) on entry and releasing it on exit.
+
+    Args:
+        lease_dir: shared directory containing the lease files
+        name: name of the resource (must be usable as filename)
+        ttl (optional): time to live of the lease in seconds. Defaults to 3600. Renew the lease with :meth:`renew` if
+            the resource is used for longer.
+        owner (optional): identifier of the owner. Defaults to hostname, process id and a random part
+    """
+
+    def __init__(self, lease_dir, name, ttl=3600, owner=None):
+        self.lease_dir = str(abs_file_path(lease_dir))
+        self.name = name
+        self.ttl = ttl
+        if owner is None:
+            owner = '{}_{}_{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.owner = owner
+        self.file = os.path.join(self.lease_dir, name + '.lease')
+        self.held = False
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LeaseError('Lease on {} is held by {}'.format(self.name, self.holder()))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """try to acquire the lease. Returns True if successful, False if the lease is held by another owner"""
+        os.makedirs(self.lease_dir, exist_ok=True)
+        for _ in range(2):  # second attempt only after recovery of a stale lease
+            try:
+                fd = os.open(self.file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._recover_stale():
+                    return False
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._contents(), f)
+            self.held = True
+            return True
+        return False
+
+    def renew(self):
+        """extend the expiry of a held lease by ttl seconds from now
+
+        Raises:
+            LeaseError: if the lease has meanwhile been taken over by another owner (e.g. because it had expired)
+        """
+        contents = self._read()
+        if not self.held or contents is None or contents.get('owner') != self.owner:
+            self.held = False
+            raise LeaseError('Lease on {} has been lost'.format(self.name))
+        tmp_file = '{}.{}.tmp'.format(self.file, self.owner)
+        with open(tmp_file, 'w') as f:
+            json.dump(self._contents(), f)
+        os.replace(tmp_file, self.file)
+
+    def release(self):
+        """release the lease if held by this owner"""
+        if not self.held:
+            return
+        self.held = False
+        contents = self._read()
+        if contents is not None and contents.get('owner') == self.owner:
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
+
+    def holder(self):
+        """get the owner currently holding the lease or None if it is free"""
+        contents = self._read()
+        return None if contents is None else contents.get('owner')
+
+    def _contents(self):
+        return {'owner': self.owner, 'expires': time.time() + self.ttl}
+
+    def _read(self, file=None):
+        """read the contents of the lease file. Returns None if not existing
+
+        A lease file with unreadable contents (being written or corrupted) expires ttl seconds after its last
+        modification.
+        """
+        return self._read_with_inode(file)[0]
+
+    def _read_with_inode(self, file=None):
+        """read the contents (see :meth:`_read`) and the inode of the lease file. Returns (None, None) if not existing"""
+        if file is None:
+            file = self.file
+        try:
+            with open(file) as f:
+                inode = os.fstat(f.fileno()).st_ino
+                try:
+                    return json.load(f), inode
+                except ValueError:
+                    return {'owner': None, 'expires': os.fstat(f.fileno()).st_mtime + self.ttl}, inode
+        except FileNotFoundError:
+            return None, None
+
+    def _recover_stale(self):
+        """remove the lease file if it has expired. Returns True if the lease file is gone afterwards"""
+        contents, inode = self._read_with_inode()
+        if contents is None:
+            return True  # released in the meantime
+        if contents.get('expires', 0) > time.time():
+            return False
+        # only one host can rename the stale lease file. Check that it was the stale lease that got renamed
+        stale_file = '{}.{}.stale'.format(self.file, self.owner)
+        try:
+            os.rename(self.file, stale_file)
+        except FileNotFoundError:
+            return True  # recovered by another host, hence try to acquire as well
+        renamed, renamed_inode = self._read_with_inode(stale_file)
+        if renamed_inode != inode or renamed != contents:  # inodes of removed files can be reused immediately
+            # another host has recovered and re-acquired the lease in between. Put its lease back
+            try:
+                os.link(stale_file, self.file)
+            except FileExistsError:
+                # yet another host has acquired the lease meanwhile. Never remove a lease which is not the stale one
+                logger.error('Could not put back lease on {} of {}. It is left in {}'.format(
+                    self.name, renamed.get('owner'), stale_file))
+                return False
+            os.remove(stale_file)  # the lease file remains under its original name
+            return False
+        os.remove(stale_file)
+        logger.warning('Recovered stale lease on {} from {}'.format(self.name, renamed.get('owner')))
+        return True
+
+
+class InstrumentLeases(object):
+    """Leases of the instruments processed by this host in a shared lease directory
+
+    While leases are held, they are renewed in a background thread every third of their time to live, so that
+    instruments stay leased also during cycles or reprocessing runs lasting longer than the time to live.
+
+    Args:
+        lease_dir: shared directory containing the lease files
+        ttl (optional): time to live of the leases in seconds. Defaults to 3600.
+    """
+
+    def __init__(self, lease_dir, ttl=3600):
+        self.lease_dir = lease_dir
+        self.ttl = ttl
+        self.leases = {}
+        self._lock = threading.Lock()  # protects self.leases against the renewal thread
+        self._stop_renewal = None  # event stopping the renewal thread while it runs
+
+    def __getstate__(self):
+        """leave out lock and renewal thread when pickled (e.g. along with a manager sent to worker processes)"""
+        state = self.__dict__.copy()
+        del state['_lock'], state['_stop_renewal']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._stop_renewal = None
+
+    def claim(self, wigos, inst_id):
+        """try to claim an instrument. Returns True if successful (or already held), False if held by another host"""
+        name = '{}_{}'.format(wigos, inst_id)
+        if name in self.leases:
+            return True
+        lease = Lease(self.lease_dir, name, self.ttl)
+        if not lease.acquire():
+            logger.info('Instrument {} is processed by {}. Skipping it'.format(name, lease.holder()))
+            return False
+        with self._lock:
+            self.leases[name] = lease
+        self.start_renewal()
+        return True
+
+    def release(self, wigos, inst_id):
+        """release the lease on an instrument (if held)"""
+        with self._lock:
+            lease = self.leases.pop('{}_{}'.format(wigos, inst_id), None)
+            if lease is not None:
+                lease.release()
+            if not self.leases:
+                self.stop_renewal()
+
+    def renew_all(self):
+        """renew all held leases. Leases which have been lost in the meantime are dropped with an error message"""
+        with self._lock:
+            for name, lease in list(self.leases.items()):
+                try:
+                    lease.renew()
+                except LeaseError as e:
+                    logger.error(e)
+                    del self.leases[name]
+
+    def release_all(self):
+        """release all held leases"""
+        with self._lock:
+            for lease in self.leases.values():
+                lease.release()
+            self.leases = {}
+            self.stop_renewal()
+
+    def start_renewal(self):
+        """start the thread renewing the held leases every third of their time to live (if not running yet)"""
+        if self._stop_renewal is not None:
+            return
+        self._stop_renewal = threading.Event()
+        thread = threading.Thread(target=self._renew_until, args=(self._stop_renewal,), daemon=True,
+                                  name='lease_renewal')
+        thread.start()
+
+    def stop_renewal(self):
+        """stop the renewal thread (if running)"""
+        if self._stop_renewal is not None:
+            self._stop_renewal.set()
+            self._stop_renewal = None
+
+    def _renew_until(self, stop):
+        """renew all held leases periodically until stop is set"""
+        while not stop.wait(self.ttl / 3):
+            self.renew_all()
+
+
+def get_instrument_leases(conf):
+    """get :class:`InstrumentLeases` as configured in the 'processing' section of the retrieval config
+
+    Returns None if no 'lease_dir' is configured, i.e. if all instruments are processed by a single host
+    """
+    lease_dir = get_processing_conf(conf, 'lease_dir')
+    if lease_dir is None:
+        return None
+    return InstrumentLeases(lease_dir, ttl=get_processing_conf(conf, 'lease_ttl', 3600))
@@ -0,0 +1,142 @@
+import netCDF4
+import numpy as np
+from xarray.coding.times import decode_cf_datetime, encode_cf_datetime
+
+from mwr_l12l2.errors import MWRInputError
+from mwr_l12l2.utils.publish import atomic_output
+
+
+def merge_nc_files(files_in, file_out, data_vars=None, time_min=None, time_max=None, concat_dim='time',
+                   nc_format=None):
+    """merge time-sorted NetCDF files to file_out reading and appending one file after the other
+
+    Other than :func:`mwr_l12l2.utils.data_utils.get_from_nc_files` the data are never held in memory for more than one
+    input file. Values are copied as stored in the input files (no decoding and re-encoding), only the time is converted
+    if the units differ from the ones of the first file. Samples of a file are sorted by time and duplicates are
+    dropped (keeping the first). Samples not later than the last sample written from the previous files, i.e. overlaps
+    between files, are dropped as well. Hence, the input files must be sorted by the time of their first sample.
+
+    Args:
+        files_in: list of NetCDF files sorted by time
+        file_out: merged output file. It is replaced atomically and not created if an exception occurs
+        data_vars (optional): list of variables to copy (together with the coordinates of their dimensions). Variables
+            missing in the files are ignored. Defaults to None, i.e. all variables
+        time_min (optional): only copy samples from this :class:`numpy.datetime64` on. Defaults to None (no limit)
+        time_max (optional): only copy samples up to this :class:`numpy.datetime64`. Defaults to None (no limit)
+        concat_dim (optional): dimension (and coordinate variable) of the time. Defaults to 'time'
+        nc_format (optional): NetCDF format of file_out. Defaults to None, i.e. the format of the first input file
+    Returns:
+        latest time in the input files (also considering samples not copied) as :class:`numpy.datetime64`
+    """
+    if not files_in:
+        raise MWRInputError('need at least one file to merge into {}'.format(file_out))
+
+    time_last = np.datetime64('NaT')  # last sample written
+    time_latest_in = np.datetime64('NaT')  # latest sample found in inputs
+    with atomic_output(file_out) as tmp_file:
+        out = None
+        try:
+            for file in files_in:
+                with netCDF4.Dataset(file) as nc:
+                    nc.set_auto_maskandscale(False)
+                    if out is None:
+                        out = create_like(nc, tmp_file, data_vars, concat_dim, nc_format)
+                    time_in = nc[concat_dim]
+                    times = decode_cf_datetime(time_in[:], time_in.units, getattr(time_in, 'calendar', None))
+                    if times.size == 0:
+                        continue
+                    if np.isnat(time_latest_in) or times.max() > time_latest_in:
+                        time_latest_in = times.max()
+
+                    _, ind = np.unique(times, return_index=True)  # sorted, keeping first of duplicates
+                    if not np.isnat(time_last):
+                        ind = ind[times[ind] > time_last]
+                    if time_min is not None and not np.isnat(time_min):
+                        ind = ind[times[ind] >= time_min]
+                    if time_max is not None and not np.isnat(time_max):
+                        ind = ind[times[ind] <= time_max]
+                    if ind.size == 0:
+                        continue
+                    append(nc, out, ind, times[ind], concat_dim)
+                    time_last = times[ind[-1]]
+        finally:
+            if out is not None:
+                out.close()
+    return time_latest_in
+
+
+def create_like(nc, file, data_vars=None, concat_dim='time', nc_format=None):
+    """create file with the structure of the open :class:`netCDF4.Dataset` nc for appending along concat_dim
+
+    Global and variable attributes, data types, fill values and chunking are taken from nc. Variables not depending on
+    concat_dim are copied right away.
+
+    Args:
+        nc: :class:`netCDF4.Dataset` serving as template
+        file: file to create
+        data_vars (optional): variables to create (together with the coordinates of their dimensions). Defaults to None,
+            i.e. all variables of nc
+        concat_dim (optional): dimension along which data will be appended. Created as unlimited dimension
+        nc_format (optional): NetCDF format of file. Defaults to None, i.e. the format of nc
+    Returns:
+        :class:`netCDF4.Dataset` open for writing without automatic masking and scaling
+    """
+    if data_vars is None:
+        variables = list(nc.variables)
+    else:
+        variables = [var for var in data_vars if var in nc.variables]
+    dims = [dim for dim in nc.dimensions if any(dim in nc[var].dimensions for var in variables)]
+    variables = [dim for dim in dims if dim in nc.variables and dim not in variables] + variables
+
+    if nc_format is None:
+        nc_format = nc.data_model
+    out = netCDF4.Dataset(file, 'w', format=nc_format)
+    out.set_auto_maskandscale(False)
+    out.setncatts({attr: nc.getncattr(attr) for attr in nc.ncattrs()})
+    for dim in dims:
+        out.createDimension(dim, None if dim == concat_dim else len(nc.dimensions[dim]))
+    for var in variables:
+        var_in = nc[var]
+        kwargs = {}
+        if '_FillValue' in var_in.ncattrs():
+            kwargs['fill_value'] = var_in.getncattr('_FillValue')
+        if nc_format.startswith('NETCDF4') and nc.data_model.startswith('NETCDF4'):
+            chunking = var_in.chunking()
+            if chunking != 'contiguous' or concat_dim in var_in.dimensions:
+                kwargs['chunksizes'] = None if chunking == 'contiguous' else chunking
+        var_out = out.createVariable(var, var_in.datatype, var_in.dimensions, **kwargs)
+        var_out.setncatts({attr: var_in.getncattr(attr) for attr in var_in.ncattrs() if attr != '_FillValue'})
+        if concat_dim not in var_in.dimensions:
+            var_out[...] = var_in[...]
+    return out
+
+
+def append(nc, out, ind, times, concat_dim='time'):
+    """append the samples at indices ind along concat_dim of nc to out
+
+    Args:
+        nc: open :class:`netCDF4.Dataset` to read from
+        out: open :class:`netCDF4.Dataset` created by :func:`create_like`
+        ind: indices of the samples to append
+        times: times of the samples to append as :class:`numpy.datetime64`
+        concat_dim (optional): dimension along which data are appended
+    """
+    start = len(out.dimensions[concat_dim])
+    sel = slice(start, start + len(ind))
+    for var, var_out in out.variables.items():
+        if concat_dim not in var_out.dimensions:
+            continue
+        if var not in nc.variables:
+            raise MWRInputError("variable '{}' is missing in {}".format(var, nc.filepath()))
+        axis = var_out.dimensions.index(concat_dim)
+        if var == concat_dim:
+            calendar = getattr(var_out, 'calendar', None)
+            if nc[var].units == var_out.units and getattr(nc[var], 'calendar', None) == calendar:
+                values = nc[var][:][ind]
+            else:
+                values, _, _ = encode_cf_datetime(times, var_out.units, calendar)
+        else:
+            values = np.take(nc[var][...], ind, axis=axis)  # read complete variable as indices might not be sorted
+        index = [slice(None)] * var_out.ndim
+        index[axis] = sel
+        var_out[tuple(index)] = values
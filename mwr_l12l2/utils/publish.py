@@ -0,0 +1,167 @@
+import fcntl
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import util
+
+from mwr_l12l2.log import logger
+
+FICLONE = 0x40049409  # ioctl request of Linux for cloning (reflinking) a whole file on copy-on-write file systems
+
+# ways of duplicating a file returned by OutputPublisher.duplicate
+DUPLICATE_HARDLINK = 'hardlink'
+DUPLICATE_REFLINK = 'reflink'
+DUPLICATE_QUEUED = 'queued'  # copy across file systems handed off to background thread
+
+_publisher = None  # output publisher of the current process (see get_output_publisher)
+_publisher_lock = threading.Lock()
+
+
+def tmp_filename(filename):
+    """get name of a temporary file in the same dir as filename which does not match the extension of filename"""
+    return '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+
+
+@contextmanager
+def atomic_output(filename):
+    """context manager yielding a temporary filename to write to which is renamed to filename on successful exit
+
+    As the rename is atomic, consumers of filename see either nothing (or a previous version) or the complete file but
+    never a partially written one. The temporary file is removed if an exception is raised.
+    """
+    tmp_file = tmp_filename(filename)
+    try:
+        yield tmp_file
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+class OutputPublisher(object):
+    """duplicate output files to further destinations without delaying the process producing them
+
+    Files are hardlinked to the destination if it is on the same file system or reflinked if the file system supports
+    copy-on-write clones. Otherwise, the copy is handed off to a background thread. Duplicates appear atomically in the
+    destination dir, i.e. under their final name only once complete.
+
+    Args:
+        max_workers (optional): number of background threads for copies across file systems. Defaults to 1.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self._copier = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def duplicate(self, file, dest_dir):
+        """duplicate file to dest_dir keeping its basename. An existing file of the same name is replaced
+
+        The source file can be removed as soon as this method returns, even if the copy is still pending
+
+        Returns:
+            way of duplication, i.e. one of :data:`DUPLICATE_HARDLINK`, :data:`DUPLICATE_REFLINK` or
+            :data:`DUPLICATE_QUEUED`
+        """
+        target = os.path.join(dest_dir, os.path.basename(file))
+        tmp_target = tmp_filename(target)
+        try:
+            os.link(file, tmp_target)
+            os.replace(tmp_target, target)
+            return DUPLICATE_HARDLINK
+        except OSError:
+            pass
+
+        src = open(file, 'rb')  # keep source open so that it can be copied even if removed by the caller meanwhile
+        try:
+            if reflink(src, tmp_target):
+                os.replace(tmp_target, target)
+                src.close()
+                return DUPLICATE_REFLINK
+            with self._lock:
+                if self._copier is None:
+                    self._copier = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='publisher')
+                future = self._copier.submit(copy_file, src, tmp_target, target)
+                self._pending.add(future)
+        except BaseException:
+            src.close()
+            raise
+        future.add_done_callback(self._done)
+        return DUPLICATE_QUEUED
+
+    def _done(self, future):
+        """callback of finished background copies"""
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            logger.error('Background copy of output failed: {}'.format(future.exception()))
+
+    def pending(self):
+        """get the number of background copies which have not finished yet"""
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        """wait for all pending background copies to finish"""
+        with self._lock:
+            copier = self._copier
+            self._copier = None
+        if copier is not None:
+            copier.shutdown(wait=True)
+
+
+def reflink(src, target):
+    """try to create target as copy-on-write clone of the open file src. Return True if successful"""
+    try:
+        with open(target, 'wb') as f_target:
+            fcntl.ioctl(f_target.fileno(), FICLONE, src.fileno())
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+    os.chmod(target, os.fstat(src.fileno()).st_mode & 0o7777)
+    return True
+
+
+def copy_file(src, tmp_target, target):
+    """copy the open file src to tmp_target and rename the result to target. src is closed when done"""
+    try:
+        with open(tmp_target, 'wb') as f_target:
+            shutil.copyfileobj(src, f_target)
+        os.chmod(tmp_target, os.fstat(src.fileno()).st_mode & 0o7777)
+        os.replace(tmp_target, target)
+        logger.info('{} copied to {}'.format(src.name, target))
+    except BaseException:
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+        raise
+    finally:
+        src.close()
+
+
+def get_output_publisher():
+    """get the :class:`OutputPublisher` of the current process
+
+    The publisher is created on first use. Pending copies are waited for when the process exits (also for worker
+    processes of :mod:`multiprocessing`, which do not run :mod:`atexit` handlers).
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = OutputPublisher()
+            util.Finalize(_publisher, _publisher.close, exitpriority=10)
+        return _publisher
+
+
+def _reset_publisher():
+    """forget the publisher of the parent in a forked child as its background threads do not exist in the child"""
+    global _publisher, _publisher_lock
+    _publisher = None
+    _publisher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_publisher)
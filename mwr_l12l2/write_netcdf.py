@@ -2,16 +2,24 @@ import datetime as dt
 from copy import deepcopy
 
 import numpy as np
+import xarray as xr
 from pkg_resources import get_distribution
 
 import mwr_l12l2
 from mwr_l12l2.errors import MissingConfig, OutputDimensionError
 from mwr_l12l2.log import logger
-from mwr_l12l2.utils.config_utils import get_inst_config, get_nc_format_config
+from mwr_l12l2.utils.config_utils import config_registry, get_inst_config, get_nc_format_config
+from mwr_l12l2.utils.publish import atomic_output
 
 # value for _FillValue attribute of variables encoding field to have unset _FillValue in NetCDF
 ENC_NO_FILLVALUE = None  # tutorials from 2017 said False must be used, but with xarray 0.20.1 only None works
 
+# attributes whose values are encoded in the data type of their variable
+FLAG_ATTRS = ['flag_values', 'flag_masks']
+
+# optional fields of variables in the format definition which are passed on to the encoding for compression
+COMPRESSION_KEYS = ['zlib', 'complevel', 'shuffle', 'least_significant_digit']
+
 
 class Writer(object):
     """Class for writing data (Dataset) to NetCDF according to the format definition in conf_file
@@ -20,7 +28,8 @@ class Writer(object):
         data_in: :class:`xarray.Dataset` or :class:`DataArray` containing data to write to file. Some support is also
             provided if data_in is a dictionary, but this option is deprecated.
         filename: name and path of output NetCDF file
-        conf_nc: configuration dict of yaml file defining the format and contents of the output NetCDF file
+        conf_nc: :class:`WritePlan` or configuration dict or yaml file defining the format and contents of the output
+            NetCDF file. Dicts and files are compiled to a :class:`WritePlan`, files only once per version of the file.
         conf_inst: configuration dict of yaml file with instrument specifications which can contain global attrs
             for NetCDF in the nc_attributes section. If None is passed, no attrs are added. Defaults to None.
         nc_format: NetCDF format type of the output file. Default is NETCDF4
@@ -37,14 +46,16 @@ class Writer(object):
         else:
             self.data = data_in
 
-        # read in config file if config was not provided as dict
-        self.conf_nc = conf_nc
-        if not isinstance(self.conf_nc, dict):
-            self.conf_nc = get_nc_format_config(self.conf_nc)
+        # compile format definition if no plan was provided
+        self.plan = conf_nc
+        if isinstance(self.plan, dict):
+            self.plan = WritePlan(self.plan)
+        elif not isinstance(self.plan, WritePlan):
+            self.plan = get_write_plan(self.plan)
+        self.conf_nc = self.plan.conf_nc
         self.conf_inst = conf_inst
         if conf_inst is not None and not isinstance(self.conf_inst, dict):
             self.conf_inst = get_inst_config(self.conf_inst)
-        self.config_dims = self.conf_nc['dimensions']['unlimited'] + self.conf_nc['dimensions']['fixed']
 
     def run(self):
         """write Dataset to NetCDF according to the format definition in conf_file by using the :class:`xarray` module
@@ -56,40 +67,15 @@ class Writer(object):
             self.global_attrs_from_conf(self.conf_inst, attr_key='nc_attributes')
         # self.add_title_attr()  # compose title #TODO: add an adequate title here
         self.add_history_attr()
-        self.data.to_netcdf(self.filename, format=self.nc_format)  # write to output NetCDF file
+        with atomic_output(self.filename) as tmp_file:  # consumers never see a partially written file
+            self.data.to_netcdf(tmp_file, format=self.nc_format)  # write to output NetCDF file
         logger.info('Data written to ' + self.filename)
 
     def prepare_datavars(self):
         """prepare data variables :class:`xarray.Dataset` for writing to file standard specified in 'conf_nc'"""
-
-        self.data.encoding.update(                                   # acts during to_netcdf()
-            unlimited_dims=self.conf_nc['dimensions']['unlimited'])  # default is fixed, i.e. only need to set unlimited
-        #self.prepare_time_bnds()
-        for var, specs in self.conf_nc['variables'].items():
-            # check availability and fill absent variables
-            if var not in self.data.keys():
-                if specs['optional']:
-                    shape_var = tuple(map(lambda x: len(self.data[x]), specs['dim']))
-                    self.data[var] = (specs['dim'], np.full(shape_var, np.nan))
-                else:
-                    raise KeyError('Variable {} is a mandatory input but was not found in input dictionary'.format(var))
-
-            # dimensions, fill value and encoding
-            self.check_dims(var, specs)
-            self.set_fillvalue(var, specs)
-            self.data[var].encoding.update(dtype=specs['type'])
-
-            # set attributes and make sure that encoding for flag_values and flag_masks corresponds to data type
-            self.data[var].attrs.update(specs['attributes'])
-            for att in ['flag_values', 'flag_masks']:
-                if att in self.data[var].attrs:
-                    self.data[var].attrs[att] = np.array(self.data[var].attrs[att], dtype=specs['type'])
-
-        self.prepare_time()
         # TODO: removed append_qc_thresholds (present in mwr_raw2l1). Verify if method could be re-usable to propagate
         #  tropoe attrs to output file
-        self.remove_vars()
-        self.rename_vars()  # must be last step
+        self.data = self.plan.apply(self.data)
 
     def global_attrs_from_conf(self, conf, attr_key):
         """add global attributes from configuration dictionary
@@ -134,76 +120,164 @@ class Writer(object):
         else:
             self.data.attrs['history'] = hist_str
 
-    def check_dims(self, var, specs):
-        """check dims of var (retain order of config specs, but order of dims returned by xarray Dataset is arbitrary)
 
-        Args:
-            var (str): the name of the variable of whom the dimension shall be checked
-            specs: specifications for this variable from config. Must contain the key 'dim' with a list of dimensions.
+class WritePlan(object):
+    """format definition of the output NetCDF compiled once for preparing any number of datasets for writing
+
+    The plan holds for each variable of the format definition its dimensions, fill value, encoding (including the
+    optional compression and chunking settings) and attributes (with flag values already cast to the data type) as
+    well as the renaming map and the sets of variables and dimensions to keep.
+
+    Args:
+        conf_nc: configuration dict of yaml file defining the format and contents of the output NetCDF file
+    """
+
+    def __init__(self, conf_nc):
+        self.conf_nc = conf_nc
+        self.unlimited_dims = conf_nc['dimensions']['unlimited']
+        self.fixed_dims = set(conf_nc['dimensions']['fixed'])
+        self.config_dims = set(conf_nc['dimensions']['unlimited'] + conf_nc['dimensions']['fixed'])
+        self.keep_vars = set(conf_nc['variables'])
+        self.rename_map = {var: specs['name'] for var, specs in conf_nc['variables'].items()}
+        self.renamed_unlimited_dims = [self.rename_map[dim] for dim in self.unlimited_dims]
+        self.variables = [VariablePlan(var, specs, var in self.config_dims) for var, specs in
+                          conf_nc['variables'].items()]
+        # 'time' variable assumed to be always present, also take *time_* and *_time* (others if they have a calendar)
+        self.time_vars = set(['time'] + [var for var in self.keep_vars if 'time_' in var or '_time' in var])
+
+    @classmethod
+    def from_file(cls, file):
+        """compile from yaml file defining the format and contents of the output NetCDF file"""
+        return cls(get_nc_format_config(file))
+
+    def apply(self, data):
+        """prepare :class:`xarray.Dataset` for writing to file according to the plan
+
+        Variables and dimensions which are not in the format definition are dropped, absent optional variables are
+        filled with NaN, missing values are replaced by the fill values and encodings and attributes are set before
+        renaming the variables. Only variables containing missing values or lacking a scalar dimension are copied, the
+        others are shared with (and their attributes modified in) the input dataset.
+
+        Returns:
+            :class:`xarray.Dataset` ready to be written with :meth:`xarray.Dataset.to_netcdf`
         """
-        if sorted(list(self.data[var].dims)) != sorted(specs['dim']):
-            # if last dim of specs is missing in data and scalar, add it to data (no need for subsequent check)
-            if sorted(list(self.data[var].dims)) == sorted(specs['dim'][:-1]) \
-                    and specs['dim'][-1] in self.data and len(self.data[specs['dim'][-1]]) == 1:
-                newdim = specs['dim'][-1]
-                tmp = self.data[var].expand_dims({newdim: 1}, axis=-1)
-                self.data[var] = tmp.assign_coords({newdim: self.data[newdim]})
-            else:
-                err_msg = "dimensions in data['{}'] (['{}']) do not match specs for output file (['{}'])".format(
-                    var, "', '".join(list(self.data[var].dims)), "', '".join(specs['dim']))
-                raise OutputDimensionError(err_msg)
-
-    def set_fillvalue(self, var, specs):
-        """set the fill value of var by taking care not to remove any fill value for dimensions for CF compliance
+        data = data.drop_vars([var for var in data.variables if var not in self.keep_vars])
+        data = data.drop_dims([dim for dim in data.dims if dim not in self.config_dims])
 
-        Args:
-            var (str): the name of the variable of whom the dimension shall be checked
-            specs: specifications for this variable from config. Must contain the key 'dim' with a list of dimensions.
+        # data of the variables in one pass, collecting the new ones to update the dataset only once
+        new_vars = {}
+        for var_plan in self.variables:
+            variable = var_plan.prepare_data(data)
+            if variable is not None:
+                new_vars[var_plan.var] = variable
+        if new_vars:
+            data.update(new_vars)
+
+        # encoding and attributes (in place as affects neither data nor dims)
+        for var_plan in self.variables:
+            variable = data.variables[var_plan.var]
+            variable.encoding.update(var_plan.encoding)
+            if var_plan.chunksizes is not None:
+                variable.encoding['chunksizes'] = var_plan.chunk_encoding(variable, self.fixed_dims)
+            variable.attrs.update(var_plan.attrs)
+            if var_plan.var in self.time_vars or 'calendar' in variable.attrs:
+                # workaround for correctly setting units and calendar of time variable (use encoding instead of attrs)
+                for att in ['units', 'calendar']:
+                    if att in variable.attrs:
+                        variable.encoding[att] = variable.attrs.pop(att)
+
+        data = data.rename(self.rename_map)  # must be last step
+        data.encoding['unlimited_dims'] = self.renamed_unlimited_dims  # acts during to_netcdf(), default is fixed
+        return data
+
+
+class VariablePlan(object):
+    """part of a :class:`WritePlan` for one variable
+
+    Args:
+        var (str): the name of the variable in the data
+        specs: specifications for this variable from config
+        is_dim (bool): whether the variable is a dimension of the output file. Dimensions get no fill value for CF
+            compliance.
+    """
+
+    def __init__(self, var, specs, is_dim):
+        self.var = var
+        self.dims = tuple(specs['dim'])
+        self.sorted_dims = sorted(specs['dim'])
+        self.optional = specs['optional']
+        self.fill_value = None if is_dim else specs['_FillValue']  # None: do not replace missing values
+        self.encoding = {'dtype': specs['type'],
+                         '_FillValue': ENC_NO_FILLVALUE if self.fill_value is None else self.fill_value}
+        self.encoding.update({key: specs[key] for key in COMPRESSION_KEYS if key in specs})
+        self.chunksizes = None  # chunk size by dim
+        if specs.get('chunksizes') is not None:
+            self.chunksizes = dict(zip(specs['dim'], specs['chunksizes']))
+
+        # make sure that encoding for flag_values and flag_masks corresponds to data type
+        self.attrs = dict(specs['attributes'])
+        for att in FLAG_ATTRS:
+            if att in self.attrs:
+                self.attrs[att] = np.array(self.attrs[att], dtype=specs['type'])
+
+    def chunk_encoding(self, variable, fixed_dims):
+        """get chunksizes encoding in the order of the dims of variable, limiting chunks along fixed dims to their size"""
+        return tuple(max(1, min(self.chunksizes[dim], size)) if dim in fixed_dims else self.chunksizes[dim]
+                     for dim, size in zip(variable.dims, variable.shape))
+
+    def prepare_data(self, data):
+        """get :class:`xarray.Variable` of the variable in data if it has to be created or modified, None otherwise"""
+        if self.var not in data.variables:
+            if not self.optional:
+                raise KeyError('Variable {} is a mandatory input but was not found in input dictionary'.format(
+                    self.var))
+            fill_value = np.nan if self.fill_value is None else self.fill_value
+            return xr.Variable(self.dims, np.full(tuple(data.dims[dim] for dim in self.dims), fill_value,
+                                                  dtype=np.float64))
+
+        new_variable = self.check_dims(data.variables[self.var], data)
+        if self.fill_value is not None:
+            variable = data.variables[self.var] if new_variable is None else new_variable
+            filled_variable = fill_missing(variable, self.fill_value)
+            if filled_variable is not None:
+                new_variable = filled_variable
+        return new_variable
+
+    def check_dims(self, variable, data):
+        """check dims of variable (retain order of config specs, but order of dims in data is arbitrary)
+
+        Returns:
+            None if dims match, otherwise :class:`xarray.Variable` expanded by the last dim of specs if this is the
+            only one missing and scalar in data.
         """
-        if var in self.config_dims or specs['_FillValue'] is None:  # using None in fillna (else clause) destroys dtype
-            self.data[var].encoding.update(_FillValue=ENC_NO_FILLVALUE)
-        else:
-            self.data[var] = self.data[var].fillna(specs['_FillValue'])  # don't use with _FillValue=None, dtype problem
-            self.data[var].encoding.update(_FillValue=specs['_FillValue'])
-
-    def prepare_time(self):
-        """workaround for correctly setting units and calendar of time variable (use encoding instead of attrs)"""
-        time_vars = ['time']  # 'time' variable assumed to be always present
-        time_vars.extend([s for s in self.data.keys() if 'time_' in s or '_time' in s])  # get also *time_* and *_time*
-        time_vars.extend([var for var in self.data.keys() if 'calendar' in self.data[var].attrs])  # all with calendar
-        for var in time_vars:
-            encs = {}
-            for att in ['units', 'calendar']:
-                if att in self.data[var].attrs:
-                    encs[att] = self.data[var].attrs.pop(att)
-            self.data[var].encoding.update(encs)
-
-    # def prepare_time_bnds(self):
-    #     """Function to setup correctly the bnds coordinates and time_bnds variables"""
-
-    #     # Set the bnds coordinates:
-    #     self.data['bnds'] = [0,1]
-
-    #     # Set the time_bnds variables:
-    #     self.data['time_bnds'] = (['time', 'bnds'],-999.0 * np.ones((len(self.data['time']), 2)))
-
-    def rename_vars(self):
-        """set variable and dimension names to the ones set in conf_nc (CARE: must be last operation before save!)"""
-        varname_map = {var: specs['name'] for var, specs in self.conf_nc['variables'].items()}
-        self.data = self.data.rename(varname_map)
-        # take care of encoding set for unlimited dims
-        renamed_unlim_dim = [varname_map[dim] for dim in self.data.encoding['unlimited_dims']]
-        self.data.encoding['unlimited_dims'] = renamed_unlim_dim
-
-    def remove_vars(self):
-        """remove undesired variables and dimensions from data (all that are not in the conf_nc)"""
-        vars_to_drop = []
-        for var in self.data.variables:
-            if var not in self.conf_nc['variables']:
-                vars_to_drop.append(var)
-        self.data = self.data.drop_vars(vars_to_drop)
-        dims_to_drop = []
-        for var in self.data.dims:
-            if var not in self.config_dims:
-                dims_to_drop.append(var)
-        self.data = self.data.drop_dims(dims_to_drop)
+        if sorted(variable.dims) == self.sorted_dims:
+            return None
+        # if last dim of specs is missing in data and scalar, add it to data
+        newdim = self.dims[-1]
+        if sorted(variable.dims) == sorted(self.dims[:-1]) and newdim in data.dims and data.dims[newdim] == 1:
+            return variable.set_dims(variable.dims + (newdim,), variable.shape + (1,))
+        err_msg = "dimensions in data['{}'] (['{}']) do not match specs for output file (['{}'])".format(
+            self.var, "', '".join(list(variable.dims)), "', '".join(self.dims))
+        raise OutputDimensionError(err_msg)
+
+
+def fill_missing(variable, fill_value):
+    """replace missing values in :class:`xarray.Variable` by fill_value
+
+    Returns:
+        None if variable has no missing values, otherwise a modified copy
+    """
+    if variable.dtype.kind in 'biu':
+        return None  # cannot contain missing values
+    if variable.dtype.kind == 'f':
+        values = np.asarray(variable.values)
+        missing = np.isnan(values)
+        if not missing.any():
+            return None
+        return variable.copy(deep=False, data=np.where(missing, np.asarray(fill_value, dtype=values.dtype), values))
+    return variable.fillna(fill_value)
+
+
+def get_write_plan(file):
+    """get the :class:`WritePlan` for a yaml file defining the output NetCDF (compiled only once per file version)"""
+    return config_registry.get(WritePlan.from_file, file)
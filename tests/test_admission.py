@@ -0,0 +1,73 @@
+import glob
+import os
+import unittest
+from unittest import mock
+
+import datetime as dt
+
+from mwr_l12l2.errors import AdmissionError
+from mwr_l12l2.retrieval import admission
+from mwr_l12l2.retrieval.admission import REASON_COORDINATES, REASON_NO_FILES, REASON_NO_SAMPLES, \
+    REASON_SHORT_WINDOW, REASON_WIGOS, FileMeta, check_admission
+from mwr_l12l2.retrieval.retrieval_manager import RetrievalManager
+from mwr_l12l2.utils.config_utils import get_inst_config, get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+mwr_files = sorted(glob.glob(os.path.join(abs_file_path('tests/data/mwr/'), 'MWR_1C01_0-20000-0-10393_A*.nc')))
+wigos = '0-20000-0-10393'
+
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        self.conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        self.inst_conf = get_inst_config(abs_file_path('mwr_l12l2/config/config_0-20000-0-10393_A.yaml'))
+        admission._meta_cache.clear()
+
+    def tearDown(self):
+        admission._meta_cache.clear()
+
+    def assert_rejected(self, reason, wigos_check=wigos, inst_conf=None, start_time=dt.datetime(2023, 4, 25, 13),
+                        end_time=dt.datetime(2023, 4, 25, 16)):
+        """check that the retrieval is rejected for the given reason"""
+        if inst_conf is None:
+            inst_conf = self.inst_conf
+        with self.assertRaises(AdmissionError) as context:
+            check_admission(self.conf, wigos_check, inst_conf, mwr_files, start_time, end_time)
+        self.assertEqual(context.exception.reason, reason)
+
+    def test_admission(self):
+        """test that retrievals are admitted or rejected for the right reason from the file metadata"""
+        check_admission(self.conf, wigos, self.inst_conf, mwr_files, dt.datetime(2023, 4, 25, 13),
+                        dt.datetime(2023, 4, 25, 16))
+        self.assert_rejected(REASON_NO_FILES, end_time=dt.datetime(2023, 4, 25, 12))
+        self.assert_rejected(REASON_NO_SAMPLES, start_time=dt.datetime(2023, 4, 25, 16, 30), end_time=None)
+        self.assert_rejected(REASON_NO_SAMPLES, start_time=None, end_time=None)  # older than max_age
+        self.assert_rejected(REASON_SHORT_WINDOW, start_time=dt.datetime(2023, 4, 25, 15, 55))
+        self.assert_rejected(REASON_WIGOS, wigos_check='0-20000-0-06610')
+        self.assert_rejected(REASON_COORDINATES, inst_conf=dict(self.inst_conf, station_altitude=500.))
+        with self.subTest(operation='coordinates within tolerance'):
+            check_admission(self.conf, wigos, dict(self.inst_conf, station_altitude=150.), mwr_files,
+                            dt.datetime(2023, 4, 25, 13), dt.datetime(2023, 4, 25, 16))
+
+    def test_cache(self):
+        """test that the metadata of each file are only read once"""
+        with mock.patch.object(FileMeta, 'from_file', wraps=FileMeta.from_file) as reader:
+            for _ in range(2):
+                check_admission(self.conf, wigos, self.inst_conf, mwr_files, dt.datetime(2023, 4, 25, 13),
+                                dt.datetime(2023, 4, 25, 16))
+        self.assertEqual(reader.call_count, len(mwr_files))
+
+    def test_manager(self):
+        """test that the manager removes rejected instruments and reports the reasons"""
+        manager = RetrievalManager(self.conf)
+        selected = {'wigos': wigos, 'inst_id': 'A', 'inst_conf': self.inst_conf, 'mwr_files': mwr_files,
+                    'alc_files': []}
+        manager.retrieval_dict = {wigos + '_A': selected,
+                                  wigos + '_C': dict(selected, inst_id='C', mwr_files=mwr_files[:1])}
+        rejections = manager.admit_retrievals(dt.datetime(2023, 4, 25, 14, 55), dt.datetime(2023, 4, 25, 16))
+        self.assertEqual(rejections, {wigos + '_C': REASON_NO_SAMPLES})
+        self.assertEqual(list(manager.retrieval_dict), [wigos + '_A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.retrieval import alc_reader, l1_buffer
+from mwr_l12l2.retrieval.alc_reader import alc_files_for_window, get_alc_data
+from mwr_l12l2.retrieval.tropoe_input import ALC_VARS
+from mwr_l12l2.utils.data_utils import get_from_nc_files, select_time
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+alc_file = abs_file_path('tests/data/alc/L2_0-20000-0-10393_020230425.nc')
+wigos = '0-20000-0-10393'
+time_min = np.datetime64('2023-04-25 13:55')
+time_max = np.datetime64('2023-04-25 15:05')
+
+
+class TestAlcReader(unittest.TestCase):
+    def setUp(self):
+        """copy ALC file to a temporary directory and start with empty caches"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file = shutil.copy(alc_file, self.tmp_dir)
+        self.conf = {'processing': {'alc_cache_dir': os.path.join(self.tmp_dir, 'cache')}}
+        alc_reader._buffers.clear()
+
+    def tearDown(self):
+        alc_reader._buffers.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_files_for_window(self):
+        """test that ALC files are selected by the dates in their filenames"""
+        files = ['L2_{}_0202304{}.nc'.format(wigos, day) for day in ['24', '25', '26']]
+        self.assertEqual(alc_files_for_window(files, time_min, time_max), files[1:2])
+        self.assertEqual(alc_files_for_window(files, np.datetime64('2023-04-24 23:55'), time_max), files[:2])
+        self.assertEqual(alc_files_for_window(files[:1], time_min, time_max), files[:1])  # no match: all
+
+    def test_cache(self):
+        """test that the cloud base data equal those of the file and are read once for all instruments"""
+        expected = select_time(get_from_nc_files([self.file], data_vars=ALC_VARS), time_min, time_max)
+        with mock.patch.object(l1_buffer, 'get_from_nc_files', wraps=get_from_nc_files) as reader:
+            threads = [threading.Thread(target=get_alc_data, args=(self.conf, wigos, [self.file], time_min, time_max))
+                       for _ in range(2)]  # e.g. instruments A and C of the same station
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            data = get_alc_data(self.conf, wigos, [self.file], time_min, time_max)
+        self.assertEqual(reader.call_count, 1)
+        xr.testing.assert_identical(data, expected)
+        self.assertNotIn('attenuated_backscatter_0', data)
+
+        with self.subTest(operation='other process'):
+            alc_reader._buffers.clear()
+            with mock.patch.object(l1_buffer, 'get_from_nc_files', wraps=get_from_nc_files) as reader:
+                xr.testing.assert_identical(get_alc_data(self.conf, wigos, [self.file], time_min, time_max), expected)
+            self.assertEqual(reader.call_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
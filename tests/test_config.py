@@ -1,11 +1,12 @@
 import os
+import pickle
 import shutil
 import unittest
 
 import yaml
 
 from mwr_l12l2.errors import MWRConfigError, MWRTestError
-from mwr_l12l2.utils.config_utils import get_retrieval_config, get_mars_config
+from mwr_l12l2.utils.config_utils import ConfigRegistry, config_registry, get_retrieval_config, get_mars_config
 from mwr_l12l2.utils.file_utils import abs_file_path
 
 dir_config_orig = abs_file_path('mwr_l12l2/config/')
@@ -79,6 +80,40 @@ class TestConfig(unittest.TestCase):
             with self.assertRaises(MWRConfigError):
                 get_mars_config(file_mars_mocked)
 
+    def test_registry(self):
+        """test that configs are only read again if their file changed and that copies are independent"""
+        n_reads = []
+
+        def reader(file):
+            n_reads.append(file)
+            return get_retrieval_config.uncached(file)
+
+        registry = ConfigRegistry()
+        conf = registry.get(reader, file_ret_test)
+        conf['data']['max_age'] = None  # modifying the copy must not affect the registry
+        conf_again = registry.get(reader, file_ret_test)
+        self.assertEqual(len(n_reads), 1)
+        self.assertIsNotNone(conf_again['data']['max_age'])
+        self.assertEqual(get_retrieval_config(file_ret_test), conf_again)
+
+        with self.subTest(operation='changed file'):
+            remove_var_from_yaml(file_ret_test, file_ret_mocked, 'processing')
+            self.assertNotIn('processing', registry.get(reader, file_ret_mocked))
+            shutil.copyfile(file_ret_test, file_ret_mocked)
+            self.assertIn('processing', registry.get(reader, file_ret_mocked))
+            self.assertEqual(len(n_reads), 3)
+        with self.subTest(operation='share with worker'):
+            registry_worker = ConfigRegistry()
+            registry_worker.update(pickle.loads(pickle.dumps(registry)))
+            registry_worker.get(reader, file_ret_test)
+            self.assertEqual(len(n_reads), 3)
+        with self.subTest(operation='validation errors are not stored'):
+            remove_var_from_yaml(file_ret_test, file_ret_mocked, 'data')
+            for _ in range(2):
+                with self.assertRaises(MWRConfigError):
+                    get_retrieval_config(file_ret_mocked)
+            self.assertNotIn(os.path.abspath(file_ret_mocked), [key[1] for key in config_registry.entries])
+
 
 def remove_var_from_yaml(file_in, file_out, var, sect=None):
     # read from input file
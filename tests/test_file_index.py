@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mwr_l12l2.errors import MissingDataError
+from mwr_l12l2.utils.file_index import FileIndex
+
+
+def touch(file):
+    with open(file, 'w'):
+        pass
+
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        """set up MWR and ALC input directories with empty files in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mwr_dir = os.path.join(self.tmp_dir, 'mwr')
+        self.alc_dir = os.path.join(self.tmp_dir, 'alc')
+        os.mkdir(self.mwr_dir)
+        os.mkdir(self.alc_dir)
+        for fn in ['MWR_1C01_0-20000-0-10393_A202304251500.nc', 'MWR_1C01_0-20000-0-10393_A202304251300.nc',
+                   'MWR_1C01_0-20000-0-06610_A202304251400.nc', 'MWR_1C01_0-20000-0-06610_B202304251200.nc',
+                   'not_an_mwr_file.txt']:
+            touch(os.path.join(self.mwr_dir, fn))
+        touch(os.path.join(self.alc_dir, 'L2_0-20000-0-10393_020230425.nc'))
+        self.index = FileIndex(self.mwr_dir, 'MWR_1C01_', self.alc_dir, 'L2_')
+        self.index.refresh()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_queries(self):
+        """test the grouping of files by instrument and the queries of the index"""
+        self.assertEqual(self.index.instruments(),
+                         [('0-20000-0-06610', 'A'), ('0-20000-0-06610', 'B'), ('0-20000-0-10393', 'A')])
+        self.assertEqual(self.index.oldest_instrument(), ('0-20000-0-06610', 'B'))
+        self.assertEqual([os.path.basename(f) for f in self.index.mwr_files('0-20000-0-10393', 'A')],
+                         ['MWR_1C01_0-20000-0-10393_A202304251300.nc', 'MWR_1C01_0-20000-0-10393_A202304251500.nc'])
+        self.assertEqual(len(self.index.mwr_files('0-20000-0-10393', 'A', start_time=np.datetime64('2023-04-25 14:00'),
+                                                  end_time=np.datetime64('2023-04-25 15:00'))), 1)
+        self.assertEqual(len(self.index.alc_files('0-20000-0-10393')), 1)
+        self.assertEqual(self.index.alc_files('0-20000-0-06610'), [])
+
+    def test_refresh(self):
+        """test that added and removed files are taken into account after refresh"""
+        os.remove(os.path.join(self.mwr_dir, 'MWR_1C01_0-20000-0-06610_B202304251200.nc'))
+        touch(os.path.join(self.mwr_dir, 'MWR_1C01_0-20000-0-10393_A202304251100.nc'))
+        self.index.refresh()
+        self.assertEqual(self.index.oldest_instrument(), ('0-20000-0-10393', 'A'))
+        self.assertEqual(len(self.index.mwr_files('0-20000-0-10393', 'A')), 3)
+        self.assertNotIn(('0-20000-0-06610', 'B'), self.index.instruments())
+
+        for fn in os.listdir(self.mwr_dir):
+            os.remove(os.path.join(self.mwr_dir, fn))
+        self.index.refresh()
+        with self.assertRaises(MissingDataError):
+            self.index.oldest_instrument()
+
+    def test_path_spelling(self):
+        """test that files are matched to the input directories independently of how the paths are spelled"""
+        index = FileIndex(self.mwr_dir + os.sep, 'MWR_1C01_', os.path.join(self.alc_dir, '..', 'alc'), 'L2_')
+        index.refresh()
+        self.assertEqual(len(index.instruments()), 3)
+        self.assertEqual(len(index.alc_files('0-20000-0-10393')), 1)
+
+        file = os.path.join(self.mwr_dir, 'MWR_1C01_0-20000-0-10393_A202304251100.nc')
+        touch(file)
+        index.add(os.path.join(self.mwr_dir, '.', os.path.basename(file)))
+        self.assertEqual(len(index.mwr_files('0-20000-0-10393', 'A')), 3)
+        index.refresh()  # must not index the same file twice under a different spelling
+        self.assertEqual(len(index.mwr_files('0-20000-0-10393', 'A')), 3)
+        index.remove(file)
+        self.assertEqual(len(index.mwr_files('0-20000-0-10393', 'A')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,8 @@ import numpy as np
 import yaml
 
 from mwr_l12l2.errors import MWRFileError, MWRTestError
-from mwr_l12l2.utils.file_utils import abs_file_path, concat_filename, datetime64_from_filename, dict_to_file
+from mwr_l12l2.utils.file_utils import abs_file_path, concat_filename, datetime64_from_filename, dict_to_file, \
+    files_covering
 
 dir_out = abs_file_path('tests/data/output_file_utils/')
 
@@ -46,6 +47,15 @@ class TestFileUtils(unittest.TestCase):
         with self.assertRaises(MWRFileError):
             datetime64_from_filename('L2_0-20000-0-06610_A.nc')
 
+    def test_files_covering(self):
+        """Test for files_covering function. The file dated before the start can contain data of the time range"""
+        files = ['MWR_1C01_0-20000-0-10393_A2023042514{}.nc'.format(minute) for minute in ['30', '00', '20', '10']]
+        self.assertEqual(files_covering(files, np.datetime64('2023-04-25 14:15'), np.datetime64('2023-04-25 14:20')),
+                         [files[3], files[2]])
+        self.assertEqual(files_covering(files, np.datetime64('2023-04-25 13:00')), sorted(files))
+        self.assertEqual(files_covering(files, np.datetime64('NaT'), np.datetime64('2023-04-25 14:05')), [files[1]])
+        self.assertEqual(files_covering(files, np.datetime64('2023-04-25 15:00')), [files[0]])
+
     def test_dict_to_file(self):
         """Test for dict_to_file function. Also check that contents remain intact even if specifying header"""
         data = {'key1': 'val1', 'key2': 'val2'}
@@ -0,0 +1,102 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from mwr_l12l2.model.ecmwf import hybrid_levels
+from mwr_l12l2.model.ecmwf.interpret_ecmwf import ModelInterpreter
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+model_fc_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_fc_0-20000-0-10393_A_202304250000_converted_to.nc')
+model_zg_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_z_0-20000-0-10393_A.grb')
+model_level_file = abs_file_path('mwr_l12l2/model/ecmwf/ecmwf_model_levels_137.csv')
+
+
+def legacy_hybrid_to_z(a, b, lnsp, t, q, zg_surf):
+    """tile/roll-based implementation of ModelInterpreter.hybrid_to_p and p_to_z before vectorisation (reference)"""
+    p_surf = np.exp(lnsp)
+    p_surf_all = np.tile(p_surf[:, 0:1, :, :], (1, len(a), 1, 1))
+    a_all = np.tile(a[np.newaxis, :, np.newaxis, np.newaxis], (p_surf.shape[0], 1, p_surf.shape[2], p_surf.shape[3]))
+    b_all = np.tile(b[np.newaxis, :, np.newaxis, np.newaxis], (p_surf.shape[0], 1, p_surf.shape[2], p_surf.shape[3]))
+    p_half = a_all + b_all*p_surf_all
+    p = (p_half + np.roll(p_half, 1, axis=1))[:, 1:, :, :] / 2
+
+    with np.errstate(divide='ignore'):
+        dp = (p_half - np.roll(p_half, 1, axis=1))[:, 1:, :, :]
+        dlogp = np.log(p_half / np.roll(p_half, 1, axis=1))[:, 1:, :, :]
+        alpha = 1 - (p_half[:, 1:, :, :] / dp) * dlogp
+    dlogp[:, 0, :, :] = np.log(p_half[:, 1, :, :] / 0.1)
+    alpha[:, 0, :, :] = np.tile(-np.log(2), (p_half.shape[0], p_half.shape[2], p_half.shape[3]))
+    virt_temp = t * (1 + 0.609133*q)
+    dzg_half = virt_temp * 287.06 * dlogp
+    zg_surf_all = np.tile(zg_surf, (p_half.shape[0], 1, 1, 1))
+    zg_half = np.flip(np.cumsum(np.flip(np.concatenate((dzg_half, zg_surf_all), axis=1), axis=1), axis=1), axis=1)
+    zg = zg_half[:, 1:, :, :] - alpha*287.06*virt_temp
+    return p_half, p, zg / 9.80665
+
+
+def synthetic_inputs(n_time=27, n_lat=3, n_lon=3, seed=0):
+    """get coefficients of all 137 levels and a realistic atmosphere with some noise for testing"""
+    rng = np.random.default_rng(seed)
+    level_coeffs = pd.read_csv(model_level_file)
+    a = level_coeffs['a'].to_numpy()
+    b = level_coeffs['b'].to_numpy()
+    n_levels = len(a) - 1
+    shape = (n_time, n_levels, n_lat, n_lon)
+    lnsp = np.log(rng.uniform(90000, 103000, (n_time, 1, n_lat, n_lon)))
+    t = np.linspace(200, 290, n_levels)[np.newaxis, :, np.newaxis, np.newaxis] + rng.normal(0, 2, shape)
+    q = np.geomspace(3e-6, 1e-2, n_levels)[np.newaxis, :, np.newaxis, np.newaxis] * rng.uniform(0.5, 1.5, shape)
+    zg_surf = rng.uniform(0, 5000, (n_lat, n_lon))
+    return a, b, lnsp, t, q, zg_surf
+
+
+class TestHybridLevels(unittest.TestCase):
+    def test_same_as_legacy(self):
+        """test that the vectorised kernel reproduces the legacy implementation for all 137 levels"""
+        a, b, lnsp, t, q, zg_surf = synthetic_inputs()
+        p_half_ref, p_ref, z_ref = legacy_hybrid_to_z(a, b, lnsp, t, q, zg_surf)
+
+        p_half, p = hybrid_levels.hybrid_to_p(a, b, np.exp(lnsp))
+        z = hybrid_levels.p_to_z(p_half, t, q, zg_surf)
+        np.testing.assert_array_equal(p_half, p_half_ref)
+        np.testing.assert_array_equal(p, p_ref)
+        np.testing.assert_allclose(z, z_ref, rtol=1e-12, atol=1e-8)
+
+        with self.subTest(operation='float32'):
+            p_half, p = hybrid_levels.hybrid_to_p(a, b, np.exp(lnsp), dtype=np.float32)
+            z = hybrid_levels.p_to_z(p_half, t, q, zg_surf, dtype=np.float32)
+            self.assertEqual(z.dtype, np.float32)
+            np.testing.assert_allclose(p, p_ref, rtol=1e-6)
+            np.testing.assert_allclose(z, z_ref, rtol=1e-4, atol=0.5)
+
+    def test_stacked_stations(self):
+        """test that stations stacked along an extra dimension give the same results as separate calls"""
+        stations = [synthetic_inputs(n_time=4, seed=seed) for seed in range(3)]
+        a, b = stations[0][:2]
+        lnsp, t, q = [np.stack([inputs[ind] for inputs in stations], axis=2) for ind in range(2, 5)]
+        zg_surf = np.stack([inputs[5] for inputs in stations])  # dims (station, lat, lon)
+
+        p_half = np.empty((4, len(a), 3, 3, 3))
+        p = np.empty((4, len(a) - 1, 3, 3, 3))
+        z = np.empty_like(p)
+        hybrid_levels.hybrid_to_p(a, b, np.exp(lnsp), p_half=p_half, p=p)
+        hybrid_levels.p_to_z(p_half, t, q, zg_surf, z=z)
+        for ind, inputs in enumerate(stations):
+            _, _, z_ref = legacy_hybrid_to_z(*inputs)
+            np.testing.assert_allclose(z[:, :, ind, :, :], z_ref, rtol=1e-12, atol=1e-8)
+
+    def test_interpreter(self):
+        """test that the model interpreter gives the legacy results for the test forecast (with float32 inputs)"""
+        model = ModelInterpreter(model_fc_file, model_zg_file)
+        model.run()
+        level_coeffs = pd.read_csv(model.file_ml)
+        levels = np.append(model.fc.level.values - 1, model.fc.level.values[-1])
+        _, _, z_ref = legacy_hybrid_to_z(level_coeffs.loc[levels, 'a'].to_numpy(),
+                                         level_coeffs.loc[levels, 'b'].to_numpy(), model.lnsp.values[:, np.newaxis],
+                                         model.fc.t.values, model.fc.q.values, model.zg_surf)
+        # legacy computes virtual temperature in float32 of inputs, hence small deviations
+        np.testing.assert_allclose(model.z, z_ref, rtol=1e-6, atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
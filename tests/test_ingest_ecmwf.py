@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mwr_l12l2.model.ecmwf.ingest_ecmwf import ingest_forecasts, is_ingested, marker_file
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+model_fc_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_fc_0-20000-0-10393_A_202304250000_converted_to.nc')
+model_zg_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_z_0-20000-0-10393_A.grb')
+
+
+class TestIngestForecasts(unittest.TestCase):
+    def setUp(self):
+        """set up a model dir with two forecasts of the test station in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_dir = os.path.join(self.tmp_dir, 'ecmwf_fc')
+        os.mkdir(self.model_dir)
+        self.files_fc = [shutil.copy(model_fc_file, self.model_dir),
+                         shutil.copy(model_fc_file, os.path.join(
+                             self.model_dir, 'ecmwf_fc_0-20000-0-10393_A_202304251200_converted_to.nc'))]
+        self.file_zg = shutil.copy(model_zg_file, self.model_dir)
+        self.conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        self.conf['data']['model_dir'] = self.model_dir
+        self.conf['data']['model_fc_file_suffix'] = '_converted_to'
+        self.conf['data']['model_fc_file_ext'] = '.nc'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ingest(self):
+        """test that new forecasts are ingested in parallel and only once"""
+        ingested = ingest_forecasts(self.conf, processes=2)
+        self.assertEqual(len(ingested), 2)
+        for product_file, file_fc in zip(sorted(ingested), self.files_fc):
+            self.assertTrue(os.path.exists(marker_file(product_file)))
+            self.assertTrue(is_ingested(product_file, file_fc, self.file_zg))
+        self.assertEqual(ingest_forecasts(self.conf, processes=2), [])
+
+        with self.subTest(operation='replaced forecast'):
+            os.utime(self.files_fc[1], ns=(0, 0))
+            self.assertEqual(len(ingest_forecasts(self.conf, processes=2)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
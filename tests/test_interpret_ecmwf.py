@@ -0,0 +1,62 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from xarray.backends.file_manager import FILE_CACHE
+
+from mwr_l12l2.model.ecmwf.interpret_ecmwf import ModelInterpreter, open_forecast
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+model_fc_grb_file = abs_file_path('mwr_l12l2/data/ecmwf_fc/ecmwf_fc_0-20000-0-10393_A_202304250000.grb')
+model_fc_nc_file = abs_file_path('mwr_l12l2/data/ecmwf_fc/ecmwf_fc_0-20000-0-10393_A_202304250000_converted_to.nc')
+model_zg_file = abs_file_path('mwr_l12l2/data/ecmwf_fc/ecmwf_z_0-20000-0-10393_A.grb')
+
+
+class TestOpenForecast(unittest.TestCase):
+    def setUp(self):
+        """copy the GRIB forecast to a temporary directory to keep the cfgrib index out of the data directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.grb_file = shutil.copy(model_fc_grb_file, self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_grib_same_as_netcdf(self):
+        """test that reading the GRIB from MARS directly gives the same data as the file converted to NetCDF"""
+        with open_forecast(self.grb_file, chunks={'time': 1}) as fc_grb, open_forecast(model_fc_nc_file) as fc_nc:
+            self.assertEqual(fc_grb.t.dims, fc_nc.t.dims)
+            self.assertEqual(fc_grb.lnsp.dims, ('time', 'latitude', 'longitude'))
+            np.testing.assert_array_equal(fc_grb.time.values, fc_nc.time.values)
+            np.testing.assert_array_equal(fc_grb.level.values, fc_nc.level.values)
+            # NetCDF is packed to int16 and unpacked to float32, hence only equal within precision of both
+            for var in ['t', 'q', 'lnsp']:
+                packing_step = np.ptp(fc_nc[var].values) / (2**16 - 2) + np.spacing(np.abs(fc_nc[var].values).max())
+                np.testing.assert_allclose(fc_grb[var].values, fc_nc[var].values, rtol=0, atol=packing_step,
+                                           err_msg=var)
+        self.assertEqual(len(glob.glob(os.path.join(self.tmp_dir, '*.idx'))), 1)  # one index shared by all params
+
+    def test_netcdf_closed(self):
+        """test that closing the forecast opened from NetCDF releases the file handle"""
+        n_open = len(FILE_CACHE)
+        with open_forecast(model_fc_nc_file) as fc:
+            fc.t.isel(time=0).load()
+            self.assertEqual(len(FILE_CACHE), n_open + 1)
+        self.assertEqual(len(FILE_CACHE), n_open)
+
+    def test_interpreter_grib(self):
+        """test that the model interpreter runs on the GRIB file and gives the same profiles as from NetCDF"""
+        time_min = np.datetime64('2023-04-25 13:00:00')
+        with ModelInterpreter(self.grb_file, model_zg_file) as model_grb, \
+                ModelInterpreter(model_fc_nc_file, model_zg_file) as model_nc:
+            model_grb.run(time_min, time_min)
+            model_nc.run(time_min, time_min)
+        np.testing.assert_array_equal(model_grb.time_ref, model_nc.time_ref)
+        np.testing.assert_allclose(model_grb.z_ref, model_nc.z_ref, atol=0.1)
+        np.testing.assert_allclose(model_grb.t_ref, model_nc.t_ref, atol=1e-2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import xarray as xr
+
+from mwr_l12l2.retrieval import l1_buffer
+from mwr_l12l2.retrieval.l1_buffer import L1Buffer
+from mwr_l12l2.retrieval.tropoe_input import MWR_VARS
+from mwr_l12l2.utils.data_utils import get_from_nc_files
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+mwr_files = sorted(glob.glob(os.path.join(abs_file_path('tests/data/mwr/'), 'MWR_1C01_0-20000-0-10393_A*.nc')))
+
+
+class TestL1Buffer(unittest.TestCase):
+    def setUp(self):
+        """copy MWR files to a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = [shutil.copy(file, self.tmp_dir) for file in mwr_files]
+        self.store_dir = os.path.join(self.tmp_dir, 'store', 'l1_buffer')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_served(self, buffer, files, n_read):
+        """check that buffer serves the same data as reading files and that n_read files were read for that"""
+        with mock.patch.object(l1_buffer, 'get_from_nc_files', wraps=get_from_nc_files) as reader:
+            data = buffer.get(files)
+        self.assertEqual(reader.call_count, n_read)
+        xr.testing.assert_identical(data, get_from_nc_files(files, data_vars=MWR_VARS))
+        self.assertEqual(data.time.encoding['units'], 'seconds since 1970-01-01')
+
+    def test_rolling(self):
+        """test that files are only read once, that old files are evicted and that the store is shared"""
+        buffer = L1Buffer(MWR_VARS, self.store_dir)
+        self.assert_served(buffer, self.files[:2], n_read=2)
+        stat_kept = os.stat(buffer.store_file(self.files[1]))
+        self.assert_served(buffer, self.files[1:], n_read=1)
+        self.assertEqual(list(buffer.files), self.files[1:])
+
+        with self.subTest(operation='append to store'):
+            self.assertEqual(sorted(os.listdir(self.store_dir)), [os.path.basename(f) for f in self.files[1:]])
+            stat_now = os.stat(buffer.store_file(self.files[1]))  # data of files kept in buffer are not rewritten
+            self.assertEqual((stat_now.st_ino, stat_now.st_mtime_ns), (stat_kept.st_ino, stat_kept.st_mtime_ns))
+
+        with self.subTest(operation='other process'):
+            self.assert_served(L1Buffer(MWR_VARS, self.store_dir), self.files[1:], n_read=0)
+        with self.subTest(operation='modified file'):
+            os.utime(self.files[2], ns=(0, 0))
+            self.assert_served(buffer, self.files[1:], n_read=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from mwr_l12l2.errors import LeaseError
+from mwr_l12l2.retrieval.instrument_selector import InstrumentSelector
+from mwr_l12l2.retrieval.retrieval_manager import RetrievalManager
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+from mwr_l12l2.utils import lease as lease_module
+from mwr_l12l2.utils.lease import InstrumentLeases, Lease
+
+
+class TestLease(unittest.TestCase):
+    def setUp(self):
+        self.lease_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.lease_dir)
+
+    def test_exclusive(self):
+        """test that a lease can only be held by one owner at a time and is free again after release"""
+        lease_a = Lease(self.lease_dir, 'inst', owner='host_a')
+        lease_b = Lease(self.lease_dir, 'inst', owner='host_b')
+        self.assertTrue(lease_a.acquire())
+        self.assertFalse(lease_b.acquire())
+        self.assertEqual(lease_b.holder(), 'host_a')
+        with self.assertRaises(LeaseError):
+            with lease_b:
+                pass
+        lease_a.release()
+        self.assertIsNone(lease_b.holder())
+        with lease_b:
+            self.assertEqual(lease_a.holder(), 'host_b')
+        self.assertEqual(os.listdir(self.lease_dir), [])
+
+    def test_stale_recovery(self):
+        """test that an expired lease of a crashed owner is taken over and the old owner notices the loss"""
+        lease_a = Lease(self.lease_dir, 'inst', owner='host_a')
+        self.assertTrue(lease_a.acquire())
+        with open(lease_a.file, 'w') as f:  # simulate expiry
+            json.dump({'owner': 'host_a', 'expires': time.time() - 1}, f)
+        lease_b = Lease(self.lease_dir, 'inst', owner='host_b')
+        self.assertTrue(lease_b.acquire())
+        self.assertEqual(lease_b.holder(), 'host_b')
+        with self.assertRaises(LeaseError):
+            lease_a.renew()
+        lease_a.release()  # must not remove the lease of host_b
+        self.assertEqual(lease_b.holder(), 'host_b')
+        self.assertEqual(os.listdir(self.lease_dir), ['inst.lease'])
+
+    def test_recovery_race(self):
+        """test that a fresh lease acquired by another host during recovery of a stale lease is kept"""
+        lease_a = Lease(self.lease_dir, 'inst', owner='host_a')
+        with open(lease_a.file, 'w') as f:
+            json.dump({'owner': 'host_crashed', 'expires': time.time() - 1}, f)
+        rename = os.rename
+
+        def rename_after_takeover(src, dst):
+            """host_b recovers the stale lease and acquires it anew just before host_a renames it"""
+            os.remove(src)
+            self.assertTrue(Lease(self.lease_dir, 'inst', owner='host_b').acquire())
+            rename(src, dst)
+
+        with mock.patch.object(lease_module.os, 'rename', side_effect=rename_after_takeover):
+            self.assertFalse(lease_a.acquire())
+        self.assertEqual(lease_a.holder(), 'host_b')
+        self.assertEqual(os.listdir(self.lease_dir), ['inst.lease'])
+
+    def test_renewal(self):
+        """test that held instrument leases are renewed in the background until released"""
+        host_a = InstrumentLeases(self.lease_dir, ttl=0.3)
+        self.assertTrue(host_a.claim('0-20000-0-10393', 'A'))
+        time.sleep(0.6)
+        self.assertFalse(InstrumentLeases(self.lease_dir).claim('0-20000-0-10393', 'A'))
+        host_a.release_all()
+        self.assertIsNone(host_a._stop_renewal)
+        self.assertEqual(os.listdir(self.lease_dir), [])
+
+    def test_instrument_leases(self):
+        """test claiming and releasing of instruments by two hosts"""
+        host_a = InstrumentLeases(self.lease_dir)
+        host_b = InstrumentLeases(self.lease_dir)
+        self.assertTrue(host_a.claim('0-20000-0-10393', 'A'))
+        self.assertTrue(host_a.claim('0-20000-0-10393', 'A'))  # already held
+        self.assertFalse(host_b.claim('0-20000-0-10393', 'A'))
+        self.assertTrue(host_b.claim('0-20000-0-06610', 'A'))
+        host_a.release_all()
+        self.assertTrue(host_b.claim('0-20000-0-10393', 'A'))
+
+    def test_select_oldest(self):
+        """test that selecting the oldest instrument only leases this one and releases it again"""
+        mwr_dir = os.path.join(self.lease_dir, 'mwr')
+        os.mkdir(mwr_dir)
+        for fn in ['MWR_1C01_0-20000-0-06610_A202304251300.nc', 'MWR_1C01_0-20000-0-06620_A202304251400.nc',
+                   'MWR_1C01_0-20000-0-10393_A202304251500.nc']:
+            with open(os.path.join(mwr_dir, fn), 'w'):
+                pass
+        conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        conf['data']['mwr_dir'] = mwr_dir
+        conf['processing']['lease_dir'] = os.path.join(self.lease_dir, 'leases')
+        self.assertTrue(InstrumentLeases(conf['processing']['lease_dir']).claim('0-20000-0-06610', 'A'))  # other host
+
+        selector = InstrumentSelector(conf)
+        selector.select_oldest()
+        self.assertEqual((selector.wigos, selector.inst_id), ('0-20000-0-06620', 'A'))
+        self.assertEqual(sorted(os.listdir(conf['processing']['lease_dir'])),
+                         ['0-20000-0-06610_A.lease', '0-20000-0-06620_A.lease'])
+        selector.release()
+        self.assertEqual(os.listdir(conf['processing']['lease_dir']), ['0-20000-0-06610_A.lease'])
+
+    def test_manager_no_config(self):
+        """test that the manager does not lease instruments without config file"""
+        conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        conf['processing']['lease_dir'] = os.path.join(self.lease_dir, 'leases')
+        manager = RetrievalManager(conf)
+        manager.wigos_and_inst_id_unique = ['0-20000-0-10393_A', '0-20000-0-99999_Z']  # no config for second
+        manager.mwr_files_dict = {name: [] for name in manager.wigos_and_inst_id_unique}
+        manager.alc_files_dict = {name: [] for name in manager.wigos_and_inst_id_unique}
+        manager.prepare_retrieval_dicts()
+        self.assertEqual(list(manager.retrieval_dict), ['0-20000-0-10393_A'])
+        self.assertEqual(os.listdir(conf['processing']['lease_dir']), ['0-20000-0-10393_A.lease'])
+        manager.release_instruments()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.errors import MWRInputError
+from mwr_l12l2.retrieval.tropoe_input import MWR_VARS
+from mwr_l12l2.utils.data_utils import get_from_nc_files, select_time
+from mwr_l12l2.utils.file_utils import abs_file_path
+from mwr_l12l2.utils.merge_netcdf import merge_nc_files
+
+mwr_files = sorted(glob.glob(os.path.join(abs_file_path('tests/data/mwr/'), 'MWR_1C01_0-20000-0-10393_A*.nc')))
+
+
+class TestMergeNetcdf(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_out = os.path.join(self.tmp_dir, 'merged.nc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_merged(self, files, time_min=np.datetime64('NaT'), time_max=np.datetime64('NaT'), nc_format=None):
+        """check that merging files gives the same data as reading them with get_from_nc_files"""
+        time_latest = merge_nc_files(files, self.file_out, MWR_VARS, time_min, time_max, nc_format=nc_format)
+        expected = get_from_nc_files(files, data_vars=MWR_VARS)
+        self.assertEqual(time_latest, expected.time.max().values)
+        merged = xr.load_dataset(self.file_out)
+        xr.testing.assert_equal(merged, select_time(expected, time_min, time_max))
+        self.assertEqual(merged.attrs, expected.attrs)
+
+    def test_merge(self):
+        """test that the merged file equals the concatenation of the input files"""
+        self.assert_merged(mwr_files)
+        with self.subTest(operation='time limits'):
+            self.assert_merged(mwr_files, np.datetime64('2023-04-25 13:30'), np.datetime64('2023-04-25 15:10'))
+        with self.subTest(operation='overlapping files'):
+            self.assert_merged([mwr_files[0], mwr_files[0], mwr_files[1]])
+        with self.subTest(operation='different time units'):
+            file_other_units = os.path.join(self.tmp_dir, 'other_units.nc')
+            with xr.open_dataset(mwr_files[1]) as data:
+                data.to_netcdf(file_other_units, encoding={'time': {'units': 'minutes since 2023-04-25'}})
+            self.assert_merged([mwr_files[0], file_other_units])
+        with self.subTest(operation='classic format'):
+            self.assert_merged(mwr_files, nc_format='NETCDF3_64BIT')
+        with self.subTest(operation='no input'):
+            with self.assertRaises(MWRInputError):
+                merge_nc_files([], self.file_out)
+
+
+if __name__ == '__main__':
+    unittest.main()
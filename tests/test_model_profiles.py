@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mwr_l12l2.model.ecmwf.interpret_ecmwf import ModelInterpreter
+from mwr_l12l2.model.ecmwf.model_profiles import PROFILE_VARS, ModelProfiles, get_model_profiles, \
+    model_profiles_file
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+model_fc_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_fc_0-20000-0-10393_A_202304250000_converted_to.nc')
+model_zg_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_z_0-20000-0-10393_A.grb')
+
+
+class TestModelProfiles(unittest.TestCase):
+    def setUp(self):
+        """write the model profiles product to a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        self.conf['processing']['model_profiles_dir'] = self.tmp_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_interpreter(self):
+        """test that the time slice of the product matches the result of the model interpreter for this time"""
+        time_min = np.datetime64('2023-04-25 13:00:00')
+        time_max = np.datetime64('2023-04-25 16:00:00')
+        model = ModelInterpreter(model_fc_file, model_zg_file)
+        model.run(time_min, time_max)
+
+        get_model_profiles(self.conf, model_fc_file, model_zg_file)  # compute and write product
+        self.assertTrue(os.path.exists(model_profiles_file(self.conf, model_fc_file)))
+        profiles = get_model_profiles(self.conf, model_fc_file, model_zg_file).select_time(time_min, time_max)
+
+        np.testing.assert_array_equal(profiles.time_ref, model.time_ref)
+        self.assertEqual(profiles.lat_ref, model.lat_ref)
+        self.assertEqual(profiles.lon_ref, model.lon_ref)
+        for var in PROFILE_VARS:
+            np.testing.assert_allclose(getattr(profiles, var), getattr(model, var), rtol=1e-12, err_msg=var)
+
+    def test_pruned_levels(self):
+        """test that loading only the levels up to a height limit gives the same profiles for the remaining levels"""
+        with ModelInterpreter(model_fc_file, model_zg_file) as model:
+            model.run()
+            profiles_all = ModelProfiles.from_interpreter(model)
+        self.assertIsNone(model.fc)  # data released on exit
+
+        with ModelInterpreter(model_fc_file, model_zg_file, z_max=5000) as model:
+            model.run()
+            profiles = ModelProfiles.from_interpreter(model)
+        n_levels = profiles.z_ref.shape[1]
+        self.assertLess(n_levels, profiles_all.z_ref.shape[1])
+        self.assertGreater(profiles.z_ref.min(axis=0).max(), 5000)  # still covering z_max
+        for var in PROFILE_VARS:
+            np.testing.assert_array_equal(getattr(profiles, var), getattr(profiles_all, var)[:, -n_levels:],
+                                          err_msg=var)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mwr_l12l2.utils.publish import DUPLICATE_HARDLINK, DUPLICATE_QUEUED, DUPLICATE_REFLINK, OutputPublisher, \
+    atomic_output
+
+shm_dir = '/dev/shm'  # RAM-backed file system, usually not the one of the temporary directory
+
+
+class TestPublish(unittest.TestCase):
+    def setUp(self):
+        """set up an output file and a destination dir in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dest_dir = os.path.join(self.tmp_dir, 'copy')
+        os.mkdir(self.dest_dir)
+        self.file = os.path.join(self.tmp_dir, 'output.nc')
+        with atomic_output(self.file) as tmp_file:
+            with open(tmp_file, 'w') as f:
+                f.write('dummy output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_atomic_output(self):
+        """test that the output only appears under its name once complete and that failed writes leave nothing"""
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['copy', 'output.nc'])
+        with self.assertRaises(RuntimeError):
+            with atomic_output(self.file) as tmp_file:
+                with open(tmp_file, 'w') as f:
+                    f.write('partial')
+                raise RuntimeError('write failed')
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['copy', 'output.nc'])
+        with open(self.file) as f:
+            self.assertEqual(f.read(), 'dummy output')
+
+    def test_duplicate_same_file_system(self):
+        """test that a file is hardlinked to a destination on the same file system"""
+        publisher = OutputPublisher()
+        self.assertEqual(publisher.duplicate(self.file, self.dest_dir), DUPLICATE_HARDLINK)
+        self.assertTrue(os.path.samefile(self.file, os.path.join(self.dest_dir, 'output.nc')))
+        self.assertEqual(publisher.pending(), 0)
+
+    def test_duplicate_other_file_system(self):
+        """test that a copy to another file system is done in background and completes after removal of the source"""
+        if not os.path.isdir(shm_dir) or os.stat(shm_dir).st_dev == os.stat(self.tmp_dir).st_dev:
+            self.skipTest('no second file system available at {}'.format(shm_dir))
+        dest_dir = tempfile.mkdtemp(dir=shm_dir)
+        try:
+            publisher = OutputPublisher()
+            self.assertIn(publisher.duplicate(self.file, dest_dir), [DUPLICATE_REFLINK, DUPLICATE_QUEUED])
+            os.remove(self.file)
+            publisher.close()
+            self.assertEqual(publisher.pending(), 0)
+            self.assertEqual(os.listdir(dest_dir), ['output.nc'])
+            with open(os.path.join(dest_dir, 'output.nc')) as f:
+                self.assertEqual(f.read(), 'dummy output')
+        finally:
+            shutil.rmtree(dest_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
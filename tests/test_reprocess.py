@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import datetime as dt
+
+from mwr_l12l2.retrieval.retrieval_manager import RetrievalManager, read_progress, split_windows
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+
+class TestReprocess(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        self.conf['data']['mwr_dir'] = abs_file_path('tests/data/mwr/')
+        self.conf['data']['alc_dir'] = abs_file_path('tests/data/alc/')
+        self.conf['data']['output_dir'] = self.tmp_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_split_windows(self):
+        """test that windows have the requested length but never extend across midnight"""
+        windows = split_windows(dt.datetime(2023, 4, 25, 18), dt.datetime(2023, 4, 27, 3), dt.timedelta(hours=12))
+        self.assertEqual(windows, [(dt.datetime(2023, 4, 25, 18), dt.datetime(2023, 4, 26, 0)),
+                                   (dt.datetime(2023, 4, 26, 0), dt.datetime(2023, 4, 26, 12)),
+                                   (dt.datetime(2023, 4, 26, 12), dt.datetime(2023, 4, 27, 0)),
+                                   (dt.datetime(2023, 4, 27, 0), dt.datetime(2023, 4, 27, 3))])
+
+    def test_skip_existing(self):
+        """test that windows with existing output are skipped and recorded in the progress file"""
+        for timestamp in ['202304251330', '202304251430']:
+            with open(os.path.join(self.tmp_dir, 'MWR_2C01_0-20000-0-10393_A{}.nc'.format(timestamp)), 'w'):
+                pass
+        progress_file = os.path.join(self.tmp_dir, 'progress.jsonl')
+        manager = RetrievalManager(self.conf)
+        results = manager.reprocess(dt.datetime(2023, 4, 25, 13), dt.datetime(2023, 4, 25, 15),
+                                    window=dt.timedelta(hours=1), cores=1, progress_file=progress_file)
+        self.assertEqual(results, {})
+        self.assertEqual(read_progress(progress_file),
+                         {'0-20000-0-10393_A_202304251300', '0-20000-0-10393_A_202304251400'})
+
+
+if __name__ == '__main__':
+    unittest.main()
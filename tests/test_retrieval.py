@@ -1,12 +1,16 @@
 import os.path
 import shutil
+import subprocess
 import unittest
+from unittest import mock
 
 import datetime as dt
 import numpy as np
+import xarray as xr
 
-from mwr_l12l2.errors import MWRTestError
+from mwr_l12l2.errors import MWRRetrievalError, MWRTestError, TropoeContainerError
 from mwr_l12l2.retrieval.retrieval import Retrieval
+from mwr_l12l2.retrieval.retrieval_manager import RetrievalManager
 from mwr_l12l2.utils.file_utils import abs_file_path
 
 
@@ -82,6 +86,14 @@ class TestRetrieval(unittest.TestCase):
             """check that MWR and ALC files for TROPoe have been generated"""
             self.assertTrue(os.path.exists(mwr_file_out), msg='expected MWR file for TROPoe run has not been generated')
             self.assertTrue(os.path.exists(alc_file_out), msg='expected ALC file for TROPoe run has not been generated')
+        with self.subTest(operation='check time range and variables'):
+            """check that only files and variables needed are read and that data are limited to the time range"""
+            self.ret.prepare_obs(start_time=np.datetime64('2023-04-25 14:10'),
+                                 end_time=np.datetime64('2023-04-25 14:50'))
+            self.assertGreaterEqual(self.ret.mwr.time.min(), np.datetime64('2023-04-25 14:10'))
+            self.assertLessEqual(self.ret.mwr.time.max(), np.datetime64('2023-04-25 14:50'))
+            self.assertIn('tb', self.ret.mwr)
+            self.assertNotIn('t_rec', self.ret.mwr)
 
     def test_prepare_obs_single_mwr(self):
         """test the preparation of observation files for TROPoe with one single MWR file present"""
@@ -136,6 +148,22 @@ class TestRetrieval(unittest.TestCase):
         with self.subTest(operation='check output files exist'):
             """check that MWR file for TROPoe has been generated"""
             self.assertTrue(os.path.exists(mwr_file_out), msg='expected MWR file for TROPoe run has not been generated')
+        with self.subTest(operation='stream merge'):
+            """check that merging the MWR files directly to the file for TROPoe yields the same input"""
+            mwr_expected = xr.load_dataset(mwr_file_out)
+            self.ret.conf['processing']['l1_stream_merge'] = True
+            self.ret.prepare_obs()
+            xr.testing.assert_equal(xr.load_dataset(mwr_file_out), mwr_expected)
+            self.assertNotIn('tb', self.ret.mwr)
+        with self.subTest(operation='stream merge vip'):
+            """check that the data kept from the stream merge suffice for writing the vip file"""
+            self.ret.vip_file_tropoe = os.path.join(dir_out, 'vip.txt')
+            self.ret.tropoe_output_basename = 'tropoe_test_output'
+            self.ret.met_sfc_offset = 0
+            self.ret.prepare_vip()
+            np.testing.assert_array_equal(self.ret.conf['vip']['mwr_tb_freqs'], mwr_expected.frequency[
+                self.ret.inst_conf['retrieval']['zenith_channels']].values)
+            self.assertTrue(os.path.exists(self.ret.vip_file_tropoe))
 
     def test_prepare_model(self):
         """test the preparation of model data for TROPoe"""
@@ -151,6 +179,8 @@ class TestRetrieval(unittest.TestCase):
 
         self.ret.time_min = model_get_time
         self.ret.time_max = model_get_time
+        self.ret.conf['processing']['model_profiles_dir'] = dir_out
+        self.ret.conf['processing']['model_meta_dir'] = dir_out
 
         with self.subTest(operation='run main'):
             """run prepare_model method"""
@@ -163,6 +193,51 @@ class TestRetrieval(unittest.TestCase):
             self.assertTrue(os.path.exists(model_sfc_file_out),
                             msg='expected moddel surface data file for TROPoe run has not been generated')
 
+    def test_do_retrieval_failure(self):
+        """test that a one-shot TROPoe run exceeding the timeout or exiting with an error is reported as failure"""
+        self.ret.tropoe_dir = dir_out
+        for tropoe_run in [None, subprocess.CompletedProcess([], 1)]:
+            with self.subTest(tropoe_run=tropoe_run), \
+                    mock.patch.object(Retrieval, 'tropoe_job', return_value={}), \
+                    mock.patch('mwr_l12l2.retrieval.retrieval.run_tropoe', return_value=tropoe_run):
+                with self.assertRaises(MWRRetrievalError):
+                    self.ret.do_retrieval()
+
+    def test_do_retrieval_pool_fallback(self):
+        """test that only container failures of the pool fall back to a one-shot run while TROPoe errors are raised"""
+        self.ret.tropoe_dir = dir_out
+        self.ret.tropoe_output_basename = 'tropoe_test_output'
+        self.ret.tropoe_pool = mock.MagicMock()
+        self.ret.tropoe_pool.__contains__.return_value = True
+        with mock.patch.object(Retrieval, 'tropoe_job', return_value={}), \
+                mock.patch('mwr_l12l2.retrieval.retrieval.run_tropoe',
+                           return_value=subprocess.CompletedProcess([], 0)) as one_shot:
+            self.ret.tropoe_pool.run.side_effect = TropoeContainerError('container not running')
+            self.ret.do_retrieval()
+            self.assertEqual(one_shot.call_count, 1)
+            self.ret.tropoe_pool.run.side_effect = MWRRetrievalError('TROPoe exited with code 1')
+            with self.assertRaises(MWRRetrievalError):
+                self.ret.do_retrieval()
+            self.assertEqual(one_shot.call_count, 1)
+
+    def test_parallel_cleanup(self):
+        """test that the worker pool and the TROPoe containers are shut down and the instruments released on failure"""
+        manager = RetrievalManager(self.ret.conf)
+        manager.retrieval_dict = {'0-20000-0-10393_A': {}}
+        with mock.patch.object(RetrievalManager, 'select_all_instruments'), \
+                mock.patch.object(RetrievalManager, 'prepare_retrieval_dicts'), \
+                mock.patch.object(RetrievalManager, 'admit_retrievals'), \
+                mock.patch.object(RetrievalManager, 'stop_tropoe_pool') as stop_pool, \
+                mock.patch.object(RetrievalManager, 'release_instruments') as release, \
+                mock.patch('mwr_l12l2.retrieval.retrieval_manager.mp.Pool') as pool:
+            pool.return_value.apply_async.side_effect = RuntimeError('dispatch failed')
+            with self.assertRaises(RuntimeError):
+                manager.retrieve_all_in_parallel(None, None, use_pool=False)
+        pool.return_value.close.assert_called_once()
+        pool.return_value.join.assert_called_once()
+        stop_pool.assert_called_once()
+        release.assert_called_once()
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
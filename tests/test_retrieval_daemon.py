@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mwr_l12l2.retrieval.retrieval_daemon import RetrievalDaemon
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+
+class TestRetrievalDaemon(unittest.TestCase):
+    def setUp(self):
+        """set up a daemon watching an empty MWR input directory in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        conf['data']['mwr_dir'] = self.tmp_dir
+        conf['processing']['daemon_debounce'] = 5
+        conf['vip']['tres'] = 10
+        self.daemon = RetrievalDaemon(conf, cores=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def add_file(self, timestamp):
+        with open(os.path.join(self.tmp_dir, 'MWR_1C01_0-20000-0-10393_A{}.nc'.format(timestamp)), 'w'):
+            pass
+        self.daemon.manager.select_all_instruments()
+
+    def test_ready_instruments(self):
+        """test the debouncing of arrivals and the trigger on enough new data"""
+        inst = ('0-20000-0-10393', 'A')
+        self.add_file('202304251300')
+        self.assertEqual(self.daemon.ready_instruments(now=0), [])  # just arrived
+        self.assertEqual(self.daemon.ready_instruments(now=10), [])  # not enough data yet
+        self.add_file('202304251305')
+        self.assertEqual(self.daemon.ready_instruments(now=20), [])  # not enough data yet
+        self.add_file('202304251310')
+        self.assertEqual(self.daemon.ready_instruments(now=21), [])  # debouncing
+        self.assertEqual(self.daemon.ready_instruments(now=30), [inst])
+
+    def test_ready_after_waiting(self):
+        """test that a single file is processed after having waited for vip.tres minutes"""
+        self.add_file('202304251300')
+        self.assertEqual(self.daemon.ready_instruments(now=0), [])
+        self.assertEqual(self.daemon.ready_instruments(now=600), [('0-20000-0-10393', 'A')])
+
+
+if __name__ == '__main__':
+    unittest.main()
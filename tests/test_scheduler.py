@@ -0,0 +1,91 @@
+import heapq
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.retrieval import scheduler as scheduler_module
+from mwr_l12l2.retrieval.retrieval import Retrieval
+from mwr_l12l2.retrieval.scheduler import OUTCOME_DEFERRED, OUTCOME_DONE, RetrievalJob, RetrievalScheduler, \
+    job_slack, run_job
+from mwr_l12l2.utils.config_utils import get_inst_config, get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+
+def make_selected(wigos, inst_id, timestamps, latency_sla=None):
+    """generate a minimal instrument dictionary with MWR files carrying the given timestamps"""
+    inst_conf = {}
+    if latency_sla is not None:
+        inst_conf['latency_sla'] = latency_sla
+    return {'wigos': wigos, 'inst_id': inst_id, 'inst_conf': inst_conf, 'alc_files': [],
+            'mwr_files': ['MWR_1C01_{}_{}{}.nc'.format(wigos, inst_id, ts) for ts in timestamps]}
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        self.now = np.datetime64('2023-04-25 16:00')
+
+    def test_job_slack(self):
+        """test that older data and tighter SLAs lead to smaller slack"""
+        recent = make_selected('0-20000-0-10393', 'A', ['202304251500'])
+        backlog = make_selected('0-20000-0-06610', 'A', ['202304251200', '202304251500'])
+        tight_sla = make_selected('0-20000-0-06620', 'A', ['202304251500'], latency_sla=10)
+        self.assertEqual(job_slack(recent, self.conf, self.now), 0.)  # 60 min SLA, 60 min old
+        self.assertLess(job_slack(backlog, self.conf, self.now), job_slack(recent, self.conf, self.now))
+        self.assertLess(job_slack(tight_sla, self.conf, self.now), job_slack(recent, self.conf, self.now))
+
+    def test_priority_order(self):
+        """test that jobs leave the queue with the most urgent first"""
+        scheduler = RetrievalScheduler(self.conf, cores=1)
+        for slack in [30., -10., 5.]:
+            scheduler.submit(RetrievalJob({}, None, None, slack))
+        self.assertEqual([heapq.heappop(scheduler.queue).slack for _ in range(3)], [-10., 5., 30.])
+
+    def test_deferral(self):
+        """test that jobs not started before the deadline are deferred"""
+        selected = make_selected('0-20000-0-10393', 'A', ['202304251500'])
+        with RetrievalScheduler(self.conf, cores=1) as scheduler:
+            scheduler.submit(RetrievalJob(selected, None, None, 0., deadline=time.time() - 1))
+            results = scheduler.run_cycle()
+        self.assertEqual(results['0-20000-0-10393_A'][0], OUTCOME_DEFERRED)
+
+    def test_conf_isolation(self):
+        """test that vip edits of one job do not leak into the next job run by the same worker"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        inst_conf_scan = get_inst_config(abs_file_path('mwr_l12l2/config/config_0-20000-0-10393_A.yaml'))
+        inst_conf_no_scan = dict(inst_conf_scan, retrieval=dict(
+            inst_conf_scan['retrieval'], scan_channels=np.zeros_like(inst_conf_scan['retrieval']['scan_channels'])))
+        n_freq = len(inst_conf_scan['retrieval']['zenith_channels'])
+
+        def prepare_vip_only(ret, start_time=None, end_time=None):
+            """stand-in for the retrieval chain only writing the vip file"""
+            ret.mwr = xr.Dataset(coords={'frequency': np.linspace(22., 58., n_freq)})
+            ret.sfc_temp_obs_exists = ret.sfc_rh_obs_exists = ret.sfc_p_obs_exists = False
+            ret.tropoe_dir_mountpoint = '/data'
+            ret.vip_file_tropoe = os.path.join(tmp_dir, 'vip_{}.txt'.format(ret.inst_id))
+            ret.prepare_vip()
+
+        vip_files = []
+        with mock.patch.object(scheduler_module, '_worker_conf', self.conf), \
+                mock.patch.object(scheduler_module, '_worker_node', 0), \
+                mock.patch.object(Retrieval, 'run', prepare_vip_only):
+            for inst_id, inst_conf in [('A', inst_conf_scan), ('B', inst_conf_no_scan)]:
+                selected = dict(make_selected('0-20000-0-10393', inst_id, ['202304251500']), inst_conf=inst_conf)
+                self.assertEqual(run_job(RetrievalJob(selected, None, None, 0.))[1], OUTCOME_DONE)
+                with open(os.path.join(tmp_dir, 'vip_{}.txt'.format(inst_id))) as f:
+                    vip_files.append(f.read())
+        self.assertNotEqual(vip_files[0], vip_files[1])
+        self.assertIn('mwrscan_type', vip_files[0])
+        self.assertNotIn('mwrscan_type', vip_files[1])
+        self.assertNotIn('mwrscan_type', self.conf['vip'])
+
+
+if __name__ == '__main__':
+    unittest.main()
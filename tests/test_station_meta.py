@@ -0,0 +1,64 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from mwr_l12l2.model.ecmwf import station_meta
+from mwr_l12l2.model.ecmwf.station_meta import StationMeta, get_station_meta
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+model_zg_file = abs_file_path('tests/data/ecmwf_fc/ecmwf_z_0-20000-0-10393_A.grb')
+model_level_file = abs_file_path('mwr_l12l2/model/ecmwf/ecmwf_model_levels_137.csv')
+
+
+class TestStationMeta(unittest.TestCase):
+    def setUp(self):
+        """copy z file to a temporary directory and start with an empty in-memory cache"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.meta_dir = os.path.join(self.tmp_dir, 'meta')
+        self.file_zg = shutil.copy(model_zg_file, self.tmp_dir)
+        station_meta._loaded.clear()
+
+    def tearDown(self):
+        station_meta._loaded.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache(self):
+        """test that the cached metadata equal the source files and that the cache is shared and renewed"""
+        meta = get_station_meta(self.file_zg, model_level_file, self.meta_dir)
+        with xr.open_dataset(model_zg_file, engine='cfgrib', backend_kwargs={'indexpath': ''}) as ds:
+            np.testing.assert_array_equal(meta.zg_surf, ds.z.values)
+        pd.testing.assert_frame_equal(meta.level_coeffs, pd.read_csv(model_level_file), check_dtype=False)
+        self.assertFalse(meta.zg_surf.flags.writeable)
+        self.assertEqual(glob.glob(os.path.join(self.tmp_dir, '*.idx')), [])  # no cfgrib index written
+        self.assertIs(get_station_meta(self.file_zg, model_level_file, self.meta_dir), meta)
+
+        cache_files = glob.glob(os.path.join(self.meta_dir, '*.npz'))
+        self.assertEqual(len(cache_files), 1)
+        np.testing.assert_array_equal(StationMeta.from_file(cache_files[0]).zg_surf, meta.zg_surf)
+
+        with self.subTest(operation='other process'):
+            station_meta._loaded.clear()
+            # source must not be read again if cached on disk, hence overwrite it keeping size and modification time
+            stat = os.stat(self.file_zg)
+            with open(self.file_zg, 'wb') as f:
+                f.write(bytes(stat.st_size))
+            os.utime(self.file_zg, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            np.testing.assert_array_equal(get_station_meta(self.file_zg, model_level_file, self.meta_dir).zg_surf,
+                                          meta.zg_surf)
+
+        with self.subTest(operation='replaced z file'):
+            shutil.copy(model_zg_file, self.file_zg)
+            self.assertIsNot(get_station_meta(self.file_zg, model_level_file, self.meta_dir), meta)
+            new_cache_files = glob.glob(os.path.join(self.meta_dir, '*.npz'))
+            self.assertEqual(len(new_cache_files), 1)
+            self.assertNotEqual(new_cache_files, cache_files)
+
+
+if __name__ == '__main__':
+    unittest.main()
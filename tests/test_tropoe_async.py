@@ -0,0 +1,41 @@
+import asyncio
+import sys
+import unittest
+
+from mwr_l12l2.retrieval.tropoe_async import AsyncTropoeExecutor
+
+
+class TestAsyncTropoeExecutor(unittest.TestCase):
+    """test the command execution of the asyncio executor using simple python calls instead of podman"""
+
+    def test_run_cmd(self):
+        """test that output is streamed to the logger and the exit status is reported"""
+        executor = AsyncTropoeExecutor(max_containers=1, timeout=30)
+        cmd = [sys.executable, '-c', "print('line 1'); print('line 2')"]
+        with self.assertLogs('mwr_l12l2', level='INFO') as logs:
+            status = asyncio.run(executor._run_cmd(cmd, 'dummy'))
+        self.assertTrue(status.ok)
+        self.assertFalse(status.timed_out)
+        self.assertTrue(any('[dummy] line 1' in msg for msg in logs.output))
+        self.assertTrue(any('[dummy] line 2' in msg for msg in logs.output))
+
+    def test_run_cmd_error(self):
+        """test that a non-zero exit code is reported"""
+        executor = AsyncTropoeExecutor(max_containers=1, timeout=30)
+        cmd = [sys.executable, '-c', 'import sys; sys.exit(3)']
+        status = asyncio.run(executor._run_cmd(cmd, 'dummy'))
+        self.assertFalse(status.ok)
+        self.assertEqual(status.returncode, 3)
+
+    def test_run_cmd_timeout(self):
+        """test that a command exceeding the timeout is killed"""
+        executor = AsyncTropoeExecutor(max_containers=1, timeout=0.5)
+        cmd = [sys.executable, '-c', 'import time; time.sleep(30)']
+        status = asyncio.run(executor._run_cmd(cmd, 'dummy'))
+        self.assertTrue(status.timed_out)
+        self.assertFalse(status.ok)
+        self.assertLess(status.duration, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.errors import MWRRetrievalError
+from mwr_l12l2.retrieval.tropoe_helpers import extract_state, height_to_altitude, state_vector_slices
+from mwr_l12l2.utils.config_utils import get_conf
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+n_time = 4
+n_height = 6
+arb = np.array([1]*n_height + [2]*n_height + [3, 4, 5, 6] + [7]*3 + [8]*3 + [9]*3)
+
+
+def tropoe_output():
+    """generate a minimal TROPoe output with the state vector variables and random values"""
+    rng = np.random.default_rng(0)
+    return xr.Dataset(
+        {'Xa': ('arb_dim1', rng.random(arb.size)),
+         'arb1': ('arb_dim1', arb),
+         'arb2': ('arb_dim2', arb),
+         'Akernal_no_model': (('time', 'arb_dim1', 'arb_dim2'), rng.random((n_time, arb.size, arb.size))),
+         'temperature': (('time', 'height'), rng.random((n_time, n_height)), {'units': 'C'}),
+         'waterVapor': (('time', 'height'), rng.random((n_time, n_height)), {'units': 'g/kg'}),
+         'lwp': ('time', rng.random(n_time), {'units': 'g/m2'}),
+         'co2': (('time', 'gas_dim'), rng.random((n_time, 3)), {'units': 'ppm'})},
+        coords={'time': np.arange(n_time), 'height': np.linspace(0, 1, n_height)})
+
+
+class TestTropoeHelpers(unittest.TestCase):
+    def setUp(self):
+        """write a TROPoe output to read it lazily like in the post-processing"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmp_dir, 'tropoe_out.nc')
+        tropoe_output().to_netcdf(self.file)
+        self.data = xr.open_dataset(self.file)
+        self.conf = get_conf(abs_file_path('mwr_l12l2/config/tropoe_output_config.yaml'))
+        self.conf['extract_quantities'] = self.conf['extract_quantities'] + ['co2']
+
+    def tearDown(self):
+        self.data.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_prior(self):
+        """test that the priors equal the elements of Xa of each quantity and get the dims of the quantity"""
+        data = extract_state(self.data, self.conf, 'prior')
+        for quantity, dims in [('temperature', ('height',)), ('waterVapor', ('height',)), ('lwp', ()),
+                               ('co2', ('gas_dim',))]:
+            with self.subTest(quantity=quantity):
+                prior = data['{}_prior'.format(quantity)]
+                self.assertEqual(prior.dims, dims)
+                np.testing.assert_array_equal(prior.values.ravel(),
+                                              self.data.Xa.values[arb == self.conf[quantity]])
+                self.assertEqual(prior.units, self.data[quantity].units)
+
+    def test_avk(self):
+        """test that the averaging kernels equal the blocks of Akernal_no_model of each quantity"""
+        data = height_to_altitude(self.data, 100.)
+        data = extract_state(data, self.conf, 'avk')
+        akernal = self.data.Akernal_no_model.values
+        for quantity, dims in [('temperature', ('time', 'altitude', 'avk_altitude')), ('lwp', ('time',)),
+                               ('co2', ('time', 'gas_dim', 'avk_gas_dim'))]:
+            with self.subTest(quantity=quantity):
+                avk = data['{}_avk'.format(quantity)]
+                self.assertEqual(avk.dims, dims)
+                ind = arb == self.conf[quantity]
+                np.testing.assert_array_equal(avk.values.reshape(n_time, ind.sum(), ind.sum()),
+                                              akernal[:, ind][:, :, ind])
+        np.testing.assert_array_equal(data.temperature_avk.avk_altitude, data.altitude)
+
+    def test_non_contiguous(self):
+        """test that an error is raised if the elements of a quantity are not adjacent in the state vector"""
+        self.assertEqual(state_vector_slices([1, 1, 2, 3, 3]), {1: slice(0, 2), 2: slice(2, 3), 3: slice(3, 5)})
+        with self.assertRaises(MWRRetrievalError):
+            state_vector_slices([1, 1, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from mwr_l12l2.errors import MWRConfigError
+from mwr_l12l2.retrieval.tropoe_input import MWR_VARS, TROPOE_INPUT_FORMATS, get_tropoe_input_format, \
+    write_tropoe_input
+from mwr_l12l2.utils.data_utils import get_from_nc_files
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+mwr_files = sorted(glob.glob(os.path.join(abs_file_path('tests/data/mwr/'), 'MWR_1C01_0-20000-0-10393_A*.nc')))
+
+
+class TestTropoeInput(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmp_dir, 'mwr.nc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write(self):
+        """test that only the selected variables are written uncompressed and unchanged in all formats"""
+        data = get_from_nc_files(mwr_files)
+        for nc_format in TROPOE_INPUT_FORMATS.values():
+            with self.subTest(nc_format=nc_format):
+                write_tropoe_input(data, self.file, MWR_VARS, nc_format)
+                with netCDF4.Dataset(self.file) as nc:
+                    self.assertTrue(nc.data_model.startswith(nc_format))
+                    self.assertNotIn('t_rec', nc.variables)
+                    self.assertEqual(nc['time'].units, 'seconds since 1970-01-01')
+                    if nc_format.startswith('NETCDF4'):
+                        self.assertEqual(nc['tb'].chunking(), 'contiguous')
+                        self.assertFalse(nc['tb'].filters()['zlib'])
+                written = xr.load_dataset(self.file)
+                xr.testing.assert_equal(written, data[[var for var in MWR_VARS if var in data]])
+
+    def test_model_input(self):
+        """test that model inputs with a scalar base time can also be written in the classic format"""
+        data = xr.Dataset({'base_time': ((), np.datetime64('1970-01-01', 'ns')),
+                           'time_offset': ('time', np.array(['2023-04-25T13:00', '2023-04-25T14:00'],
+                                                            dtype='datetime64[ns]'))})
+        write_tropoe_input(data, self.file, nc_format=TROPOE_INPUT_FORMATS['netcdf3'])
+        xr.testing.assert_identical(xr.load_dataset(self.file), data)
+
+    def test_format_config(self):
+        """test the selection of the format in the processing section of the retrieval config"""
+        self.assertEqual(get_tropoe_input_format({'processing': {'tropoe_input_format': 'netcdf3'}}), 'NETCDF3_64BIT')
+        self.assertEqual(get_tropoe_input_format({'processing': {}}), 'NETCDF4')
+        with self.assertRaises(MWRConfigError):
+            get_tropoe_input_format({'processing': {'tropoe_input_format': 'zarr'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import datetime as dt
+
+from mwr_l12l2.errors import MWRRetrievalError, TropoeContainerError
+from mwr_l12l2.retrieval.tropoe_pool import TropoeContainer, TropoePool, get_image_cmd
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+tropoe_cmd = ['/bin/bash', '/opt/tropoe/run.sh']
+job = dict(date=dt.datetime(2023, 4, 25), start_hour=13, end_hour=14, vip_file='vip.txt',
+           apriori_file='prior.MIDLAT.nc')
+
+
+class FakePodman(object):
+    """stand-in for :func:`subprocess.run` emulating the podman calls of the TROPoe containers
+
+    Args:
+        start_returncode (optional): exit code of 'podman run' starting a container
+        exec_returncode (optional): exit code of TROPoe run through 'podman exec'
+        exec_stops_container (optional): whether the container is gone after the TROPoe run
+        exec_hangs (optional): whether the TROPoe run exceeds the timeout
+        image_conf (optional): config of the TROPoe image as returned by 'podman image inspect'
+    """
+
+    def __init__(self, start_returncode=0, exec_returncode=0, exec_stops_container=False, exec_hangs=False,
+                 image_conf=None):
+        self.start_returncode = start_returncode
+        self.exec_returncode = exec_returncode
+        self.exec_stops_container = exec_stops_container
+        self.exec_hangs = exec_hangs
+        self.image_conf = image_conf if image_conf is not None else {'Entrypoint': tropoe_cmd[:1],
+                                                                     'Cmd': tropoe_cmd[1:]}
+        self.running = set()  # names of the running containers
+        self.calls = []  # podman subcommands in the order of their calls
+
+    def __call__(self, cmd, timeout=None, **kwargs):
+        subcmd = cmd[1] if cmd[1] not in ['container', 'image'] else ' '.join(cmd[1:3])
+        self.calls.append(subcmd)
+        if subcmd == 'container inspect':
+            running = cmd[-1] in self.running
+            return subprocess.CompletedProcess(cmd, 0, stdout=b'true\n' if running else b'false\n')
+        if subcmd == 'rm':
+            self.running.discard(cmd[-1])
+            return subprocess.CompletedProcess(cmd, 0)
+        if subcmd == 'run':
+            if self.start_returncode == 0:
+                self.running.add(cmd[cmd.index('--name') + 1])
+            return subprocess.CompletedProcess(cmd, self.start_returncode, stdout=b'')
+        if subcmd == 'exec':
+            name = cmd[-len(tropoe_cmd) - 1]
+            if self.exec_hangs:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if self.exec_stops_container:
+                self.running.discard(name)
+            return subprocess.CompletedProcess(cmd, self.exec_returncode, stdout=b'TROPoe output')
+        if subcmd == 'image inspect':
+            return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps(self.image_conf).encode('utf-8'))
+        raise ValueError('unexpected podman call {}'.format(cmd))
+
+
+class TestTropoePool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.container = TropoeContainer('tropoe_test', os.path.join(self.tmp_dir, 'node_10'), tropoe_cmd=tropoe_cmd,
+                                         timeout=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_container(self, podman):
+        """run a TROPoe job in the test container with the podman calls answered by :obj:`podman`"""
+        with mock.patch('mwr_l12l2.retrieval.tropoe_pool.subprocess.run', podman):
+            self.container.run(**job)
+
+    def test_exec_cmd(self):
+        """test that the TROPoe run is executed in the container with the paths mapped to the mountpoint"""
+        cmd = self.container.exec_cmd(**dict(job, vip_file=os.path.join(self.tmp_dir, 'node_10', 'vip.txt')))
+        self.assertEqual(cmd, ['podman', 'exec', '-i', '-u', 'root', '-e', 'yyyymmdd=20230425', '-e', 'shour=13',
+                               '-e', 'ehour=14', '-e', 'vfile=/data/vip.txt', '-e', 'pfile=prior.MIDLAT.nc',
+                               '-e', 'verbose=1', 'tropoe_test'] + tropoe_cmd)
+
+    def test_get_image_cmd(self):
+        """test that the TROPoe command is inferred from entrypoint and cmd of the image"""
+        with mock.patch('mwr_l12l2.retrieval.tropoe_pool.subprocess.run', FakePodman()):
+            self.assertEqual(get_image_cmd('tropoe'), tropoe_cmd)
+        with mock.patch('mwr_l12l2.retrieval.tropoe_pool.subprocess.run', FakePodman(image_conf={'Cmd': None})):
+            with self.assertRaises(MWRRetrievalError):
+                get_image_cmd('tropoe')
+
+    def test_restart(self):
+        """test that a container which is not running is restarted before the TROPoe run"""
+        podman = FakePodman()
+        self.run_container(podman)
+        self.assertEqual(podman.calls, ['container inspect', 'rm', 'run', 'exec'])
+        podman.calls = []
+        self.run_container(podman)
+        self.assertEqual(podman.calls, ['container inspect', 'exec'])
+
+    def test_errors(self):
+        """test that only failures of the container raise TropoeContainerError, which triggers the fallback"""
+        with self.subTest(failure='TROPoe exit code'):
+            with self.assertRaises(MWRRetrievalError) as context:
+                self.run_container(FakePodman(exec_returncode=1))
+            self.assertNotIsInstance(context.exception, TropoeContainerError)
+        with self.subTest(failure='container stopped during run'):
+            podman = FakePodman(exec_returncode=137, exec_stops_container=True)
+            with self.assertRaises(TropoeContainerError):
+                self.run_container(podman)
+            self.assertEqual(podman.calls[-2:], ['rm', 'run'])  # replaced for the next run
+        with self.subTest(failure='container cannot be started'):
+            with self.assertRaises(TropoeContainerError):
+                self.run_container(FakePodman(start_returncode=125))
+        with self.subTest(failure='timeout'):
+            podman = FakePodman(exec_hangs=True)
+            with self.assertRaises(TropoeContainerError):
+                self.run_container(podman)
+            self.assertEqual(podman.calls[-2:], ['rm', 'run'])
+
+    def test_pool(self):
+        """test that the pool sets up one container per node and only restarts the containers not running"""
+        conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        conf['data']['tropoe_basedir'] = self.tmp_dir
+        pool = TropoePool(conf, [10, 20], tropoe_img='tropoe')
+        self.assertEqual(pool.nodes, [10, 20])
+        self.assertIn(10, pool)
+        self.assertEqual(pool.containers[10].timeout, conf['processing']['tropoe_timeout'])
+
+        podman = FakePodman()
+        with mock.patch('mwr_l12l2.retrieval.tropoe_pool.subprocess.run', podman):
+            pool.start()
+            self.assertEqual(podman.calls.count('image inspect'), 1)
+            podman.running.discard(pool.containers[20].name)
+            podman.calls = []
+            pool.check_health()
+            self.assertEqual(podman.calls, ['container inspect', 'container inspect', 'rm', 'run'])
+            self.assertEqual(podman.running, {pool.containers[10].name, pool.containers[20].name})
+
+            podman.running.clear()
+            podman.start_returncode = 125
+            pool.check_health()  # must not raise if a container cannot be restarted
+
+
+if __name__ == '__main__':
+    unittest.main()
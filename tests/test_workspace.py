@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mwr_l12l2.errors import MWRRetrievalError
+from mwr_l12l2.retrieval.workspace import WorkspaceManager
+from mwr_l12l2.utils.config_utils import get_retrieval_config
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+
+class TestWorkspaceManager(unittest.TestCase):
+    def setUp(self):
+        """set up a ram dir and a prior dir in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.prior_dir = os.path.join(self.tmp_dir, 'priors')
+        os.mkdir(self.prior_dir)
+        with open(os.path.join(self.prior_dir, 'prior.TEST.nc'), 'w') as f:
+            f.write('dummy prior')
+        self.conf = get_retrieval_config(abs_file_path('mwr_l12l2/config/retrieval_config.yaml'))
+        self.conf['processing']['tropoe_ramdir'] = os.path.join(self.tmp_dir, 'ram')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lease_and_release(self):
+        """test that released workspaces are cleaned except for their static area and can be leased again"""
+        with WorkspaceManager(self.conf, [1], prior_dir=self.prior_dir) as workspaces:
+            workspace = workspaces.lease()
+            self.assertTrue(workspace.path.startswith(os.path.join(self.tmp_dir, 'ram')))
+            self.assertIsNotNone(workspace.static_file('prior.TEST.nc'))
+            self.assertIsNone(workspace.static_file('prior.MISSING.nc'))
+            with open(os.path.join(workspace.path, 'mwr.nc'), 'w') as f:
+                f.write('dummy input')
+            with self.assertRaises(MWRRetrievalError):
+                workspaces.lease(timeout=0.1)  # only workspace is leased
+            workspaces.release(workspace)
+
+            workspace = workspaces.lease(timeout=10)
+            self.assertEqual(os.listdir(workspace.path), ['static'])
+            self.assertIsNotNone(workspace.static_file('prior.TEST.nc'))
+            workspaces.release(workspace)
+
+
+if __name__ == '__main__':
+    unittest.main()
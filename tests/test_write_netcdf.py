@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from mwr_l12l2.errors import OutputDimensionError
+from mwr_l12l2.write_netcdf import ENC_NO_FILLVALUE, Writer, WritePlan, get_write_plan
+from mwr_l12l2.utils.file_utils import abs_file_path
+
+conf_nc = {
+    'dimensions': {'unlimited': ['time'], 'fixed': ['altitude', 'bnds']},
+    'variables': {
+        'time': {'name': 'time', 'dim': ['time'], 'type': 'f8', '_FillValue': None, 'optional': False,
+                 'attributes': {'units': 'seconds since 1970-01-01 00:00:00', 'calendar': 'standard'}},
+        'altitude': {'name': 'altitude', 'dim': ['altitude'], 'type': 'f4', '_FillValue': -999., 'optional': False,
+                     'attributes': {'units': 'm'}},
+        'bnds': {'name': 'bnds', 'dim': ['bnds'], 'type': 'i4', '_FillValue': None, 'optional': True,
+                 'attributes': {}},
+        'temperature': {'name': 'temp', 'dim': ['time', 'altitude'], 'type': 'f4', '_FillValue': -999.,
+                        'optional': False, 'zlib': True, 'complevel': 4, 'chunksizes': [10, 5],
+                        'attributes': {'units': 'K'}},
+        'pwv': {'name': 'iwv', 'dim': ['time'], 'type': 'f4', '_FillValue': -999., 'optional': True,
+                'attributes': {'units': 'kg m-2'}},
+        'flag': {'name': 'quality_flag', 'dim': ['time', 'bnds'], 'type': 'i2', '_FillValue': -99,
+                 'optional': False, 'attributes': {'flag_values': [0, 1]}},
+    },
+    'attributes': {},
+}
+
+
+def get_data():
+    """get dataset for conf_nc with missing values, an absent optional variable and undesired contents"""
+    temperature = np.array([[280., np.nan], [281., 271.], [282., 272.]])
+    return xr.Dataset({'temperature': (('altitude', 'time'), temperature.T),
+                       'flag': ('time', np.array([0, 1, 0], dtype=np.int16)),
+                       'extra': (('time', 'extra_dim'), np.zeros((3, 4)))},
+                      coords={'time': pd.date_range('2023-04-25', periods=3, freq='10min').values,
+                              'altitude': [100., 200.], 'bnds': [0]})
+
+
+class TestWritePlan(unittest.TestCase):
+    def test_apply(self):
+        """test that the plan prepares the dataset according to the format definition"""
+        plan = WritePlan(conf_nc)
+        data = plan.apply(get_data())
+
+        self.assertEqual(set(data.variables), {'time', 'altitude', 'bnds', 'temp', 'iwv', 'quality_flag'})
+        self.assertNotIn('extra_dim', data.dims)
+        self.assertEqual(data.encoding['unlimited_dims'], ['time'])
+        self.assertEqual(data.temp.transpose('time', 'altitude').values[0, 1], -999.)
+        np.testing.assert_array_equal(data.iwv.values, -999.)  # absent optional variable
+        self.assertEqual(data.quality_flag.dims, ('time', 'bnds'))  # expanded by scalar dim
+        self.assertEqual(data.quality_flag.attrs['flag_values'].dtype, np.int16)
+        self.assertEqual(data.temp.encoding['dtype'], 'f4')
+        self.assertEqual(data.temp.encoding['_FillValue'], -999.)
+        self.assertIs(data.altitude.encoding['_FillValue'], ENC_NO_FILLVALUE)  # no fill value for dimensions
+        self.assertTrue(data.temp.encoding['zlib'])
+        self.assertEqual(data.temp.encoding['chunksizes'], (2, 10))  # in order of dims, limited to size of altitude
+        self.assertNotIn('zlib', data.iwv.encoding)
+        self.assertEqual(data.time.encoding['calendar'], 'standard')
+        self.assertNotIn('units', data.time.attrs)
+
+        with self.subTest(operation='reuse plan'):
+            np.testing.assert_array_equal(plan.apply(get_data()).temp.values, data.temp.values)
+        with self.subTest(operation='missing mandatory variable'):
+            with self.assertRaises(KeyError):
+                plan.apply(get_data().drop_vars('temperature'))
+        with self.subTest(operation='wrong dimensions'):
+            data_wrong = get_data()
+            data_wrong['pwv'] = ('altitude', [1., 2.])
+            with self.assertRaises(OutputDimensionError):
+                plan.apply(data_wrong)
+
+    def test_write_compressed(self):
+        """test that the compression and chunking settings are applied when writing to file"""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'l2.nc')
+            data = get_data()
+            data.attrs['history'] = ''
+            Writer(data, filename, conf_nc).run()
+            with netCDF4.Dataset(filename) as nc:
+                self.assertTrue(nc['temp'].filters()['zlib'])
+                self.assertEqual(nc['temp'].chunking(), [2, 10])
+                self.assertEqual(nc['iwv'].filters()['zlib'], False)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_l2_format(self):
+        """test that the L2 format definition of the repo compiles to a plan"""
+        file = abs_file_path('mwr_l12l2/config/L2_format.yaml')
+        plan = get_write_plan(file)
+        self.assertEqual(plan.rename_map['pwv'], 'iwv')
+        self.assertIn('time', plan.time_vars)
+
+
+if __name__ == '__main__':
+    unittest.main()